@@ -0,0 +1,4 @@
+'''
+Micro-benchmarks for the per-request instrumentation path. Each module can be
+run on its own, f. ex. `python -m benchmarks.handler_resolution`.
+'''
@@ -0,0 +1,93 @@
+'''
+Memory allocated per request by the instrumentation, measured with tracemalloc.
+
+`peak` is the high-water mark of memory allocated during a request, which
+includes short-lived copies, and `retained` is what's still allocated for each
+event after the request when the outlet holds on to the events.
+'''
+import logging
+import tracemalloc
+
+from flask import Flask
+
+from flask_events import Events
+
+
+class RetainingOutlet:
+    def __init__(self):
+        self.events = []
+
+
+    def handle(self, event_data):
+        self.events.append(event_data)
+
+
+def create_app():
+    app = Flask('bench_app')
+    events = Events(app)
+    events.add_all('release_version', 'v123')
+    logging.getLogger('bench_app.canonical').disabled = True
+
+    @app.route('/')
+    def index(): # pylint: disable=unused-variable
+        for index in range(5):
+            events.add('extra_%d' % index, index)
+        events.add('render_time', 0.001, unit='seconds')
+        return 'ok'
+
+    return app, events
+
+
+def run_request(app):
+    with app.test_request_context('/'):
+        response = app.full_dispatch_request()
+        response.close()
+
+
+def reset_peak():
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        # Python < 3.9, clearing the traces resets the peak too
+        tracemalloc.clear_traces()
+
+
+def main(requests=1000):
+    app, events = create_app()
+    outlet = RetainingOutlet()
+    events.outlets.append(outlet)
+
+    # Warm up caches so they're not counted
+    for _ in range(10):
+        run_request(app)
+    outlet.events.clear()
+
+    tracemalloc.start()
+    peak_total = 0
+    for _ in range(requests):
+        reset_peak()
+        start_size = tracemalloc.get_traced_memory()[0]
+        run_request(app)
+        peak_total += tracemalloc.get_traced_memory()[1] - start_size
+
+    # Resetting the peak might have cleared the traces, so what's retained is
+    # measured over requests of its own
+    outlet.events.clear()
+    tracemalloc.clear_traces()
+    for _ in range(requests):
+        run_request(app)
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(True, '*/flask_events/*'),
+    ])
+    tracemalloc.stop()
+
+    retained = snapshot.statistics('filename')
+    retained_bytes = sum(stat.size for stat in retained)
+    retained_blocks = sum(stat.count for stat in retained)
+    print('peak %6.0f bytes/request, retained %5.0f bytes/event in %4.1f blocks/event' % (
+        peak_total / requests, retained_bytes / requests, retained_blocks / requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Event throughput with outlets that spend time waiting on I/O, for requests
+handled concurrently by a pool of threads. Compares calling the outlets
+inline, the thread dispatcher and the asyncio dispatcher.
+'''
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.test import EnvironBuilder
+
+from flask_events import Events
+
+from .drop_path import create_app, start_response
+
+IO_LATENCY = 0.005
+
+
+class SyncOutlet:
+    def handle(self, event_data): # pylint: disable=unused-argument
+        time.sleep(IO_LATENCY)
+
+
+    def handle_batch(self, events): # pylint: disable=unused-argument
+        time.sleep(IO_LATENCY)
+
+
+class AsyncOutlet:
+    async def handle_batch(self, events): # pylint: disable=unused-argument
+        await asyncio.sleep(IO_LATENCY)
+
+
+def measure(events_config, outlets, requests=2000, concurrency=16):
+    app = create_app()
+    app.config.update(events_config, EVENTS_DISPATCHER_FLUSH_INTERVAL=0.01)
+    events = Events(app)
+    events.outlets = outlets
+
+    environ = EnvironBuilder(path='/items/123').get_environ()
+
+    def run(_):
+        response = app.wsgi_app(environ.copy(), start_response)
+        for _ in response:
+            pass
+        response.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(run, range(requests)))
+    if events.dispatcher is not None:
+        events.dispatcher.close()
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    scenarios = (
+        ('inline, 2 sync outlets', {}, [SyncOutlet(), SyncOutlet()]),
+        ('thread, 2 sync outlets', {'EVENTS_DISPATCHER': True}, [SyncOutlet(), SyncOutlet()]),
+        ('asyncio, 2 sync outlets', {'EVENTS_DISPATCHER': 'asyncio'}, [SyncOutlet(), SyncOutlet()]),
+        ('asyncio, 2 async outlets', {'EVENTS_DISPATCHER': 'asyncio'},
+            [AsyncOutlet(), AsyncOutlet()]),
+    )
+    for name, config, outlets in scenarios:
+        print('%-26s %8.0f events/s' % (name, measure(config, outlets)))
+
+
+if __name__ == '__main__':
+    main()
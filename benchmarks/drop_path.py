@@ -0,0 +1,69 @@
+'''
+Overhead the instrumentation adds to a request, compared to the same app
+without flask-events, for requests that are kept and requests that are
+dropped by sampling.
+'''
+import logging
+import timeit
+
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+
+from flask_events import Events
+
+
+def create_app(events_config=None):
+    app = Flask('bench_app')
+    logging.getLogger('bench_app.canonical').disabled = True
+
+    @app.route('/items/<int:item_id>')
+    def item(item_id): # pylint: disable=unused-variable
+        return 'item %d' % item_id
+
+    if events_config is not None:
+        app.config.update(events_config)
+        Events(app)
+
+    return app
+
+
+def start_response(status, headers, exc_info=None): # pylint: disable=unused-argument
+    pass
+
+
+def measure(app, number):
+    environ = EnvironBuilder(path='/items/123', headers={
+        'User-Agent': 'benchmark',
+        'X-Forwarded-For': '10.1.2.3',
+    }).get_environ()
+
+    def run():
+        response = app.wsgi_app(environ.copy(), start_response)
+        for _ in response:
+            pass
+        response.close()
+
+    run()
+    return timeit.timeit(run, number=number) / number * 1e9
+
+
+def main(number=10000):
+    scenarios = (
+        ('keep all', {}),
+        ('sampled out', {'EVENTS_SAMPLE_RATE': 0}),
+        ('keep_if, sampled out', {
+            'EVENTS_SAMPLE_RATE': 0,
+            'EVENTS_KEEP_SLOWER_THAN': 1.0,
+            'EVENTS_KEEP_IF': lambda facts: facts.status == 418,
+        }),
+    )
+
+    baseline = measure(create_app(), number)
+    print('%-22s %7.0f ns/request' % ('without flask-events', baseline))
+    for name, config in scenarios:
+        elapsed = measure(create_app(config), number)
+        print('%-22s %7.0f ns/request, overhead %6.0f ns' % (name, elapsed, elapsed - baseline))
+
+
+if __name__ == '__main__':
+    main()
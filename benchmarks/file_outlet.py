@@ -0,0 +1,72 @@
+'''
+Event throughput of the file outlet compared to the logfmt outlet writing
+through a logging.FileHandler.
+'''
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from flask_events.outlets import FileOutlet, LogfmtOutlet
+from flask_events.record import EventRecord
+
+from .logfmt_serializer import create_event
+
+
+def create_record():
+    record = EventRecord()
+    for key, value in create_event(12).items():
+        record.set(key, value)
+    return record
+
+
+def measure(outlet, close, number):
+    record = create_record()
+    start = time.perf_counter()
+    for _ in range(number):
+        outlet.handle(record)
+    close()
+    return number / (time.perf_counter() - start)
+
+
+def logging_outlet(path):
+    handler = logging.FileHandler(path)
+    logger = logging.getLogger('bench_file.canonical')
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    def close():
+        handler.close()
+        logger.handlers = []
+
+    return LogfmtOutlet('bench_file'), close
+
+
+def main(number=100000):
+    directory = tempfile.mkdtemp()
+    try:
+        scenarios = (
+            ('LogfmtOutlet, FileHandler', logging_outlet),
+            ('FileOutlet, logfmt', lambda path: file_outlet(path, format='logfmt')),
+            ('FileOutlet, ndjson', file_outlet),
+            ('FileOutlet, ndjson, gzip', lambda path: file_outlet(path, compression='gzip')),
+        )
+        for index, (name, create) in enumerate(scenarios):
+            path = os.path.join(directory, 'events-%d' % index)
+            outlet, close = create(path)
+            throughput = measure(outlet, close, number)
+            print('%-28s %8.0f events/s, %6.1f MB' % (
+                name, throughput, os.path.getsize(path) / 2**20))
+    finally:
+        shutil.rmtree(directory)
+
+
+def file_outlet(path, **kwargs):
+    outlet = FileOutlet(path, **kwargs)
+    return outlet, outlet.close
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+'''
+Per-call cost of adding function arguments to the event, resolving the
+signature with inspect every time as before, compared to the cached
+argument specs.
+'''
+import inspect
+import timeit
+
+from flask import Flask
+
+from flask_events import Events
+from flask_events.instrument import get_argument_spec
+
+
+def legacy_argument_names(func):
+    named_args = []
+    varargs_name = 'args'
+    for param_name, param in inspect.signature(func).parameters.items():
+        if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+            named_args.append(param_name)
+        elif param.kind == param.VAR_POSITIONAL:
+            varargs_name = param_name
+        else:
+            break
+    return named_args, varargs_name
+
+
+class Task:
+    def run(self, user_id, item_id, *extra, notify=False):
+        pass
+
+
+def send_email(recipient, subject, body, *attachments): # pylint: disable=unused-argument
+    pass
+
+
+def main(number=20000):
+    task = Task()
+    for name, func in (('function', send_email), ('bound method', task.run)):
+        legacy = timeit.timeit(lambda: legacy_argument_names(func), number=number)
+        cached = timeit.timeit(lambda: get_argument_spec(func), number=number)
+        print('%-14s inspect %6.0f ns, cached %5.0f ns' % (
+            name, legacy / number * 1e9, cached / number * 1e9))
+
+    app = Flask('bench_app')
+    events = Events(app)
+    events.outlets = []
+    instrumented = events.instrument()(send_email)
+    with app.app_context():
+        elapsed = timeit.timeit(lambda: instrumented('a@example.com', 'Hi', 'Body'), number=number)
+    print('%-14s %6.0f ns per call' % ('instrument()', elapsed / number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+'''
+Compares resolving the handler by re-matching the url map against reusing
+Flask's own match result.
+'''
+import functools
+import timeit
+
+from flask import Flask, request
+
+from flask_events.params import get_handler, get_view_function, format_handler
+
+
+def create_app(route_count):
+    app = Flask('bench_app')
+
+    for index in range(route_count):
+        def view(item_id): # pylint: disable=unused-argument
+            return 'ok'
+        app.add_url_rule('/resource-%d/<int:item_id>' % index, 'view_%d' % index, view)
+
+    return app
+
+
+def rematch_url_map(app):
+    return format_handler(get_view_function(app, request.path, request.method))
+
+
+def main(number=20000):
+    for route_count in (10, 100, 1000):
+        app = create_app(route_count)
+        # The last route is the worst case for matching
+        path = '/resource-%d/123' % (route_count - 1)
+        with app.test_request_context(path):
+            for name, func in (
+                    ('rematch', functools.partial(rematch_url_map, app)),
+                    ('cached', get_handler)):
+                elapsed = timeit.timeit(func, number=number)
+                print('%5d routes %-8s %8.0f ns/request' % (
+                    route_count, name, elapsed / number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
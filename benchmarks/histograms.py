@@ -0,0 +1,27 @@
+'''
+Cost of recording a request in the rolling histograms, on its own and as part
+of a request that is sampled out.
+'''
+import timeit
+
+from flask_events.histograms import LatencyHistograms
+
+from .drop_path import create_app, measure
+
+
+def main(number=100000):
+    histograms = LatencyHistograms()
+    key = ('app.views.item', 'GET', 2)
+    elapsed = timeit.timeit(lambda: histograms.record(key, 23456789), number=number)
+    print('%-26s %7.0f ns/value' % ('LatencyHistograms.record', elapsed / number * 1e9))
+
+    sampled_out = {'EVENTS_SAMPLE_RATE': 0}
+    baseline = measure(create_app(sampled_out), number // 10)
+    print('%-26s %7.0f ns/request' % ('sampled out', baseline))
+    elapsed = measure(create_app(dict(sampled_out, EVENTS_HISTOGRAMS=True)), number // 10)
+    print('%-26s %7.0f ns/request, overhead %6.0f ns' % (
+        'sampled out, histograms', elapsed, elapsed - baseline))
+
+
+if __name__ == '__main__':
+    main()
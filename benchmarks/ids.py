@@ -0,0 +1,34 @@
+'''
+Compares generating trace ids from the pooled random bytes against a
+`uuid4()` and an `os.urandom` call per id, and measures parsing a
+traceparent header.
+'''
+import binascii
+import os
+import timeit
+import uuid
+
+from flask_events.ids import generate_trace_id, parse_traceparent
+
+TRACEPARENT = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+
+def uuid4_id():
+    return uuid.uuid4().hex
+
+
+def urandom_id():
+    return binascii.hexlify(os.urandom(16)).decode('ascii')
+
+
+def main(number=200000):
+    for name, func in (('uuid4', uuid4_id), ('urandom', urandom_id), ('pooled', generate_trace_id)):
+        seconds = timeit.timeit(func, number=number)
+        print('%-8s %9.0f ids/s %6.0f ns/id' % (name, number / seconds, seconds / number * 1e9))
+
+    seconds = timeit.timeit(lambda: parse_traceparent(TRACEPARENT), number=number)
+    print('traceparent parse %6.0f ns' % (seconds / number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+'''
+Compares flattening and encoding an event for Honeycomb with the shared
+serialization module against the previous approach of formatting the
+flattened keys for every event and encoding with a `default=` fallback.
+'''
+import datetime
+import decimal
+import json
+import timeit
+
+from flask_events.record import EventRecord, iter_fields
+from flask_events.serialization import HAS_ORJSON, dumps, flatten
+
+from .logfmt_serializer import create_event
+
+
+def legacy_format(event_data, base):
+    formatted_data = base.copy()
+    for key, val, unit in iter_fields(event_data):
+        if unit is None:
+            formatted_data[key] = val
+        else:
+            formatted_data['%s_%s' % (key, unit)] = val
+    return json.dumps(formatted_data, default=str)
+
+
+def create_record(key_count):
+    record = EventRecord()
+    for key, value in create_event(key_count).items():
+        record.set(key, value)
+    record.set('created_at', datetime.datetime(2020, 1, 2, 3, 4, 5))
+    record.set('amount', decimal.Decimal('12.50'))
+    return record
+
+
+def main(number=20000):
+    base = {'hostname': 'example.com'}
+    print('encoder: %s' % ('orjson' if HAS_ORJSON else 'json'))
+    for key_count in (12, 40):
+        record = create_record(key_count)
+        legacy = timeit.timeit(lambda: legacy_format(record, base), number=number)
+        current = timeit.timeit(lambda: dumps(flatten(record, base)), number=number)
+        print('%3d keys: legacy %6.0f ns, current %6.0f ns' % (
+            key_count, legacy / number * 1e9, current / number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
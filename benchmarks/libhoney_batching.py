@@ -0,0 +1,56 @@
+'''
+Throughput of the libhoney outlet against a local fake Honeycomb endpoint, for
+a couple of batching configurations.
+'''
+import time
+
+from flask import Flask
+
+from flask_events import Events
+from tests.fake_honeycomb import FakeHoneycomb
+
+from .logfmt_serializer import create_event
+
+
+def measure(fake_honeycomb, event_count, **config):
+    app = Flask('bench_app')
+    app.config['EVENTS_HONEYCOMB_KEY'] = 'benchmark'
+    app.config['EVENTS_HONEYCOMB_API_HOST'] = fake_honeycomb.api_host
+    app.config['EVENTS_HONEYCOMB_MAX_PENDING'] = event_count
+    app.config.update(config)
+    outlet = Events(app).outlets[1]
+    event = create_event(15)
+    already_received = len(fake_honeycomb.events)
+
+    start = time.perf_counter()
+    for _ in range(event_count):
+        outlet.handle(event)
+    enqueued = time.perf_counter()
+    fake_honeycomb.wait_for_events(already_received + event_count, timeout=60)
+    done = time.perf_counter()
+
+    outlet.libhoney_client.close()
+    return (enqueued - start) / event_count * 1e9, event_count / (done - start)
+
+
+def main(event_count=5000):
+    fake_honeycomb = FakeHoneycomb().start()
+    try:
+        for batch_size, send_frequency, concurrent_batches in (
+                (10, 0.05, 1),
+                (100, 0.25, 10),
+                (500, 0.25, 10)):
+            handle_ns, events_per_second = measure(fake_honeycomb, event_count,
+                EVENTS_HONEYCOMB_MAX_BATCH_SIZE=batch_size,
+                EVENTS_HONEYCOMB_SEND_FREQUENCY=send_frequency,
+                EVENTS_HONEYCOMB_MAX_CONCURRENT_BATCHES=concurrent_batches,
+            )
+            print('batch size %3d frequency %.2fs concurrency %2d: '
+                '%6.0f ns/handle, %7.0f events/s' % (
+                    batch_size, send_frequency, concurrent_batches, handle_ns, events_per_second))
+    finally:
+        fake_honeycomb.stop()
+
+
+if __name__ == '__main__':
+    main()
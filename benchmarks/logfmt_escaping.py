@@ -0,0 +1,35 @@
+'''
+Formatting and parsing throughput for logfmt lines with clean values and with
+values that need quoting and escaping.
+'''
+import timeit
+from collections import OrderedDict
+
+from flask_events.outlets.logfmt import format_event, parse_logfmt
+
+from .logfmt_serializer import create_event
+
+
+def create_dirty_event():
+    event = create_event(15)
+    event['error'] = 'ValueError'
+    event['error_msg'] = 'invalid literal for int() with base 10: "abc"\nTraceback: C:\\app'
+    event['query'] = 'name = "O\'Brien"\tAND age > 3'
+    return event
+
+
+def main(number=20000):
+    events = OrderedDict((
+        ('clean', create_event(15)),
+        ('dirty', create_dirty_event()),
+    ))
+    for name, event in events.items():
+        line = format_event(event)
+        format_time = timeit.timeit(lambda event=event: format_event(event), number=number)
+        parse_time = timeit.timeit(lambda line=line: parse_logfmt(line), number=number)
+        print('%-6s format %8.0f ns/event   parse %8.0f ns/event' % (
+            name, format_time / number * 1e9, parse_time / number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
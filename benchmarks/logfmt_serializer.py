@@ -0,0 +1,67 @@
+'''
+Compares the compiled logfmt serializer with the previous implementation that
+built an intermediate dict and dispatched on the numbers ABCs for every value.
+'''
+import timeit
+from collections import OrderedDict
+
+from flask_events import UnitedMetric
+from flask_events.outlets.logfmt import format_event, format_key_value_pair
+from flask_events.utils import humanize_size
+
+
+def legacy_format_event(event_data):
+    formatted_data = OrderedDict()
+    for key, val in event_data.items():
+        if isinstance(val, UnitedMetric):
+            if val.unit == 'seconds':
+                formatted_data[key] = '%.3fs' % val.value
+            elif val.unit == 'bytes':
+                formatted_data[key] = humanize_size(val.value)
+            else:
+                formatted_data[key] = '%s%s' % (val.value, val.unit)
+        else:
+            formatted_data[key] = val
+
+    return ' '.join(
+        format_key_value_pair(key, val) for (key, val) in formatted_data.items())
+
+
+def create_event(key_count):
+    event = OrderedDict((
+        ('fwd', '10.0.12.0,10.1.0.4'),
+        ('method', 'GET'),
+        ('path', '/api/v1/users/1234/items?page=2'),
+        ('status', 200),
+        ('request_user_agent', 'Mozilla/5.0 (X11; Linux x86_64) Gecko/20100101 Firefox/91.0'),
+        ('handler', 'app.views.users.list_items'),
+        ('request_id', 'f100ded5ca1ab1e'),
+        ('database_query_time', UnitedMetric(0.01234, 'seconds')),
+        ('database_executes', 4),
+        ('request_total', UnitedMetric(0.04567, 'seconds')),
+        ('response_size', UnitedMetric(23456, 'bytes')),
+        ('cache_hit', True),
+        ('user_id', 1234),
+        ('score', 0.987654),
+        ('release_version', 'v123'),
+    ))
+
+    index = 0
+    while len(event) < key_count:
+        event['extra_%d' % index] = index if index % 2 else 'value %d' % index
+        index += 1
+
+    return event
+
+
+def main(number=20000):
+    for key_count in (15, 30):
+        event = create_event(key_count)
+        assert legacy_format_event(event) == format_event(event)
+        for name, func in (('legacy', legacy_format_event), ('compiled', format_event)):
+            elapsed = timeit.timeit(lambda func=func: func(event), number=number)
+            print('%2d keys %-9s %8.0f ns/event' % (key_count, name, elapsed / number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+'''
+Measures the overhead of calling outlets through their supervisor, which
+times each call and checks the circuit breaker, compared to calling the
+outlet directly.
+'''
+import timeit
+
+from flask_events.supervisor import OutletSupervisor
+
+
+class NullOutlet:
+    def handle(self, event_data):
+        pass
+
+
+def main(number=200000):
+    outlet = NullOutlet()
+    supervisor = OutletSupervisor(outlet)
+    event_data = {'path': '/'}
+
+    direct = timeit.timeit(lambda: outlet.handle(event_data), number=number)
+    supervised = timeit.timeit(lambda: supervisor.handle(event_data), number=number)
+    print('direct     %6.0f ns/event' % (direct / number * 1e9))
+    print('supervised %6.0f ns/event' % (supervised / number * 1e9))
+
+
+if __name__ == '__main__':
+    main()
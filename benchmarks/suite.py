@@ -0,0 +1,276 @@
+'''
+Benchmark suite for the overhead flask-events adds to a request, to catch
+regressions in the per-request path.
+
+Requests are driven both through the WSGI app directly and through the Flask
+test client, against apps with 10, 100 and 1000 routes, with the default
+config, with IP anonymization, with a SQLAlchemy query (in-memory sqlite) and
+with a celery task run in the view. The overhead is the difference to the
+same app without flask-events. The SQLAlchemy hooks are registered on import
+for all engines, so they also run in the app without flask-events.
+
+The components of the request path are also timed on their own, with the
+bytes they allocate per call.
+
+Results can be saved as a JSON baseline, and compared against one:
+
+    $ ./venv/bin/python -m benchmarks.suite --save baseline.json
+    $ ./venv/bin/python -m benchmarks.suite --compare baseline.json
+
+Comparing exits with status 1 if any benchmark got slower by more than the
+threshold. Timings are only comparable between runs on the same machine.
+'''
+import argparse
+import json
+import logging
+import sys
+import timeit
+import tracemalloc
+
+from celery import Celery, signals
+from flask import Flask
+from sqlalchemy import create_engine, text
+from werkzeug.test import EnvironBuilder
+
+from flask_events import Events
+from flask_events.params import add_default_params, get_anonymizer, get_handler, get_view_function
+from flask_events.outlets import LogfmtOutlet
+from flask_events.record import EventRecord
+
+ROUTE_COUNTS = (10, 100, 1000)
+
+SCENARIOS = (
+    ('default', {}),
+    ('anonymize', {'EVENTS_ANONYMIZE_IPS': True}),
+    ('sqlalchemy', {}),
+    ('celery', {}),
+)
+
+HEADERS = {
+    'User-Agent': 'benchmark',
+    'X-Forwarded-For': '10.1.2.3',
+}
+
+_task_celery = Celery('bench_tasks')
+
+
+@_task_celery.task(name='bench_task')
+def bench_task(item_id):
+    return item_id
+
+
+def create_app(route_count, scenario, events_config=None):
+    app = Flask('bench_app')
+    logging.getLogger('bench_app.canonical').disabled = True
+    engine = create_engine('sqlite://') if scenario == 'sqlalchemy' else None
+
+    def view(item_id):
+        if engine is not None:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        if scenario == 'celery':
+            bench_task.apply((item_id,))
+        return 'item %d' % item_id
+
+    for index in range(route_count):
+        app.add_url_rule('/route%d/<int:item_id>' % index, 'route%d' % index, view)
+
+    if events_config is not None:
+        app.config.update(events_config)
+        events = Events()
+        if scenario == 'celery':
+            events.init_celery_app(app)
+        events.init_app(app)
+
+    return app
+
+
+def get_path(route_count):
+    # The last route added, the slowest to match
+    return '/route%d/123' % (route_count - 1)
+
+
+def start_response(status, headers, exc_info=None): # pylint: disable=unused-argument
+    pass
+
+
+def measure_wsgi(app, path, number):
+    environ = EnvironBuilder(path=path, headers=HEADERS).get_environ()
+
+    def run():
+        response = app.wsgi_app(environ.copy(), start_response)
+        for _ in response:
+            pass
+        response.close()
+
+    run()
+    return timeit.timeit(run, number=number) / number * 1e9
+
+
+def measure_client(app, path, number):
+    client = app.test_client()
+
+    def run():
+        client.get(path, headers=HEADERS)
+
+    run()
+    return timeit.timeit(run, number=number) / number * 1e9
+
+
+def measure_allocations(app, path, number):
+    '''Mean peak bytes allocated during a request.'''
+    environ = EnvironBuilder(path=path, headers=HEADERS).get_environ()
+
+    def run():
+        response = app.wsgi_app(environ.copy(), start_response)
+        for _ in response:
+            pass
+        response.close()
+
+    for _ in range(10):
+        run()
+    return measure_call_allocations(run, number)
+
+
+def measure_call_allocations(func, number):
+    '''Mean peak bytes allocated during a call of `func`.'''
+    tracemalloc.start()
+    peak_total = 0
+    for _ in range(number):
+        reset_peak()
+        start_size = tracemalloc.get_traced_memory()[0]
+        func()
+        peak_total += tracemalloc.get_traced_memory()[1] - start_size
+    tracemalloc.stop()
+    return peak_total / number
+
+
+def reset_peak():
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        # Python < 3.9, clearing the traces resets the peak too
+        tracemalloc.clear_traces()
+
+
+def disconnect_celery_signals():
+    # init_celery_app connects to the global signals, don't let the handlers
+    # of one scenario run in the next
+    for signal in (signals.task_prerun, signals.task_failure, signals.task_postrun):
+        for receiver in signal._live_receivers(None): # pylint: disable=protected-access
+            signal.disconnect(receiver)
+
+
+def run_requests(number):
+    results = {}
+    for route_count in ROUTE_COUNTS:
+        path = get_path(route_count)
+        for scenario, events_config in SCENARIOS:
+            plain_app = create_app(route_count, scenario)
+            events_app = create_app(route_count, scenario, events_config)
+
+            for driver, measure in (('wsgi', measure_wsgi), ('client', measure_client)):
+                plain = measure(plain_app, path, number)
+                instrumented = measure(events_app, path, number)
+                name = 'request/%s/%s/%d' % (driver, scenario, route_count)
+                results[name] = {
+                    'ns': instrumented,
+                    'overhead_ns': instrumented - plain,
+                }
+                print('%-32s %8.0f ns/request, overhead %7.0f ns' % (
+                    name, instrumented, instrumented - plain))
+
+            name = 'allocations/%s/%d' % (scenario, route_count)
+            plain = measure_allocations(plain_app, path, max(number // 10, 10))
+            instrumented = measure_allocations(events_app, path, max(number // 10, 10))
+            results[name] = {
+                'bytes': instrumented,
+                'overhead_bytes': instrumented - plain,
+            }
+            print('%-32s %8.0f bytes/request, overhead %7.0f bytes' % (
+                name, instrumented, instrumented - plain))
+
+            disconnect_celery_signals()
+
+    return results
+
+
+def run_components(number):
+    results = {}
+    for route_count in ROUTE_COUNTS:
+        app = create_app(route_count, 'default', {'EVENTS_ANONYMIZE_IPS': True})
+        path = get_path(route_count)
+        outlet = LogfmtOutlet(app.name)
+
+        with app.test_request_context(path, headers=HEADERS):
+            record = EventRecord()
+            add_default_params(record)
+            anonymizer = get_anonymizer()
+            components = (
+                ('add_default_params', lambda: add_default_params(EventRecord())),
+                ('get_handler', get_handler),
+                ('get_view_function', lambda: get_view_function(app, path, 'GET')),
+                ('anonymize', lambda: anonymizer.anonymize('10.1.2.3')),
+                ('logfmt_handle', lambda: outlet.handle(record)),
+            )
+            for component, func in components:
+                func()
+                elapsed = timeit.timeit(func, number=number) / number * 1e9
+                allocated = measure_call_allocations(func, max(number // 100, 10))
+                name = 'component/%s/%d' % (component, route_count)
+                results[name] = {'ns': elapsed, 'bytes': allocated}
+                print('%-32s %8.0f ns %8.0f bytes' % (name, elapsed, allocated))
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''Print the change from the baseline, returns the names of the
+    benchmarks that got slower by more than `threshold`.'''
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ('ns', 'bytes'):
+            if metric not in result or not previous.get(metric):
+                continue
+            change = result[metric] / previous[metric] - 1
+            flag = ''
+            if change > threshold:
+                flag = ' REGRESSION'
+                regressions.append(name)
+            print('%-32s %+6.1f%% %s%s' % (name, change * 100, metric, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=2000, help='requests per benchmark')
+    parser.add_argument('--save', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='compare against the JSON baseline in this file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+        help='max relative slowdown before a benchmark counts as a regression')
+    args = parser.parse_args(argv)
+
+    results = run_requests(args.number)
+    results.update(run_components(args.number * 10))
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('%d benchmarks regressed by more than %.0f%%' % (
+                len(regressions), args.threshold * 100))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
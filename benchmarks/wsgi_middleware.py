@@ -0,0 +1,51 @@
+'''
+Compares the overhead of instrumenting requests with EventsMiddleware
+against the Flask request hooks registered by init_app, for a plain request
+and for a request making 20 database queries, where every query looks up
+the per-request state.
+'''
+import logging
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from flask_events import Events
+
+from .drop_path import measure
+
+QUERIES = 20
+
+
+def create_app(mode=None, queries=0):
+    app = Flask('bench_app')
+    logging.getLogger('bench_app.canonical').disabled = True
+    engine = create_engine('sqlite://')
+
+    @app.route('/items/<int:item_id>')
+    def item(item_id): # pylint: disable=unused-variable
+        if queries:
+            with engine.connect() as connection:
+                for _ in range(queries):
+                    connection.execute(text('SELECT 1'))
+        return 'item %d' % item_id
+
+    if mode == 'hooks':
+        Events().init_app(app)
+    elif mode == 'middleware':
+        Events().init_middleware(app)
+
+    return app
+
+
+def main(number=5000):
+    for queries in (0, QUERIES):
+        baseline = measure(create_app(queries=queries), number)
+        print('%2d queries, %-20s %7.0f ns/request' % (queries, 'without flask-events', baseline))
+        for mode in ('hooks', 'middleware'):
+            elapsed = measure(create_app(mode, queries), number)
+            print('%2d queries, %-20s %7.0f ns/request, overhead %6.0f ns' % (
+                queries, mode, elapsed, elapsed - baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,3 +4,4 @@ UnitedMetric = namedtuple('UnitedMetric', 'value unit')
 
 
 from .events import Events
+from .middleware import EventsMiddleware
@@ -1,42 +1,50 @@
-from ipaddress import ip_address
+import functools
+from ipaddress import ip_address, IPv4Address, IPv6Address
 
 
 class Anonymizer:
     def __init__(self,
             ipv4_mask='255.255.255.0',
             ipv6_mask='ffff:ffff:ffff:0000:0000:0000:0000:0000',
+            cache_size=4096,
     ):
         '''
         Null out the last octet in IPv4, and everything after the NLA in IPv6
         by default. See rfc 2374, section 3.1 for the unicast structure of IPv6
         addresses.
+
+        Clients tend to come from a limited set of addresses, thus the results
+        for the last `cache_size` addresses seen are kept in an LRU cache.
         '''
         self.ipv4_mask = ip_address(ipv4_mask)
         self.ipv6_mask = ip_address(ipv6_mask)
+        self._ipv4_mask_int = int(self.ipv4_mask)
+        self._ipv6_mask_int = int(self.ipv6_mask)
+        self._cached_anonymize = functools.lru_cache(maxsize=cache_size)(self._anonymize)
 
 
     def anonymize(self, original_ip):
-        address = ip_address(original_ip)
+        return self._cached_anonymize(original_ip)
 
-        if address.version == 6:
-            if address.ipv4_mapped:
-                return self._anonymize_mapped(address)
-            return _anonymize_address(address, self.ipv6_mask)
 
-        return _anonymize_address(address, self.ipv4_mask)
+    def anonymize_many(self, original_ips):
+        '''Anonymize all the given IPs, f. ex. for scrubbing existing logs.'''
+        anonymize = self._cached_anonymize
+        return [anonymize(original_ip) for original_ip in original_ips]
+
 
+    def cache_info(self):
+        '''Hit/miss stats for the cache, as returned by functools.lru_cache.'''
+        return self._cached_anonymize.cache_info()
 
-    def _anonymize_mapped(self, address):
-        masked_ip = ['::ffff:']
-        for original_byte, mask_byte in zip(address.ipv4_mapped.packed, self.ipv4_mask.packed):
-            if len(masked_ip) != 1:
-                masked_ip.append('.')
-            masked_ip.append('%d' % (original_byte & mask_byte))
-        return ''.join(masked_ip)
 
+    def _anonymize(self, original_ip):
+        address = ip_address(original_ip)
+
+        if address.version == 6:
+            mapped_address = address.ipv4_mapped
+            if mapped_address:
+                return '::ffff:%s' % IPv4Address(int(mapped_address) & self._ipv4_mask_int)
+            return IPv6Address(int(address) & self._ipv6_mask_int).compressed
 
-def _anonymize_address(address, mask):
-    masked_ip = bytearray()
-    for original_byte, mask_byte in zip(address.packed, mask.packed):
-        masked_ip.append(original_byte & mask_byte)
-    return ip_address(bytes(masked_ip)).compressed
+        return str(IPv4Address(int(address) & self._ipv4_mask_int))
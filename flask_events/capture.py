@@ -0,0 +1,210 @@
+import datetime
+import decimal
+import itertools
+import uuid
+
+from .utils import humanize_size
+
+
+# Returned by CapturePolicy.capture for arguments that shouldn't be added
+SKIP = object()
+
+_SCALAR_TYPES = frozenset((int, float, bool, type(None)))
+# Immutable values of a bounded size that the outlets know how to serialize
+_CONVERTED_TYPES = frozenset((
+    datetime.datetime,
+    datetime.date,
+    datetime.time,
+    datetime.timedelta,
+    decimal.Decimal,
+    uuid.UUID,
+))
+_PLAIN_TYPES = _SCALAR_TYPES | _CONVERTED_TYPES
+_BINARY_TYPES = (bytes, bytearray, memoryview)
+_COLLECTION_TYPES = (list, tuple, set, frozenset, dict)
+
+# Nesting below this is left out of a bounded repr
+_MAX_REPR_LEVEL = 6
+
+
+class CapturePolicy:
+    '''
+    Decides how function arguments and task return values are added to
+    events, to keep large arguments from blowing up memory use and log
+    volume.
+
+    Numbers, booleans, None, datetimes, decimals and UUIDs are added as they
+    are. Strings longer than `max_length` are truncated, with a marker saying
+    how much was cut. Binary data is summarized by its size, and collections
+    with more than `max_items` items by their type and length. Smaller
+    collections of the values above, with strings of at most `max_length`
+    characters in total, are added as they are. Other collections and objects
+    are wrapped in a `LazyRepr`, so they're only turned into a (truncated)
+    string if an outlet serializes the event.
+
+    If `allow` is given only arguments with those names are added, and
+    arguments named in `deny` are never added.
+    '''
+
+    def __init__(self, max_length=1000, max_items=100, allow=None, deny=None):
+        self.max_length = max_length
+        self.max_items = max_items
+        self.allow = frozenset(allow) if allow is not None else None
+        self.deny = frozenset(deny or ())
+
+
+    def capture(self, name, value):
+        '''The value to add for the argument, or SKIP if it should be left out.'''
+        if name in self.deny or (self.allow is not None and name not in self.allow):
+            return SKIP
+
+        value_type = value.__class__
+        if value_type in _PLAIN_TYPES:
+            return value
+
+        if value_type is str:
+            return truncate(value, self.max_length)
+
+        if isinstance(value, _BINARY_TYPES):
+            return '<%s %s>' % (value_type.__name__, humanize_size(len(value)))
+
+        if isinstance(value, _COLLECTION_TYPES):
+            if len(value) > self.max_items:
+                return '<%s len=%d>' % (value_type.__name__, len(value))
+            if value_type in _COLLECTION_TYPES and self._is_plain(value):
+                return value
+
+        return LazyRepr(value, self.max_length)
+
+
+    def _is_plain(self, collection):
+        '''Whether the collection only holds plain values, with strings of at
+        most `max_length` characters in total.'''
+        items = (itertools.chain.from_iterable(collection.items())
+            if collection.__class__ is dict else collection)
+        length = 0
+        for item in items:
+            item_type = item.__class__
+            if item_type is str:
+                length += len(item)
+                if self.max_length is not None and length > self.max_length:
+                    return False
+            elif item_type not in _PLAIN_TYPES:
+                return False
+        return True
+
+
+class LazyRepr:
+    '''
+    Stands in for a value in an event until an outlet needs it as a string.
+    The string is truncated to `max_length` and cached, so outlets sharing
+    the event only build it once. The repr of lists, tuples, sets and dicts
+    is built item by item and stopped at `max_length`, other objects are
+    converted with `str()` and truncated after.
+
+    The value is referenced until then, so it's serialized as it is at that
+    time and not when it was added.
+    '''
+    __slots__ = ('value', 'max_length', '_string')
+
+    def __init__(self, value, max_length):
+        self.value = value
+        self.max_length = max_length
+        self._string = None
+
+
+    def __str__(self):
+        if self._string is None:
+            value = self.value
+            if value.__class__ in _COLLECTION_TYPES and self.max_length is not None:
+                self._string = bounded_repr(value, self.max_length)
+            else:
+                self._string = truncate(str(value), self.max_length)
+        return self._string
+
+
+    def __repr__(self):
+        return 'LazyRepr(%s)' % self
+
+
+    def __eq__(self, other):
+        if isinstance(other, LazyRepr):
+            return str(self) == str(other)
+        return str(self) == other
+
+
+    def __hash__(self):
+        return hash(str(self))
+
+
+def truncate(string, max_length):
+    if max_length is None or len(string) <= max_length:
+        return string
+    return '%s...[%d more chars]' % (string[:max_length], len(string) - max_length)
+
+
+def bounded_repr(value, max_length):
+    '''The repr of a collection, cut off with `...` after `max_length`
+    characters without building the rest of it.'''
+    parts = []
+    length = 0
+    for part in _iter_repr(value, max_length, 0):
+        parts.append(part)
+        length += len(part)
+        if length > max_length:
+            return '%s...' % ''.join(parts)[:max_length]
+    return ''.join(parts)
+
+
+def _iter_repr(value, max_length, level):
+    value_type = value.__class__
+    if value_type not in _COLLECTION_TYPES:
+        if value_type in (str, bytes) and len(value) > max_length:
+            # Long enough to reach the cut off either way
+            value = value[:max_length]
+        yield repr(value)
+        return
+
+    if not value:
+        yield repr(value)
+        return
+
+    if level >= _MAX_REPR_LEVEL:
+        yield '...'
+        return
+
+    if value_type is dict:
+        yield '{'
+        for index, (key, item) in enumerate(value.items()):
+            if index:
+                yield ', '
+            yield from _iter_repr(key, max_length, level + 1)
+            yield ': '
+            yield from _iter_repr(item, max_length, level + 1)
+        yield '}'
+        return
+
+    if value_type is list:
+        opening, closing = '[', ']'
+    elif value_type is tuple:
+        opening, closing = '(', ',)' if len(value) == 1 else ')'
+    elif value_type is set:
+        opening, closing = '{', '}'
+    else:
+        opening, closing = 'frozenset({', '})'
+
+    yield opening
+    for index, item in enumerate(value):
+        if index:
+            yield ', '
+        yield from _iter_repr(item, max_length, level + 1)
+    yield closing
+
+
+def create_capture_policy(config):
+    return CapturePolicy(
+        max_length=config.get('EVENTS_CAPTURE_MAX_LENGTH', 1000),
+        max_items=config.get('EVENTS_CAPTURE_MAX_ITEMS', 100),
+        allow=config.get('EVENTS_CAPTURE_ALLOW'),
+        deny=config.get('EVENTS_CAPTURE_DENY'),
+    )
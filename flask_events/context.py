@@ -0,0 +1,47 @@
+'''
+The state of the current request or task, as a dict.
+
+Requests instrumented with the Flask hooks keep it on `g`, requests handled
+by `EventsMiddleware` in a `RequestSlot` found through the `current_slot`
+context variable, so it can be looked up without going through the `g` proxy.
+'''
+import contextvars
+
+from flask import g
+
+
+class RequestSlot:
+    '''
+    The state of a request handled by EventsMiddleware, found through the
+    `current_slot` context variable instead of the `g` proxy.
+    '''
+    __slots__ = ('context', 'environ', 'request')
+
+    def __init__(self, environ, start_time):
+        self.context = {'request_start_time': start_time}
+        self.environ = environ
+        self.request = None
+
+
+current_slot = contextvars.ContextVar('flask_events_slot', default=None)
+
+
+def get_context():
+    slot = current_slot.get()
+    if slot is not None:
+        return slot.context
+
+    context = getattr(g, 'flask_events', None)
+    if context is None:
+        context = {}
+        setattr(g, 'flask_events', context)
+
+    return context
+
+
+def store_prop(key, value):
+    get_context()[key] = value
+
+
+def get_prop(key, default=None):
+    return get_context().get(key, default)
@@ -0,0 +1,298 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import register_after_fork
+
+
+_logger = logging.getLogger(__name__)
+
+DROP_NEWEST = 'drop-newest'
+DROP_OLDEST = 'drop-oldest'
+BLOCK = 'block'
+
+OVERFLOW_POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+
+class BatchDispatcher:
+    '''
+    Moves outlet handling off the request thread. Events are put on a bounded
+    queue and a worker thread drains them in batches, passing each batch to
+    `send_batch`. A batch is sent when it's full or when its oldest event has
+    waited `flush_interval` seconds, whichever comes first.
+
+    A forked child starts with an empty queue, counters and a new lock, and
+    starts its own worker on the first event. Events queued before the fork
+    are sent by the parent.
+    '''
+
+    def __init__(self, send_batch,
+            queue_size=10000,
+            batch_size=100,
+            overflow=DROP_NEWEST,
+            flush_interval=1.0,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %s, got %r' % (
+                ', '.join(OVERFLOW_POLICIES), overflow))
+
+        self.send_batch = send_batch
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.flush_interval = flush_interval
+
+        self._closed = False
+        self._reset()
+
+        atexit.register(self.close)
+        register_after_fork(self._after_fork)
+
+
+    def put(self, event):
+        with self._lock:
+            if self._closed:
+                self.dropped += 1
+                return False
+
+            self._ensure_worker()
+
+            if len(self._queue) >= self.queue_size:
+                if self.overflow == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+
+                if self.overflow == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._queue) >= self.queue_size and not self._closed:
+                        self._not_full.wait()
+
+            self._queue.append(event)
+            self.enqueued += 1
+            queued = len(self._queue)
+            if queued == 1 or queued >= self.batch_size:
+                self._not_empty.notify()
+            return True
+
+
+    def flush(self, timeout=None):
+        '''Block until every event enqueued so far has been handed to the outlets.'''
+        with self._lock:
+            if not self._has_live_worker():
+                return self._drain_inline()
+            self._flush_requested = True
+            self._not_empty.notify()
+            flushed = self._idle.wait_for(
+                lambda: not self._queue and not self._in_flight, timeout=timeout)
+            self._flush_requested = False
+            return flushed
+
+
+    def close(self, timeout=5.0):
+        '''Flush pending events and stop the worker. Registered with atexit.'''
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            atexit.unregister(self.close)
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            worker = self._worker if self._has_live_worker() else None
+
+        if worker is not None:
+            worker.join(timeout)
+
+        with self._lock:
+            self._drain_inline()
+
+
+    def stats(self):
+        return {
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'flushed': self.flushed,
+            'queued': len(self._queue),
+        }
+
+
+    def _reset(self):
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._flush_requested = False
+        self._worker = None
+        self._worker_pid = None
+
+
+    def _after_fork(self):
+        # Called in the child. The lock might have been held by a thread that
+        # doesn't exist here, and the worker is gone, so start over.
+        self._reset()
+
+
+    def _has_live_worker(self):
+        # Threads don't survive a fork, so a pre-forking server needs a fresh
+        # worker in each child
+        return self._worker is not None and self._worker_pid == os.getpid()
+
+
+    def _ensure_worker(self):
+        if self._has_live_worker():
+            return
+
+        self._worker_pid = os.getpid()
+        self._worker = threading.Thread(target=self._run, name='flask-events-dispatcher')
+        self._worker.daemon = True
+        self._worker.start()
+
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._not_empty.wait()
+                if not self._queue and self._closed:
+                    return
+
+                deadline = time.monotonic() + self.flush_interval
+                while self._should_wait_for_batch():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+
+                batch = self._take_batch()
+
+            self._send(batch)
+
+
+    def _should_wait_for_batch(self):
+        return (len(self._queue) < self.batch_size
+            and not self._closed
+            and not self._flush_requested)
+
+
+    def _take_batch(self):
+        # Must be called with the lock held
+        size = min(self.batch_size, len(self._queue))
+        batch = [self._queue.popleft() for _ in range(size)]
+        self._in_flight += size
+        self._not_full.notify_all()
+        return batch
+
+
+    def _send(self, batch):
+        try:
+            self._deliver(batch)
+        except Exception: # pylint: disable=broad-except
+            _logger.exception('Failed to send batch of %d events', len(batch))
+        finally:
+            with self._lock:
+                self._in_flight -= len(batch)
+                self.flushed += len(batch)
+                if not self._queue and not self._in_flight:
+                    self._idle.notify_all()
+
+
+    def _deliver(self, batch):
+        self.send_batch(batch)
+
+
+    def _drain_inline(self):
+        # Must be called with the lock held. Used when there's no live worker,
+        # like at shutdown or after a fork before the first event.
+        while self._queue:
+            batch = self._take_batch()
+            self._lock.release()
+            try:
+                self._send(batch)
+            finally:
+                self._lock.acquire()
+        return True
+
+
+class AsyncioDispatcher(BatchDispatcher):
+    '''
+    A `BatchDispatcher` whose worker thread owns an asyncio event loop, for
+    outlets that write with non-blocking I/O. `send_batch` must be a coroutine
+    function, which is run to completion on the loop for each batch. Blocking
+    work can be moved off the loop with `run_in_executor(None, ...)`, which
+    runs it in a thread pool of `executor_workers` threads owned by the
+    dispatcher.
+    '''
+
+    def __init__(self, send_batch, executor_workers=4, **kwargs):
+        super().__init__(send_batch, **kwargs)
+        self.executor_workers = executor_workers
+        self._loop = None
+        self._loop_pid = None
+        self._executor = None
+
+
+    def close(self, timeout=5.0):
+        super().close(timeout)
+
+        if self._loop is not None and self._loop_pid == os.getpid():
+            self._loop.close()
+            self._executor.shutdown(wait=True)
+        self._loop = None
+
+
+    def _after_fork(self):
+        super()._after_fork()
+        # The loop might have been running in the parent's worker, leave it
+        self._loop = None
+        self._executor = None
+
+
+    def _deliver(self, batch):
+        self._get_loop().run_until_complete(self.send_batch(batch))
+
+
+    def _get_loop(self):
+        # Only used from one thread at a time, the worker or the thread
+        # draining the queue after the worker is gone
+        if self._loop is None or self._loop_pid != os.getpid():
+            self._loop_pid = os.getpid()
+            self._loop = asyncio.new_event_loop()
+            self._executor = ThreadPoolExecutor(self.executor_workers,
+                thread_name_prefix='flask-events-outlet')
+            self._loop.set_default_executor(self._executor)
+        return self._loop
+
+
+def create_dispatcher(config, send_batch, send_batch_async):
+    '''The dispatcher configured with the EVENTS_DISPATCHER_* settings, sending
+    batches with `send_batch`, or the coroutine function `send_batch_async` for
+    the asyncio dispatcher. None if EVENTS_DISPATCHER isn't set.'''
+    dispatcher_mode = config.get('EVENTS_DISPATCHER', False)
+    if dispatcher_mode == 'asyncio':
+        return AsyncioDispatcher(send_batch_async,
+            executor_workers=config.get('EVENTS_DISPATCHER_EXECUTOR_WORKERS', 4),
+            queue_size=config.get('EVENTS_DISPATCHER_QUEUE_SIZE', 10000),
+            batch_size=config.get('EVENTS_DISPATCHER_BATCH_SIZE', 100),
+            overflow=config.get('EVENTS_DISPATCHER_OVERFLOW', DROP_NEWEST),
+            flush_interval=config.get('EVENTS_DISPATCHER_FLUSH_INTERVAL', 1.0),
+        )
+    if dispatcher_mode:
+        return BatchDispatcher(send_batch,
+            queue_size=config.get('EVENTS_DISPATCHER_QUEUE_SIZE', 10000),
+            batch_size=config.get('EVENTS_DISPATCHER_BATCH_SIZE', 100),
+            overflow=config.get('EVENTS_DISPATCHER_OVERFLOW', DROP_NEWEST),
+            flush_interval=config.get('EVENTS_DISPATCHER_FLUSH_INTERVAL', 1.0),
+        )
+    return None
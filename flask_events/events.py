@@ -1,34 +1,30 @@
-import binascii
-import functools
-import inspect
-import logging
-import os
-import sys
-import time
-
-from collections import OrderedDict
-
-import libhoney
-from flask import current_app, request, g
-from werkzeug.routing import RequestRedirect
-from werkzeug.exceptions import MethodNotAllowed, NotFound
-
-from . import UnitedMetric
-from ._version import __version__
-from .outlets import LogfmtOutlet, LibhoneyOutlet
-from .anonymizer import Anonymizer
-
-HAS_SQLALCHEMY = False
-try:
-    from sqlalchemy import event
-    from sqlalchemy.engine import Engine
-    HAS_SQLALCHEMY = True
-except ImportError:
-    pass
-
-
-
-class Events:
+import asyncio
+
+from flask import current_app, request
+
+from . import UnitedMetric # pylint: disable=unused-import
+from .outlets import LogfmtOutlet
+from .outlets.file import create_file_outlet
+from .outlets.libhoney import create_libhoney_outlet
+from .capture import CapturePolicy, create_capture_policy
+# get_prop and get_view_function were defined here before and are kept importable
+from .context import get_context, get_prop, store_prop # pylint: disable=unused-import
+from .dispatcher import create_dispatcher
+from .ids import TRACEPARENT_HEADER, generate_span_id, generate_trace_id, parse_traceparent
+from .instrument import InstrumentationMixin
+from .params import (add_request_params, current_request, # pylint: disable=unused-import
+    get_anonymizer, get_default_all_data, get_request_handler, get_view_function)
+from .phases import add_request_phases, init_request_phases
+from .sampling import RequestFacts, create_sampler
+from .spans import ROLLUP, SPAN_MODES, TRACE
+from .sqlstats import add_query_stats
+from .supervisor import create_supervisor_factory
+from .tasks import CeleryMixin
+from .telemetry import TelemetryMixin, add_self_time, profile_self
+from .timing import clock_ns, get_queue_time_ns, ns_to_seconds
+
+
+class Events(InstrumentationMixin, TelemetryMixin, CeleryMixin):
     '''
     Helper class to generate structured log data for each request.
     '''
@@ -38,311 +34,286 @@ class Events:
 
     def __init__(self, app=None):
         self.outlets = []
+        self._supervisors = []
+        self._create_supervisor = create_supervisor_factory({})
+        self.outlet_telemetry = None
+        self.dispatcher = None
+        self.sampler = None
+        self.histograms = None
+        self.shared_stats = None
+        self.capture_policy = CapturePolicy()
+        self.span_mode = ROLLUP
+        self.max_spans = 64
+        self.generate_ids = True
+        self.profile_self = False
+        self.queue_time_header = None
+        self.add_all_data = get_default_all_data()
+        self.autoadd_celery_args = True
 
         if app is not None:
             self.init_app(app)
 
-        self.add_all_data = get_default_all_data()
-        self.autoadd_celery_args = True
-
 
     def init_app(self, app):
         self._init(app)
 
-        app.before_request(_before_request)
-        app.after_request(_after_request)
-        app.teardown_request(self._teardown_request)
+        if self.profile_self:
+            app.before_request(profile_self(self._before_request))
+            app.after_request(profile_self(_after_request))
+            app.teardown_request(profile_self(self._teardown_request))
+        else:
+            app.before_request(self._before_request)
+            app.after_request(_after_request)
+            app.teardown_request(self._teardown_request)
         app.teardown_appcontext(self._teardown_appcontext)
 
+        if app.config.get('EVENTS_REQUEST_PHASES', False):
+            init_request_phases(app)
 
-    def init_celery_app(self, app):
-        self._init(app)
-
-        self.autoadd_celery_args = app.config.get('EVENTS_AUTOADD_CELERY_ARGS', True)
-
-        from celery import signals # pylint: disable=import-outside-toplevel
-
-        @signals.task_prerun.connect(weak=False)
-        def before_task(task=None, args=None, kwargs=None, **kw): # pylint: disable=unused-argument
-            app.app_context().push()
-            store_prop('task_start_time', time.time())
-            self.add('task', task.name)
-
-            if not self.autoadd_celery_args:
-                return
-
-            self.add_function_arguments(task.run, args, kwargs)
-
-
-        @signals.task_postrun.connect(weak=False)
-        def after_task(retval=None, task_id=None, state=None, **kw): # pylint: disable=unused-argument
-            task_start_time = get_prop('task_start_time')
-            self.add('state', state)
-            self.add('retval', retval)
-            self.add('task_total', time.time() - task_start_time, unit='seconds')
-
-            params = self.add_all_data.copy()
 
-            # Add the task_id last to try to keep the generally most relevant data first
-            self.add('task_id', task_id)
-
-            request_extras = get_prop('request_extras')
-            if request_extras is not None:
-                params.update(request_extras)
-
-            for outlet in self.outlets:
-                outlet.handle(params)
-
-            app.app_context().pop()
+    def init_middleware(self, app):
+        '''Instrument requests at the WSGI boundary with EventsMiddleware,
+        instead of with Flask's request hooks like init_app does.'''
+        from .middleware import EventsMiddleware # pylint: disable=import-outside-toplevel
+        self._init(app)
+        app.wsgi_app = EventsMiddleware(app.wsgi_app, self, app)
+        return app.wsgi_app
 
 
     def _init(self, app):
-        self.outlets.clear() # In case of multiple init
+        # In case of multiple init, the outlets are replaced
+        for outlet in self.outlets:
+            close = getattr(outlet, 'close', None)
+            if close is not None:
+                close()
+        self.outlets.clear()
         self.outlets.append(LogfmtOutlet(app.name))
 
-        libhoney_key = app.config.get('EVENTS_HONEYCOMB_KEY')
-        libhoney_dataset = app.config.get('EVENTS_HONEYCOMB_DATASET', app.name)
-        if libhoney_key:
-            libhoney_client = libhoney.Client(
-                writekey=libhoney_key,
-                dataset=libhoney_dataset,
-                user_agent_addition='flask-events/%s' % __version__,
-            )
-            self.outlets.append(LibhoneyOutlet(libhoney_client))
-
-
-    def add(self, key, value, unit=None): # pylint: disable=no-self-use
-        if unit is not None:
-            value = UnitedMetric(value, unit)
-        add_extra(key, value)
-
-
-    def add_all(self, key, value, unit=None):
-        if unit is not None:
-            value = UnitedMetric(value, unit)
-        self.add_all_data[key] = value
-
-
-    def add_function_arguments(self, func, args, kwargs):
-        if args:
-            signature = inspect.signature(func)
-            named_args = []
-            varargs_name = 'args'
+        libhoney_outlet = create_libhoney_outlet(app.config, app.name)
+        if libhoney_outlet is not None:
+            self.outlets.append(libhoney_outlet)
 
-            for param_name, param in signature.parameters.items():
-                if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
-                    named_args.append(param_name)
-                elif param.kind == param.VAR_POSITIONAL:
-                    varargs_name = param_name
-                else:
-                    break
+        file_outlet = create_file_outlet(app.config)
+        if file_outlet is not None:
+            self.outlets.append(file_outlet)
 
-            for parameter, value in zip(named_args, args):
-                self.add(parameter, value)
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+        self.dispatcher = create_dispatcher(app.config, self._send_batch, self._send_batch_async)
 
-            for index, vararg in enumerate(args[len(named_args):]):
-                self.add('%s_%d' % (varargs_name, index), vararg)
+        self.sampler = create_sampler(app.config)
+        self.queue_time_header = app.config.get('EVENTS_QUEUE_TIME_HEADER')
 
-        if kwargs:
-            for key, val in kwargs.items():
-                self.add(key, val)
+        self._init_telemetry(app.config)
+        self._supervisors = []
+        self._create_supervisor = create_supervisor_factory(app.config)
+        self.capture_policy = create_capture_policy(app.config)
 
+        self.span_mode = app.config.get('EVENTS_SPANS', ROLLUP)
+        if self.span_mode not in SPAN_MODES:
+            raise ValueError('EVENTS_SPANS must be one of %s, got %r' % (
+                ', '.join(SPAN_MODES), self.span_mode))
+        self.max_spans = app.config.get('EVENTS_MAX_SPANS', 64)
+        self.generate_ids = app.config.get('EVENTS_GENERATE_IDS', True)
+        self.profile_self = app.config.get('EVENTS_PROFILE_SELF', False)
 
-    def instrument(self):
-        def wrapper(func):
-            @functools.wraps(func)
-            def instrumented_func(*args, **kwargs):
-                start_time = time.time()
-                self.add('func_name', func.__name__)
-                self.add_function_arguments(func, args, kwargs)
 
-                try:
-                    func(*args, **kwargs)
-                except Exception as exc: # pylint: disable=broad-except
-                    self.add('error', exc.__class__.__name__)
-                    self.add('error_msg', str(exc))
-                finally:
-                    self.add('duration', time.time() - start_time, unit='seconds')
+    def _emit(self, params):
+        if self.outlet_telemetry is not None and self.outlet_telemetry.is_due():
+            self.flush_outlet_telemetry(force=False)
+        self._dispatch(params)
 
-                    params = self.add_all_data.copy()
 
-                    request_extras = get_prop('request_extras')
-                    if request_extras is not None:
-                        params.update(request_extras)
-
-                    for outlet in self.outlets:
-                        outlet.handle(params)
-
-            return instrumented_func
-        return wrapper
-
-
-    def _teardown_request(self, exception): # pylint: disable=unused-argument
-        params = get_default_params()
-        for key, val in params.items():
-            self.add(key, val)
-
-
-    def _teardown_appcontext(self, exception):
-        database_timings = get_prop('database_timings')
-        if database_timings is not None:
-            self.add('database_query_time', sum(database_timings), unit='seconds')
-            self.add('database_executes', len(database_timings))
-
-        request_start_time = get_prop('request_start_time')
-        if request_start_time is None:
-            # App context was pushed and popped without a request context, ignore
+    def _dispatch(self, params):
+        if self.dispatcher is not None:
+            self.dispatcher.put(params)
             return
 
-        self.add('request_total', time.time() - request_start_time, unit='seconds')
+        for supervisor in self._get_supervisors():
+            supervisor.handle(params)
 
-        params = self.add_all_data.copy()
-        request_extras = get_prop('request_extras')
-        if request_extras is not None:
-            params.update(request_extras)
-
-        if exception:
-            params['error'] = exception.__class__.__name__
-            params['error_msg'] = str(exception)
-
-        for outlet in self.outlets:
-            outlet.handle(params)
 
+    def _send_batch(self, batch):
+        for supervisor in self._get_supervisors():
+            supervisor.handle_batch(batch)
 
-def get_default_all_data():
-    all_data = OrderedDict()
 
-    heroku_release_version = os.environ.get('HEROKU_RELEASE_VERSION')
-    if heroku_release_version:
-        all_data['release_version'] = heroku_release_version
-    heroku_slug_commit = os.environ.get('HEROKU_SLUG_COMMIT')
-    if heroku_slug_commit:
-        all_data['slug_commit'] = heroku_slug_commit
+    async def _send_batch_async(self, batch):
+        # Async outlets are awaited concurrently on the dispatcher's loop and
+        # sync outlets run in its executor, so a slow outlet doesn't hold up
+        # the others
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            supervisor.handle_batch_async(batch) if supervisor.is_async
+            else loop.run_in_executor(None, supervisor.handle_batch, batch)
+            for supervisor in self._get_supervisors()
+        ])
 
-    return all_data
 
+    def _get_supervisors(self):
+        # The outlets can be replaced or added to at any time, so the
+        # supervisors are matched up with them again when they've changed,
+        # keeping the stats of the outlets that are still there
+        outlets = self.outlets
+        supervisors = self._supervisors
+        if len(supervisors) != len(outlets) or any(supervisor.outlet is not outlet
+                for supervisor, outlet in zip(supervisors, outlets)):
+            by_outlet = {id(supervisor.outlet): supervisor for supervisor in supervisors}
+            supervisors = self._supervisors = [
+                by_outlet.get(id(outlet)) or self._create_supervisor(outlet) for outlet in outlets
+            ]
+        return supervisors
 
-def get_default_params():
-    full_path = request.full_path.rstrip('?')
-    params = OrderedDict((
-        ('fwd', ','.join(get_access_route())),
-        ('method', request.method),
-        ('path', full_path),
-        ('status', get_prop('response_status', 500)),
-        ('request_user_agent', request.headers.get('user-agent')),
-    ))
 
-    view_function = get_view_function(current_app, request.path, request.method)
-    if view_function:
-        params['handler'] = '%s.%s' % (view_function.__module__, view_function.__qualname__)
+    def add(self, key, value, unit=None):
+        self.get_record().set(key, value, unit)
 
-    request_id = request.headers.get('x-request-id')
-    if request_id:
-        params['request_id'] = request_id
 
-    return params
+    def add_all(self, key, value, unit=None):
+        self.add_all_data.set(key, value, unit)
+
+
+    def get_record(self):
+        '''The record for the current event, created from the data added with
+        add_all the first time it's needed in the app context.'''
+        context = get_context()
+        record = context.get('record')
+        if record is None:
+            record = context['record'] = self.add_all_data.copy()
+        return record
+
+
+    def _before_request(self):
+        context = get_context()
+        context['request_start_time'] = clock_ns()
+        self._start_trace(context, request.headers.get(TRACEPARENT_HEADER),
+            request.headers.get('x-request-id'))
+
+        if self.queue_time_header is not None:
+            request_start = request.headers.get(self.queue_time_header)
+            if request_start is not None:
+                context['queue_time'] = get_queue_time_ns(request_start)
+
+        if self.sampler is not None:
+            endpoint = request.endpoint
+            context['endpoint'] = endpoint
+            context['sample'] = self.sampler.sample_endpoint(endpoint)
+
+
+    def _teardown_request(self, exception):
+        app = current_app._get_current_object() # pylint: disable=protected-access
+        self._close_request(get_context(), app, current_request(), exception)
+
+
+    def _close_request(self, context, app, flask_request, exception):
+        # The expensive parts of the event are only built once it's known that
+        # the event will be kept, which is decided from the cheap facts
+        # collected during the request
+        if self.histograms is not None:
+            # The request context is gone by the time the app context is
+            # torn down, so the key has to be picked up here
+            status = context.get('response_status', 500)
+            context['histogram_key'] = (
+                get_request_handler(app, flask_request), flask_request.method, status // 100)
+
+        if self.sampler is not None:
+            if 'sample' not in context:
+                endpoint = flask_request.endpoint
+                context['endpoint'] = endpoint
+                context['sample'] = self.sampler.sample_endpoint(endpoint)
+            sample_rate = self._get_sample_rate(context, exception)
+            if sample_rate is None:
+                context['dropped'] = True
+                return
 
+        record = self.get_record()
+        add_request_params(record, app, flask_request, context)
 
-def get_access_route():
-    access_route = request.access_route
-    anonymizer = get_anonymizer()
-    if not anonymizer or not access_route:
-        return access_route
+        if self.sampler is not None:
+            record.set('sample_rate', sample_rate)
+            record.sample_rate = sample_rate
 
-    first_address = access_route[0]
-    return [anonymizer.anonymize(first_address)] + access_route[1:]
 
+    def _get_sample_rate(self, context, exception):
+        '''The sample rate for the current request, or None if it should be dropped.'''
+        keep, sample_rate = context.get('sample', (True, 1))
+        now = clock_ns()
+        query_stats = context.get('query_stats')
+        facts = RequestFacts(
+            endpoint=context.get('endpoint'),
+            status=context.get('response_status', 500),
+            request_total=ns_to_seconds(now - context.get('request_start_time', now)),
+            error=exception.__class__.__name__ if exception is not None else None,
+            database_query_time=ns_to_seconds(query_stats.total_time) if query_stats else 0.0,
+        )
+        keep, sample_rate = self.sampler.sample_response(keep, sample_rate, facts)
+        return sample_rate if keep else None
 
-def get_view_function(app, url, method):
-    """Match a url and return the view and arguments
-    it will be called with, or None if there is no view.
-    Creds: http://stackoverflow.com/a/38488506
-    """
-    # pylint: disable=too-many-return-statements
 
-    adapter = app.create_url_adapter(request)
+    def _teardown_appcontext(self, exception):
+        context = get_context()
+        if 'request_start_time' not in context:
+            # App context was pushed and popped without a request context, ignore
+            return
+        self._finish_request(context, clock_ns(), exception)
 
-    try:
-        match = adapter.match(url, method=method)
-    except RequestRedirect as ex:
-        # recursively match redirects
-        return get_view_function(app, ex.new_url, method)
-    except (MethodNotAllowed, NotFound):
-        # no match
-        return None
 
-    try:
-        return app.view_functions[match[0]]
-    except KeyError:
-        # no view is associated with the endpoint
-        return None
+    def _finish_request(self, context, now, exception):
+        request_total = now - context['request_start_time']
+        query_stats = context.get('query_stats')
 
+        self._record_request_stats(context, request_total, query_stats)
 
-def get_anonymizer():
-    anonymizer = getattr(g, 'flask_events_anonymizer', None)
-    if anonymizer:
-        return anonymizer
+        if context.get('dropped'):
+            return
 
-    anonymizer_config = current_app.config.get('EVENTS_ANONYMIZE_IPS', False)
-    if not anonymizer_config:
-        return None
+        record = self.get_record()
 
-    if anonymizer_config is True:
-        anonymizer = Anonymizer()
-    else:
-        anonymizer = Anonymizer(**anonymizer_config)
+        if query_stats is not None:
+            add_query_stats(record, query_stats)
 
-    g.flask_events_anonymizer = anonymizer
+        record.set('request_total', ns_to_seconds(request_total), 'seconds')
 
-    return anonymizer
+        queue_time = context.get('queue_time')
+        if queue_time is not None:
+            record.set('time_queue', ns_to_seconds(queue_time), 'seconds')
 
+        if 'request_started_time' in context:
+            add_request_phases(record, context)
 
-def _before_request():
-    store_prop('request_start_time', time.time())
+        if exception:
+            record.set('error', exception.__class__.__name__)
+            record.set('error_msg', str(exception))
+
+        span_events = self._finish_spans(record, context)
+        if self.profile_self:
+            add_self_time(record, context, now)
+        self._emit(record)
+        for span_event in span_events:
+            self._emit(span_event)
+
+
+    def _start_trace(self, context, traceparent, request_id):
+        '''Pick up the trace and request id from the caller, or generate them
+        if enabled. Traced spans always need a trace to belong to.'''
+        parent = parse_traceparent(traceparent) if traceparent else None
+        if parent is not None:
+            context['trace_id'] = parent.trace_id
+            context['parent_id'] = parent.parent_id
+        elif self.generate_ids or self.span_mode == TRACE:
+            context['trace_id'] = generate_trace_id()
+
+        trace_id = context.get('trace_id')
+        if trace_id is not None:
+            context['span_id'] = generate_span_id()
+
+        if request_id:
+            context['request_id'] = request_id
+        elif self.generate_ids and trace_id is not None:
+            # Lets logs with the request id be found from the trace
+            context['request_id'] = trace_id
 
 
 def _after_request(response):
     store_prop('response_status', response.status_code)
     return response
-
-
-def add_extra(key, value):
-    get_context().setdefault('request_extras', OrderedDict())[key] = value
-
-
-def store_prop(key, value):
-    get_context()[key] = value
-
-
-def get_prop(key, default=None):
-    return get_context().get(key, default)
-
-
-def get_context():
-    context = getattr(g, 'flask_events', None)
-    if context is None:
-        context = {}
-        setattr(g, 'flask_events', context)
-
-    return context
-
-
-if HAS_SQLALCHEMY:
-    # Tracking something more accurate like actual roundtrip count is much more
-    # complex since sqlalchemy doesn't give before/after signals on
-    # commit/rollback, thus ignore that for now
-
-    # Register as event handler on the database to track time spent on queries
-    @event.listens_for(Engine, "before_cursor_execute")
-    def receive_before_cursor_execute(conn, cursor, statement,
-                            parameters, context, executemany):
-        # pylint: disable=unused-argument,too-many-arguments
-        conn.info.setdefault('flask_events_query_start_time', []).append(time.time())
-
-
-    @event.listens_for(Engine, "after_cursor_execute")
-    def receive_after_cursor_execute(conn, cursor, statement,
-                            parameters, context, executemany):
-        # pylint: disable=unused-argument,too-many-arguments,too-many-locals
-        total = time.time() - conn.info['flask_events_query_start_time'].pop(-1)
-        get_context().setdefault('database_timings', []).append(total)
@@ -0,0 +1,184 @@
+import math
+import threading
+from array import array
+
+from .record import EventRecord
+from .timing import NS_PER_SECOND, clock_ns, ns_to_seconds
+
+
+# Each power of two is split in 2**SUB_BUCKET_BITS buckets, which bounds the
+# relative error of a reported percentile to about 1/16. Values below
+# 2**(SUB_BUCKET_BITS + 1) get a bucket each and are exact.
+SUB_BUCKET_BITS = 4
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+EXACT_LIMIT = SUB_BUCKET_COUNT * 2
+
+# Larger values are clamped, for nanoseconds this is more than three days
+MAX_VALUE = (1 << 48) - 1
+
+PERCENTILES = (50, 90, 99)
+
+
+def bucket_index(value):
+    if value < EXACT_LIMIT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKET_COUNT + (value >> shift) - SUB_BUCKET_COUNT
+
+
+def bucket_upper_bound(index):
+    '''The largest value that falls in the bucket.'''
+    if index < EXACT_LIMIT:
+        return index
+    shift = index // SUB_BUCKET_COUNT - 1
+    mantissa = index % SUB_BUCKET_COUNT + SUB_BUCKET_COUNT
+    return ((mantissa + 1) << shift) - 1
+
+
+BUCKET_COUNT = bucket_index(MAX_VALUE) + 1
+
+
+class LogHistogram:
+    '''
+    Counts non-negative integers in log-linear buckets kept in a preallocated
+    array, so recording a value doesn't allocate anything. The count and max
+    are exact, percentiles are the upper bound of the bucket they fall in.
+    '''
+    __slots__ = ('counts', 'count', 'max')
+
+    def __init__(self):
+        self.counts = array('Q', [0]) * BUCKET_COUNT
+        self.count = 0
+        self.max = 0
+
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        elif value > MAX_VALUE:
+            value = MAX_VALUE
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+
+    def percentiles(self, percentiles=PERCENTILES):
+        '''The value at each of the given percentiles. `percentiles` must be sorted.'''
+        return [
+            min(value, self.max)
+            for value in bucket_percentiles(self.counts, self.count, percentiles)
+        ]
+
+
+def bucket_percentiles(counts, total, percentiles=PERCENTILES):
+    '''The upper bound of the bucket each of the given percentiles falls in,
+    found in a single pass over the bucket counts. `percentiles` must be sorted.'''
+    if not total:
+        return [0 for _ in percentiles]
+
+    targets = [max(1, math.ceil(percentile * total / 100)) for percentile in percentiles]
+    values = []
+    seen = 0
+    for index, bucket_count in enumerate(counts):
+        if not bucket_count:
+            continue
+        seen += bucket_count
+        while len(values) < len(targets) and seen >= targets[len(values)]:
+            values.append(bucket_upper_bound(index))
+        if len(values) == len(targets):
+            break
+    return values
+
+
+class HistogramSeries:
+    '''The histograms for one handler, method and status class.'''
+    __slots__ = ('request_total', 'database_query_time', 'database_executes')
+
+    def __init__(self):
+        self.request_total = LogHistogram()
+        self.database_query_time = LogHistogram()
+        self.database_executes = LogHistogram()
+
+
+class LatencyHistograms:
+    '''
+    Rolling histograms of request_total, database_query_time and
+    database_executes per (handler, method, status class), covering every
+    request regardless of sampling.
+
+    Durations are recorded in nanoseconds. Every `interval` seconds the
+    histograms are swapped out and summarized by `collect` into one event per
+    key, with the count, max and percentiles of each metric.
+    '''
+
+    def __init__(self, interval=10.0, clock=clock_ns):
+        self.interval = interval
+        self.clock = clock
+        self._interval_ns = int(interval * NS_PER_SECOND)
+        self._series = {}
+        self._interval_start = clock()
+        self._lock = threading.Lock()
+
+
+    def record(self, key, request_total, query_stats=None):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = HistogramSeries()
+
+            series.request_total.record(request_total)
+            if query_stats is not None:
+                series.database_query_time.record(query_stats.total_time)
+                series.database_executes.record(query_stats.executes)
+
+
+    def is_due(self):
+        return self.clock() - self._interval_start >= self._interval_ns
+
+
+    def collect(self):
+        '''Start a new interval and return the events summarizing the last one.'''
+        with self._lock:
+            now = self.clock()
+            series_by_key = self._series
+            interval_ns = now - self._interval_start
+            self._series = {}
+            self._interval_start = now
+
+        return [
+            summarize(key, series, interval_ns)
+            for key, series in series_by_key.items()
+        ]
+
+
+def summarize(key, series, interval_ns):
+    handler, method, status_class = key
+    record = EventRecord()
+    record.set('event_type', 'histogram')
+    record.set('handler', handler)
+    record.set('method', method)
+    record.set('status_class', '%dxx' % status_class)
+    record.set('interval', ns_to_seconds(interval_ns), 'seconds')
+    record.set('count', series.request_total.count)
+    add_percentiles(record, 'request_total', series.request_total, 'seconds')
+
+    if series.database_executes.count:
+        add_percentiles(record, 'database_query_time', series.database_query_time, 'seconds')
+        add_percentiles(record, 'database_executes', series.database_executes)
+
+    return record
+
+
+def add_percentiles(record, name, histogram, unit=None):
+    convert = ns_to_seconds if unit == 'seconds' else int
+    for percentile, value in zip(PERCENTILES, histogram.percentiles()):
+        record.set('%s_p%d' % (name, percentile), convert(value), unit)
+    record.set('%s_max' % name, convert(histogram.max), unit)
+
+
+def create_histograms(config):
+    '''Create the histograms from the app config, or None if not enabled.'''
+    if not config.get('EVENTS_HISTOGRAMS', False):
+        return None
+    return LatencyHistograms(interval=config.get('EVENTS_HISTOGRAM_INTERVAL', 10.0))
@@ -0,0 +1,111 @@
+'''
+Request and trace ids, and the W3C traceparent header they're propagated with.
+
+Ids are random, but reading a few bytes from `os.urandom` per id is a
+syscall each time, so random bytes are read in batches and hex-encoded up
+front, and ids are handed out from the batch.
+'''
+import binascii
+import os
+from collections import namedtuple
+
+TRACEPARENT_HEADER = 'traceparent'
+
+TRACE_ID_SIZE = 16
+SPAN_ID_SIZE = 8
+
+TraceParent = namedtuple('TraceParent', 'trace_id parent_id')
+
+_HEX_DIGITS = frozenset('0123456789abcdef')
+
+
+class IdPool:
+    '''
+    Hands out random hex ids of `size` bytes, split off `batch_size` ids worth
+    of random bytes read at once.
+
+    Taking the next id from an iterator is atomic, so no lock is needed. If
+    threads race to refill the pool each gets a batch of its own. A forked
+    process must not hand out the same ids as its parent, so the pool has to
+    be reset in the child, see `reset`.
+    '''
+
+    def __init__(self, size, batch_size=256):
+        self.size = size
+        self.batch_size = batch_size
+        self._ids = iter(())
+
+
+    def generate(self):
+        try:
+            return next(self._ids)
+        except StopIteration:
+            self._ids = ids = iter(self._create_batch())
+            return next(ids)
+
+
+    def reset(self):
+        self._ids = iter(())
+
+
+    def _create_batch(self):
+        encoded = binascii.hexlify(os.urandom(self.size * self.batch_size)).decode('ascii')
+        length = 2 * self.size
+        return [encoded[offset:offset + length] for offset in range(0, len(encoded), length)]
+
+
+_trace_ids = IdPool(TRACE_ID_SIZE)
+_span_ids = IdPool(SPAN_ID_SIZE)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_trace_ids.reset)
+    os.register_at_fork(after_in_child=_span_ids.reset)
+
+
+def generate_trace_id():
+    return _trace_ids.generate()
+
+
+def generate_span_id():
+    return _span_ids.generate()
+
+
+def parse_traceparent(header):
+    '''The trace id and parent span id of a traceparent header, or None if
+    it's not valid.'''
+    parts = header.strip().split('-')
+    if len(parts) < 4:
+        return None
+
+    version, trace_id, parent_id, flags = parts[:4]
+    if len(version) != 2 or version == 'ff':
+        return None
+    if version == '00' and len(parts) != 4:
+        # Later versions may add fields, but the first version has exactly four
+        return None
+    if len(trace_id) != 2 * TRACE_ID_SIZE or len(parent_id) != 2 * SPAN_ID_SIZE or len(flags) != 2:
+        return None
+    if not _HEX_DIGITS.issuperset(version + trace_id + parent_id + flags):
+        return None
+    if trace_id == '0' * len(trace_id) or parent_id == '0' * len(parent_id):
+        return None
+
+    return TraceParent(trace_id, parent_id)
+
+
+def format_traceparent(trace_id, span_id):
+    return '00-%s-%s-01' % (trace_id, span_id)
+
+
+def add_trace_ids(record, context):
+    request_id = context.get('request_id')
+    if request_id is not None:
+        record.set('request_id', request_id)
+
+    trace_id = context.get('trace_id')
+    if trace_id is not None:
+        record.set('trace.trace_id', trace_id)
+        record.set('trace.span_id', context['span_id'])
+        parent_id = context.get('parent_id')
+        if parent_id is not None:
+            record.set('trace.parent_id', parent_id)
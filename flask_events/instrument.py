@@ -0,0 +1,243 @@
+'''
+Instrumentation of functions and parts of requests and tasks: the
+`instrument` decorator, spans, and adding function arguments to events.
+'''
+import functools
+import inspect
+import weakref
+from collections import namedtuple
+
+from flask import has_app_context
+
+from .capture import SKIP
+from .context import current_slot, get_context
+from .spans import TRACE, SpanBuffer, add_span_rollup, create_span_events
+from .timing import clock_ns, ns_to_seconds
+
+
+class InstrumentationMixin:
+    '''
+    The instrumentation methods of Events, using its `capture_policy`,
+    `span_mode` and `max_spans` settings.
+    '''
+
+    def add_function_arguments(self, func, args, kwargs):
+        argument_spec = get_argument_spec(func) if args else None
+        self._add_arguments(argument_spec, args, kwargs)
+
+
+    def _add_arguments(self, argument_spec, args, kwargs):
+        capture = self.capture_policy.capture
+        if args:
+            named_args, varargs_name = argument_spec
+            record = self.get_record()
+            for parameter, value in zip(named_args, args):
+                value = capture(parameter, value)
+                if value is not SKIP:
+                    record.set(parameter, value)
+
+            for index, vararg in enumerate(args[len(named_args):]):
+                vararg = capture(varargs_name, vararg)
+                if vararg is not SKIP:
+                    record.set('%s_%d' % (varargs_name, index), vararg)
+
+        if kwargs:
+            record = self.get_record()
+            for key, val in kwargs.items():
+                val = capture(key, val)
+                if val is not SKIP:
+                    record.set(key, val)
+
+
+    def span(self, name):
+        '''Time a part of the current request or task as a span named `name`,
+        used as a context manager. Spans started inside it become its
+        children. Does nothing outside of requests and tasks.'''
+        return Span(self, name)
+
+
+    def get_spans(self):
+        '''The span buffer of the current request or task, or None if not in one.'''
+        slot = current_slot.get()
+        if slot is not None:
+            context = slot.context
+        elif has_app_context():
+            context = get_context()
+        else:
+            return None
+
+        spans = context.get('spans')
+        if spans is None:
+            if 'request_start_time' not in context and 'task_start_time' not in context:
+                return None
+            spans = context['spans'] = SpanBuffer(self.max_spans)
+        return spans
+
+
+    def instrument(self, raise_errors=False):
+        '''Decorator that emits an event for each call of the function, with
+        its arguments, duration and any error. Called during a request or task
+        the call is instead recorded as a span of it.
+
+        The function's return value is returned. An error raised by the
+        function is recorded and None returned instead, unless `raise_errors`
+        is set, then the error is raised again after it's been recorded.'''
+        def wrapper(func):
+            # Resolved once here rather than on every call
+            argument_spec = get_argument_spec(func)
+            name = func.__name__
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def instrumented_coroutine(*args, **kwargs):
+                    if self.get_spans() is not None:
+                        try:
+                            with self.span(name):
+                                return await func(*args, **kwargs)
+                        except Exception as exc: # pylint: disable=broad-except
+                            self._add_error(exc)
+                            if raise_errors:
+                                raise
+                            return None
+
+                    start_time = self._start_instrumented(func, argument_spec, args, kwargs)
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as exc: # pylint: disable=broad-except
+                        self._add_error(exc)
+                        if raise_errors:
+                            raise
+                        return None
+                    finally:
+                        self._finish_instrumented(start_time)
+
+                return instrumented_coroutine
+
+            @functools.wraps(func)
+            def instrumented_func(*args, **kwargs):
+                if self.get_spans() is not None:
+                    try:
+                        with self.span(name):
+                            return func(*args, **kwargs)
+                    except Exception as exc: # pylint: disable=broad-except
+                        self._add_error(exc)
+                        if raise_errors:
+                            raise
+                        return None
+
+                start_time = self._start_instrumented(func, argument_spec, args, kwargs)
+                try:
+                    return func(*args, **kwargs)
+                except Exception as exc: # pylint: disable=broad-except
+                    self._add_error(exc)
+                    if raise_errors:
+                        raise
+                    return None
+                finally:
+                    self._finish_instrumented(start_time)
+
+            return instrumented_func
+        return wrapper
+
+
+    def _start_instrumented(self, func, argument_spec, args, kwargs):
+        start_time = clock_ns()
+        self.add('func_name', func.__name__)
+        self._add_arguments(argument_spec, args, kwargs)
+        return start_time
+
+
+    def _add_error(self, exc):
+        self.add('error', exc.__class__.__name__)
+        self.add('error_msg', str(exc))
+
+
+    def _finish_instrumented(self, start_time):
+        self.add('duration', ns_to_seconds(clock_ns() - start_time), unit='seconds')
+
+        # The app context might live on and be used for more events, thus
+        # emit a snapshot
+        self._emit(self.get_record().copy())
+
+
+    def _finish_spans(self, record, context):
+        '''Add the spans to the record, or return the events for them when
+        tracing.'''
+        spans = context.get('spans')
+        if spans is None:
+            return ()
+
+        if self.span_mode == TRACE:
+            return create_span_events(record, spans, context['trace_id'], context['span_id'])
+
+        add_span_rollup(record, spans)
+        return ()
+
+
+ArgumentSpec = namedtuple('ArgumentSpec', 'named_args varargs_name')
+
+# Function -> [spec, spec when bound], filled in as they're needed
+_argument_specs = weakref.WeakKeyDictionary()
+
+
+def get_argument_spec(func):
+    '''The names of the positional parameters of the function and the name of
+    its *args parameter, which is 'args' if it has none.
+
+    inspect.signature is slow, so this is cached per function. Bound methods
+    are created on every attribute access, so they're cached on the function
+    they wrap.
+    '''
+    function = getattr(func, '__func__', func)
+    bound = function is not func
+    try:
+        specs = _argument_specs[function]
+    except KeyError:
+        specs = _argument_specs[function] = [None, None]
+    except TypeError:
+        # Can't be weakly referenced
+        return create_argument_spec(func)
+
+    spec = specs[bound]
+    if spec is None:
+        spec = specs[bound] = create_argument_spec(func)
+    return spec
+
+
+def create_argument_spec(func):
+    named_args = []
+    varargs_name = 'args'
+
+    for param_name, param in inspect.signature(func).parameters.items():
+        if param.kind in (param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+            named_args.append(param_name)
+        elif param.kind == param.VAR_POSITIONAL:
+            varargs_name = param_name
+        else:
+            break
+
+    return ArgumentSpec(tuple(named_args), varargs_name)
+
+
+class Span:
+    '''Context manager for a span, see Events.span.'''
+    __slots__ = ('events', 'name', '_spans', '_index')
+
+    def __init__(self, events, name):
+        self.events = events
+        self.name = name
+        self._spans = None
+        self._index = -1
+
+
+    def __enter__(self):
+        self._spans = self.events.get_spans()
+        if self._spans is not None:
+            self._index = self._spans.start(self.name, clock_ns())
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._spans is not None:
+            error = exc_type.__name__ if exc_type is not None else None
+            self._spans.finish(self._index, clock_ns(), error)
@@ -0,0 +1,108 @@
+'''
+Instruments requests at the WSGI boundary instead of with Flask's request
+hooks.
+
+The per-request state is held in a `RequestSlot` found through a context
+variable, so the lookups done while the request is handled, like for every
+database query, don't go through the `g` proxy. The request is timed until
+the response has been sent and closed, so streamed responses are timed to
+the last byte.
+'''
+from flask import got_request_exception, request, request_started
+from werkzeug.wsgi import ClosingIterator
+
+from .context import RequestSlot, current_slot
+from .ids import TRACEPARENT_HEADER
+from .timing import clock_ns, get_queue_time_ns
+
+_TRACEPARENT_KEY = 'HTTP_%s' % TRACEPARENT_HEADER.upper()
+
+
+class EventsMiddleware:
+    '''
+    WSGI middleware emitting an event per request for a Flask app. Use it
+    with `events.init_middleware(app)` instead of `events.init_app(app)`.
+
+    The status is picked up from `start_response`, and the Flask request
+    object from the `request_started` signal, so the url is only matched
+    once. Errors are picked up from the `got_request_exception` signal.
+    `EVENTS_REQUEST_PHASES` is not supported, the phases are measured with
+    the request hooks.
+    '''
+
+    def __init__(self, wsgi_app, events, app):
+        self.wsgi_app = wsgi_app
+        self.events = events
+        self.app = app
+        queue_time_header = events.queue_time_header
+        self._queue_time_key = (
+            'HTTP_%s' % queue_time_header.upper().replace('-', '_')
+            if queue_time_header is not None else None)
+
+        request_started.connect(_on_request_started, app, weak=False)
+        got_request_exception.connect(_on_request_exception, app, weak=False)
+
+
+    def __call__(self, environ, start_response):
+        start_time = clock_ns()
+        slot = RequestSlot(environ, start_time)
+        current_slot.set(slot)
+        context = slot.context
+
+        if self._queue_time_key is not None:
+            request_start = environ.get(self._queue_time_key)
+            if request_start is not None:
+                context['queue_time'] = get_queue_time_ns(request_start)
+
+        # pylint: disable=protected-access
+        self.events._start_trace(context, environ.get(_TRACEPARENT_KEY),
+            environ.get('HTTP_X_REQUEST_ID'))
+
+        def capture_start_response(status, headers, exc_info=None):
+            context['response_status'] = int(status[:3])
+            return start_response(status, headers, exc_info)
+
+        if self.events.profile_self:
+            context['self_time'] = clock_ns() - start_time
+
+        try:
+            response = self.wsgi_app(environ, capture_start_response)
+        except Exception as exception:
+            self._finish(slot, exception)
+            raise
+
+        return ClosingIterator(response, lambda: self._finish(slot))
+
+
+    def _finish(self, slot, exception=None):
+        now = clock_ns()
+        context = slot.context
+        if exception is None:
+            exception = context.get('exception')
+
+        flask_request = slot.request
+        if flask_request is None:
+            # Failed before Flask got to the request
+            flask_request = self.app.request_class(slot.environ)
+
+        # The slot is made current again in case the response is closed from
+        # another context than the app was called in
+        current_slot.set(slot)
+        try:
+            # pylint: disable=protected-access
+            self.events._close_request(context, self.app, flask_request, exception)
+            self.events._finish_request(context, now, exception)
+        finally:
+            current_slot.set(None)
+
+
+def _on_request_started(sender, **kwargs): # pylint: disable=unused-argument
+    slot = current_slot.get()
+    if slot is not None:
+        slot.request = request._get_current_object() # pylint: disable=protected-access
+
+
+def _on_request_exception(sender, exception=None, **kwargs): # pylint: disable=unused-argument
+    slot = current_slot.get()
+    if slot is not None:
+        slot.context['exception'] = exception
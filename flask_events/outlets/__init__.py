@@ -1,2 +1,3 @@
+from .file import FileOutlet
 from .libhoney import LibhoneyOutlet
 from .logfmt import LogfmtOutlet
@@ -0,0 +1,263 @@
+import atexit
+import glob
+import gzip
+import logging
+import os
+import threading
+import time
+
+from ..serialization import dumps, flatten
+from ..utils import register_after_fork
+from .logfmt import format_event
+
+HAS_ZSTANDARD = False
+try:
+    import zstandard
+    HAS_ZSTANDARD = True
+except ImportError:
+    pass
+
+
+_logger = logging.getLogger(__name__)
+
+FORMATS = ('ndjson', 'logfmt')
+COMPRESSIONS = (None, 'gzip', 'zstd')
+
+
+class FileOutlet:
+    '''
+    Writes events straight to a file, one per line, as NDJSON or logfmt.
+
+    Lines are collected in a buffer that's written out when it holds
+    `buffer_size` bytes or `flush_interval` seconds have passed since the last
+    write. That's checked whenever an event is added, and a background thread
+    writes out the buffer every `flush_interval` seconds, so events aren't
+    held back when no more come in. Pending lines are written at exit, or by
+    calling `flush()`.
+
+    The file is rotated when it grows beyond `max_bytes` or has been open for
+    `rotate_interval` seconds, by renaming it with a timestamp suffix. With
+    `backup_count` only that many rotated files are kept.
+
+    With `compression` set to `gzip` or `zstd` (needs the `zstandard`
+    package) each write is compressed as a separate gzip member or zstd
+    frame. Tools like zcat and zstdcat read such files as a single stream,
+    and everything written so far can be read back at any time.
+
+    The file is opened for appending without buffering, so each flush is
+    appended as a whole and processes can share a file. A process forked from
+    one using the outlet discards the inherited buffer, which the parent will
+    write, opens the file again and starts a flush thread of its own. A
+    `{pid}` in the path is replaced with the process id, which gives each
+    process a file of its own. That's needed with rotation, since a process
+    can't tell that another one rotated the file.
+    '''
+
+    def __init__(self, path,
+            format='ndjson', # pylint: disable=redefined-builtin
+            buffer_size=256 * 1024,
+            flush_interval=1.0,
+            max_bytes=None,
+            rotate_interval=None,
+            backup_count=None,
+            compression=None,
+            clock=time.monotonic,
+    ):
+        # pylint: disable=too-many-arguments
+        if format not in FORMATS:
+            raise ValueError('format must be one of %s, got %r' % (', '.join(FORMATS), format))
+        if compression not in COMPRESSIONS:
+            raise ValueError('compression must be gzip or zstd, got %r' % compression)
+        if compression == 'zstd' and not HAS_ZSTANDARD:
+            raise ValueError('zstd compression requires the zstandard package')
+
+        self.path = path
+        self.format = format
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compression = compression
+        self.clock = clock
+        self.format_line = format_json if format == 'ndjson' else format_event
+
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._last_flush = clock()
+        self._file = None
+        self._opened_at = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop_flusher = None
+
+        atexit.register(self.close)
+        register_after_fork(self._after_fork)
+
+
+    def handle(self, event_data):
+        self._add_lines([self.format_line(event_data) + '\n'])
+
+
+    def handle_batch(self, events):
+        self._add_lines([self.format_line(event_data) + '\n' for event_data in events])
+
+
+    def flush(self):
+        with self._lock:
+            self._check_fork()
+            self._flush()
+
+
+    def close(self):
+        '''Write pending events, stop the flush thread and close the file.
+        Registered with atexit until it's called.'''
+        atexit.unregister(self.close)
+        with self._lock:
+            self._check_fork()
+            if self._flusher is not None:
+                self._stop_flusher.set()
+                self._flusher = None
+            self._flush()
+            self._close_file()
+
+
+    def current_path(self):
+        return self.path.replace('{pid}', str(os.getpid()))
+
+
+    def _add_lines(self, lines):
+        with self._lock:
+            self._check_fork()
+            if self._flusher is None and self.flush_interval > 0:
+                self._start_flusher()
+            self._buffer.extend(lines)
+            self._buffered_bytes += sum(map(len, lines))
+            if (self._buffered_bytes >= self.buffer_size
+                    or self.clock() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+
+    def _start_flusher(self):
+        # Must be called with the lock held
+        self._stop_flusher = threading.Event()
+        self._flusher = threading.Thread(target=self._run_flusher, args=(self._stop_flusher,),
+            name='flask-events-file-flusher')
+        self._flusher.daemon = True
+        self._flusher.start()
+
+
+    def _run_flusher(self, stopped):
+        while not stopped.wait(self.flush_interval):
+            try:
+                with self._lock:
+                    if self._buffer and self._pid == os.getpid():
+                        self._flush()
+            except Exception: # pylint: disable=broad-except
+                _logger.exception('Failed to write events to %s', self.current_path())
+
+
+    def _after_fork(self):
+        # Called in the child. The lock might have been held by a thread that
+        # doesn't exist here, like the flush thread, and the flush thread is
+        # gone, so it's started again with the next event.
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._stop_flusher = None
+
+
+    def _check_fork(self):
+        if self._pid == os.getpid():
+            return
+
+        if self._pid is not None:
+            # Forked, the parent writes whatever is buffered. The file is
+            # unbuffered, so closing the inherited copy doesn't write anything.
+            self._buffer = []
+            self._buffered_bytes = 0
+            self._close_file()
+        self._pid = os.getpid()
+
+
+    def _flush(self):
+        self._last_flush = self.clock()
+        if not self._buffer:
+            return
+
+        if self._file is not None and self._should_rotate():
+            self._rotate()
+        if self._file is None:
+            self._open()
+
+        data = ''.join(self._buffer).encode('utf-8')
+        self._buffer = []
+        self._buffered_bytes = 0
+
+        if self.compression == 'gzip':
+            data = gzip.compress(data, compresslevel=6)
+        elif self.compression == 'zstd':
+            data = zstandard.ZstdCompressor().compress(data)
+
+        view = memoryview(data)
+        while view:
+            view = view[self._file.write(view):]
+
+
+    def _should_rotate(self):
+        if self.max_bytes is not None and self._file.tell() >= self.max_bytes:
+            return True
+        return (self.rotate_interval is not None
+            and self.clock() - self._opened_at >= self.rotate_interval)
+
+
+    def _open(self):
+        # pylint: disable=consider-using-with
+        self._file = open(self.current_path(), 'ab', buffering=0)
+        self._opened_at = self.clock()
+
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    def _rotate(self):
+        self._close_file()
+
+        path = self.current_path()
+        rotated_path = '%s.%s' % (path, time.strftime('%Y%m%d-%H%M%S'))
+        suffix = 1
+        while os.path.exists(rotated_path):
+            rotated_path = '%s.%s.%d' % (path, time.strftime('%Y%m%d-%H%M%S'), suffix)
+            suffix += 1
+        os.rename(path, rotated_path)
+
+        if self.backup_count is not None:
+            backups = sorted(glob.glob(glob.escape(path) + '.*'), key=os.path.getmtime)
+            for backup in backups[:max(0, len(backups) - self.backup_count)]:
+                os.remove(backup)
+
+
+def format_json(event_data):
+    '''Format the event as a JSON object, with the unit of values that have
+    one appended to the key like for Honeycomb.'''
+    return dumps(flatten(event_data))
+
+
+def create_file_outlet(config):
+    '''Create a file outlet from the app config, or None if no path is set.'''
+    path = config.get('EVENTS_FILE_PATH')
+    if not path:
+        return None
+
+    return FileOutlet(path,
+        format=config.get('EVENTS_FILE_FORMAT', 'ndjson'),
+        buffer_size=config.get('EVENTS_FILE_BUFFER_SIZE', 256 * 1024),
+        flush_interval=config.get('EVENTS_FILE_FLUSH_INTERVAL', 1.0),
+        max_bytes=config.get('EVENTS_FILE_MAX_BYTES'),
+        rotate_interval=config.get('EVENTS_FILE_ROTATE_INTERVAL'),
+        backup_count=config.get('EVENTS_FILE_BACKUP_COUNT'),
+        compression=config.get('EVENTS_FILE_COMPRESSION'),
+    )
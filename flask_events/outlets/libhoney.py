@@ -1,24 +1,142 @@
+import datetime
+import logging
 import socket
+import threading
 
-from ..events import UnitedMetric
+import libhoney
+from libhoney.transmission import Transmission
+
+from .._version import __version__
+from ..serialization import flatten
+
+
+_logger = logging.getLogger(__name__)
 
 
 class LibhoneyOutlet:
 
-    def __init__(self, libhoney_client):
+    def __init__(self, libhoney_client, track_responses=False):
+        '''
+        Events are queued on the client and sent in batches by its transmission
+        thread. With `track_responses` a background thread reads the client's
+        response queue to keep the counters returned by `stats()`.
+        '''
         self.libhoney_client = libhoney_client
         self.default_data = get_default_data()
+        self.responses = ResponseStats()
+
+        if track_responses:
+            self._response_reader = threading.Thread(
+                target=self.responses.consume,
+                args=(libhoney_client.responses(),),
+                name='flask-events-libhoney-responses',
+            )
+            self._response_reader.daemon = True
+            self._response_reader.start()
 
 
     def handle(self, event_data):
-        formatted_data = self.default_data.copy()
-        for key, val in event_data.items():
-            if isinstance(val, UnitedMetric):
-                formatted_data['%s_%s' % (key, val.unit)] = val.value
+        self._send(event_data)
+
+
+    def handle_batch(self, events):
+        for event_data in events:
+            self._send(event_data)
+
+
+    def stats(self):
+        return self.responses.as_dict()
+
+
+    def _send(self, event_data):
+        formatted_data = self._format(event_data)
+        sample_rate = getattr(event_data, 'sample_rate', None)
+        timestamp = getattr(event_data, 'timestamp', None)
+        event = self.libhoney_client.new_event(formatted_data)
+        if timestamp is not None:
+            # Span events are sent after they happened
+            event.created_at = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+        if sample_rate is None:
+            event.send()
+        else:
+            # Already sampled by flask-events, let Honeycomb know how many
+            # events this one represents
+            event.sample_rate = sample_rate
+            event.send_presampled()
+
+
+    def _format(self, event_data):
+        return flatten(event_data, self.default_data)
+
+
+class ResponseStats:
+    '''Counters for the responses libhoney got when sending events.'''
+
+    def __init__(self):
+        self.successes = 0
+        self.failures = 0
+        self.latency_ms_total = 0.0
+        self.latency_ms_max = 0.0
+        self._lock = threading.Lock()
+
+
+    def consume(self, response_queue):
+        while True:
+            response = response_queue.get()
+            if response is None:
+                # The client has been closed
+                return
+            self.add(response)
+
+
+    def add(self, response):
+        status_code = response.get('status_code') or 0
+        duration = response.get('duration') or 0.0
+        with self._lock:
+            if 200 <= status_code < 300:
+                self.successes += 1
             else:
-                formatted_data[key] = val
+                self.failures += 1
+                _logger.debug('Failed to send event to honeycomb (status %d): %s',
+                    status_code, response.get('error'))
+            self.latency_ms_total += duration
+            self.latency_ms_max = max(self.latency_ms_max, duration)
+
+
+    def as_dict(self):
+        with self._lock:
+            responses = self.successes + self.failures
+            return {
+                'successes': self.successes,
+                'failures': self.failures,
+                'latency_ms_avg': self.latency_ms_total / responses if responses else 0.0,
+                'latency_ms_max': self.latency_ms_max,
+            }
+
+
+def create_libhoney_outlet(config, app_name):
+    '''The outlet configured with the EVENTS_HONEYCOMB_* settings, or None if
+    no key is set.'''
+    libhoney_key = config.get('EVENTS_HONEYCOMB_KEY')
+    if not libhoney_key:
+        return None
 
-        self.libhoney_client.send_now(formatted_data)
+    user_agent_addition = 'flask-events/%s' % __version__
+    transmission = Transmission(
+        max_batch_size=config.get('EVENTS_HONEYCOMB_MAX_BATCH_SIZE', 100),
+        send_frequency=config.get('EVENTS_HONEYCOMB_SEND_FREQUENCY', 0.25),
+        max_concurrent_batches=config.get('EVENTS_HONEYCOMB_MAX_CONCURRENT_BATCHES', 10),
+        max_pending=config.get('EVENTS_HONEYCOMB_MAX_PENDING', 1000),
+        user_agent_addition=user_agent_addition,
+    )
+    libhoney_client = libhoney.Client(
+        writekey=libhoney_key,
+        dataset=config.get('EVENTS_HONEYCOMB_DATASET', app_name),
+        api_host=config.get('EVENTS_HONEYCOMB_API_HOST', 'https://api.honeycomb.io'),
+        user_agent_addition=user_agent_addition,
+        transmission_impl=transmission,
+    )
+    return LibhoneyOutlet(libhoney_client, track_responses=True)
 
 
 def get_default_data():
@@ -3,11 +3,39 @@ import re
 from collections import OrderedDict
 from logging import getLogger
 
+from ..capture import LazyRepr
 from ..events import UnitedMetric
+from ..record import EventRecord
 from ..utils import humanize_size
 
 
-NEEDS_QUOTES_RE = re.compile(r'[\s=]')
+# Characters that can't be part of a bare value. \s also covers the unicode line
+# breaks that str.splitlines() would split on.
+NEEDS_QUOTES_RE = re.compile(r'[\s="\x00-\x1f\x7f]')
+# Characters that must be escaped inside a quoted value
+NEEDS_ESCAPE_RE = re.compile(r'["\\\x00-\x1f\x7f\x85\u2028\u2029]')
+INVALID_KEY_CHARS_RE = re.compile(r'[\s="\x00-\x1f\x7f]')
+
+_ESCAPES = {
+    '\\': '\\\\',
+    '"': '\\"',
+    '\n': '\\n',
+    '\r': '\\r',
+    '\t': '\\t',
+}
+_ESCAPE_TABLE = {
+    char: '\\u%04x' % ord(char)
+    for char in [chr(code) for code in range(0x20)] + ['\x7f', '\x85', '\u2028', '\u2029']
+}
+_ESCAPE_TABLE.update(_ESCAPES)
+_ESCAPE_TABLE = str.maketrans(_ESCAPE_TABLE)
+_UNESCAPES = {escaped[1]: char for char, escaped in _ESCAPES.items()}
+
+_PAIR_RE = re.compile(r'([^\s=]+)(?:=(?:"((?:[^"\\]|\\.)*)"|(\S*)))?')
+_UNESCAPE_RE = re.compile(r'\\(u[0-9a-fA-F]{4}|.)')
+
+# Max number of distinct event schemas to keep compiled formatters for
+SCHEMA_CACHE_SIZE = 256
 
 
 class LogfmtOutlet:
@@ -17,24 +45,81 @@ class LogfmtOutlet:
 
 
     def handle(self, event_data):
-        formatted_data = OrderedDict()
-        for key, val in event_data.items():
-            if isinstance(val, UnitedMetric):
-                if val.unit == 'seconds':
-                    formatted_data[key] = '%.3fs' % val.value
-                elif val.unit == 'bytes':
-                    formatted_data[key] = humanize_size(val.value)
-                else:
-                    formatted_data[key] = '%s%s' % (val.value, val.unit)
-            else:
-                formatted_data[key] = val
-
-        self.logger.info(' '.join(
-            format_key_value_pair(key, val) for (key, val) in formatted_data.items())
-        )
+        self.logger.info(format_event(event_data))
+
+
+def format_event(event_data):
+    '''Format the event as a logfmt line.
+
+    The formatter for each field is picked from the exact type of the value
+    and cached for the combination of keys and value types, so the common case
+    of seeing the same shape of event over and over only needs a dict lookup
+    to find how to format every field.
+    '''
+    if isinstance(event_data, EventRecord):
+        keys, values, units = event_data.columns()
+        signature = (tuple(keys), tuple(map(type, values)), tuple(units))
+    else:
+        values = tuple(event_data.values())
+        signature = (tuple(event_data), tuple(map(type, values)), None)
+
+    formatters = _compiled_formatters.get(signature)
+    if formatters is None:
+        formatters = _compile(signature)
+
+    return ' '.join([
+        prefix + formatter(value) for (prefix, formatter), value in zip(formatters, values)
+    ])
 
 
 def format_key_value_pair(key, value):
+    return '%s=%s' % (_format_key(key), _format_any(value))
+
+
+def parse_logfmt(line):
+    '''Parse a logfmt line as written by this outlet into an ordered dict of
+    strings. Keys without a value are parsed as empty strings.
+    '''
+    pairs = OrderedDict()
+    for key, quoted_value, value in _PAIR_RE.findall(line):
+        if quoted_value:
+            if '\\' in quoted_value:
+                quoted_value = _UNESCAPE_RE.sub(_unescape, quoted_value)
+            value = quoted_value
+        pairs[key] = value
+    return pairs
+
+
+def _compile(signature):
+    keys, types, units = signature
+    if units is None:
+        units = (None,) * len(keys)
+
+    formatters = tuple(
+        ('%s=' % _format_key(key), _get_formatter(value_type, unit))
+        for key, value_type, unit in zip(keys, types, units)
+    )
+
+    if len(_compiled_formatters) >= SCHEMA_CACHE_SIZE:
+        _compiled_formatters.clear()
+    _compiled_formatters[signature] = formatters
+
+    return formatters
+
+
+def _get_formatter(value_type, unit):
+    if unit is None:
+        return _TYPE_FORMATTERS.get(value_type, _format_any)
+    if unit == 'seconds':
+        return _format_seconds
+    if unit == 'bytes':
+        return humanize_size
+    return lambda value: _format_str('%s%s' % (value, unit))
+
+
+def _format_any(value):
+    # Handles any type, including subclasses of the builtins which might
+    # override __str__ and thus can't use the fast paths
     if value is None:
         value = ''
     elif value is True:
@@ -48,9 +133,62 @@ def format_key_value_pair(key, value):
     else:
         value = str(value)
 
-    should_quote = NEEDS_QUOTES_RE.search(value)
+    return _format_str(value)
+
+
+def _format_key(key):
+    return INVALID_KEY_CHARS_RE.sub('_', str(key))
+
+
+def _format_str(value):
+    # Most values are clean and return after the first search
+    if not NEEDS_QUOTES_RE.search(value):
+        return value
+
+    if NEEDS_ESCAPE_RE.search(value):
+        value = value.translate(_ESCAPE_TABLE)
+    return '"%s"' % value
+
+
+def _unescape(match):
+    escaped = match.group(1)
+    if len(escaped) == 5:
+        return chr(int(escaped[1:], 16))
+    return _UNESCAPES.get(escaped, escaped)
+
+
+def _format_float(value):
+    return '%.4f' % value
+
+
+def _format_bool(value):
+    return 'true' if value else 'false'
+
+
+def _format_none(value): # pylint: disable=unused-argument
+    return ''
+
+
+def _format_seconds(value):
+    return '%.3fs' % value
+
+
+def _format_lazy_repr(value):
+    return _format_str(str(value))
+
+
+def _format_united_metric(metric):
+    return _get_formatter(None, metric.unit)(metric.value)
+
 
-    if should_quote:
-        value = '"%s"' % value
+_TYPE_FORMATTERS = {
+    str: _format_str,
+    int: str,
+    float: _format_float,
+    bool: _format_bool,
+    type(None): _format_none,
+    UnitedMetric: _format_united_metric,
+    LazyRepr: _format_lazy_repr,
+}
 
-    return '%s=%s' % (key, value)
+_compiled_formatters = {}
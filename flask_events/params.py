@@ -0,0 +1,181 @@
+'''
+The default data added to request events: where the request came from, what
+it asked for, the view function that handled it and its trace ids.
+'''
+import os
+
+from urllib.parse import urlsplit
+
+from flask import current_app, request
+from werkzeug.routing import RequestRedirect
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+
+from .anonymizer import Anonymizer
+from .context import get_context
+from .ids import add_trace_ids
+from .record import EventRecord
+
+
+def get_default_all_data():
+    all_data = EventRecord()
+
+    heroku_release_version = os.environ.get('HEROKU_RELEASE_VERSION')
+    if heroku_release_version:
+        all_data.set('release_version', heroku_release_version)
+    heroku_slug_commit = os.environ.get('HEROKU_SLUG_COMMIT')
+    if heroku_slug_commit:
+        all_data.set('slug_commit', heroku_slug_commit)
+
+    return all_data
+
+
+def current_request():
+    '''The request behind the `request` proxy, to pass on without going
+    through the proxy on every access.'''
+    return request._get_current_object() # pylint: disable=protected-access
+
+
+def add_default_params(record):
+    app = current_app._get_current_object() # pylint: disable=protected-access
+    add_request_params(record, app, current_request(), get_context())
+
+
+def add_request_params(record, app, flask_request, context):
+    record.set('fwd', ','.join(get_access_route(app, flask_request)))
+    record.set('method', flask_request.method)
+    record.set('path', flask_request.full_path.rstrip('?'))
+    record.set('status', context.get('response_status', 500))
+    record.set('request_user_agent', flask_request.headers.get('user-agent'))
+
+    handler = get_request_handler(app, flask_request)
+    if handler:
+        record.set('handler', handler)
+
+    add_trace_ids(record, context)
+
+
+def get_access_route(app, flask_request):
+    access_route = flask_request.access_route
+    anonymizer = get_app_anonymizer(app)
+    if not anonymizer or not access_route:
+        return access_route
+
+    first_address = access_route[0]
+    return [anonymizer.anonymize(first_address)] + access_route[1:]
+
+
+def get_handler():
+    '''The qualified name of the view function handling the current request.
+
+    Flask has already matched the url when the request context was pushed, so
+    reuse that and only fall back to matching again if that failed, since a
+    redirect might still lead to a view.
+    '''
+    app = current_app._get_current_object() # pylint: disable=protected-access
+    return get_request_handler(app, current_request())
+
+
+def get_request_handler(app, flask_request):
+    if flask_request.routing_exception is None:
+        return get_handler_cache(app).get(app.view_functions, flask_request.endpoint)
+
+    view_function = get_view_function(app, flask_request.path, flask_request.method,
+        flask_request)
+    if view_function:
+        return format_handler(view_function)
+
+    return None
+
+
+def format_handler(view_function):
+    return '%s.%s' % (view_function.__module__, view_function.__qualname__)
+
+
+class HandlerCache:
+    '''
+    Memoizes the formatted handler name per endpoint. Entries are checked
+    against the current view function for the endpoint, so re-registering a
+    view invalidates its entry.
+    '''
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._handlers = {}
+
+
+    def get(self, view_functions, endpoint):
+        view_function = view_functions.get(endpoint)
+        if view_function is None:
+            # no view is associated with the endpoint
+            return None
+
+        cached = self._handlers.get(endpoint)
+        if cached is not None and cached[0] is view_function:
+            return cached[1]
+
+        if len(self._handlers) >= self.maxsize:
+            self._handlers.clear()
+
+        handler = format_handler(view_function)
+        self._handlers[endpoint] = (view_function, handler)
+        return handler
+
+
+def get_handler_cache(app):
+    handler_cache = app.extensions.get('flask_events_handlers')
+    if handler_cache is None:
+        handler_cache = app.extensions.setdefault('flask_events_handlers', HandlerCache())
+    return handler_cache
+
+
+def get_view_function(app, url, method, flask_request=None):
+    """Match a url and return the view and arguments
+    it will be called with, or None if there is no view.
+    Creds: http://stackoverflow.com/a/38488506
+    """
+    # pylint: disable=too-many-return-statements
+
+    if flask_request is None:
+        flask_request = current_request()
+    adapter = app.create_url_adapter(flask_request)
+
+    try:
+        match = adapter.match(url, method=method)
+    except RequestRedirect as ex:
+        # recursively match redirects, new_url is absolute
+        return get_view_function(app, urlsplit(ex.new_url).path, method, flask_request)
+    except (MethodNotAllowed, NotFound):
+        # no match
+        return None
+
+    try:
+        return app.view_functions[match[0]]
+    except KeyError:
+        # no view is associated with the endpoint
+        return None
+
+
+def get_anonymizer():
+    return get_app_anonymizer(current_app._get_current_object()) # pylint: disable=protected-access
+
+
+def get_app_anonymizer(app):
+    try:
+        return app.extensions['flask_events_anonymizer']
+    except KeyError:
+        pass
+
+    # Built on first use rather than in init_app to respect config set after init
+    anonymizer = create_anonymizer(app.config.get('EVENTS_ANONYMIZE_IPS', False))
+    app.extensions['flask_events_anonymizer'] = anonymizer
+    return anonymizer
+
+
+def create_anonymizer(anonymizer_config):
+    if not anonymizer_config:
+        return None
+
+    if anonymizer_config is True:
+        return Anonymizer()
+
+    return Anonymizer(**anonymizer_config)
@@ -0,0 +1,68 @@
+'''
+The phases of a request: the time spent before the view, in the view, after
+it and in teardown, enabled with `EVENTS_REQUEST_PHASES`.
+'''
+import functools
+
+from flask import request_finished, request_started
+
+from .context import get_context
+from .timing import clock_ns, ns_to_seconds
+
+
+def init_request_phases(app):
+    '''Record the phase boundaries of the app's requests in their context.'''
+    request_started.connect(_on_request_started, app, weak=False)
+    request_finished.connect(_on_request_finished, app, weak=False)
+    _time_dispatch_request(app)
+
+
+def add_request_phases(record, context):
+    '''Split the request into the time spent before the view, in the view,
+    after the view (including after_request handlers) and in teardown.'''
+    started = context['request_started_time']
+    view_start = context.get('view_start_time')
+    view_end = context.get('view_end_time')
+    finished = context.get('request_finished_time')
+    now = clock_ns()
+
+    if view_start is not None:
+        record.set('time_before_request', ns_to_seconds(view_start - started), 'seconds')
+        record.set('time_view', ns_to_seconds(view_end - view_start), 'seconds')
+        before_finish = view_end
+    else:
+        # A before_request handler returned a response or failed
+        before_finish = finished if finished is not None else now
+        record.set('time_before_request', ns_to_seconds(before_finish - started), 'seconds')
+
+    if finished is not None:
+        record.set('time_after_request', ns_to_seconds(finished - before_finish), 'seconds')
+        record.set('time_teardown', ns_to_seconds(now - finished), 'seconds')
+
+
+def _on_request_started(sender, **extra): # pylint: disable=unused-argument
+    get_context()['request_started_time'] = clock_ns()
+
+
+def _on_request_finished(sender, **extra): # pylint: disable=unused-argument
+    get_context()['request_finished_time'] = clock_ns()
+
+
+def _time_dispatch_request(app):
+    '''Flask has no signals around the view itself, so wrap dispatch_request
+    to record when the view starts and ends.'''
+    dispatch_request = app.dispatch_request
+    if getattr(dispatch_request, 'flask_events_timed', False):
+        return
+
+    @functools.wraps(dispatch_request)
+    def timed_dispatch_request(*args, **kwargs):
+        context = get_context()
+        context['view_start_time'] = clock_ns()
+        try:
+            return dispatch_request(*args, **kwargs)
+        finally:
+            context['view_end_time'] = clock_ns()
+
+    timed_dispatch_request.flask_events_timed = True
+    app.dispatch_request = timed_dispatch_request
@@ -0,0 +1,122 @@
+from . import UnitedMetric
+
+
+class EventRecord:
+    '''
+    The data for a single event.
+
+    Keys and values are kept in parallel lists in the order the keys were
+    first added, with the unit of each value (or None) in a third list, so
+    adding data doesn't allocate anything but the list slots. Outlets can read
+    the columns directly through `fields()`, or use the read-only mapping
+    interface where values with a unit are returned as a `UnitedMetric`.
+
+    Data meant for the outlets rather than as a field is kept in attributes,
+    so it can't collide with the fields added by the app: `sample_rate` is
+    the rate the event was sampled at, or None if it wasn't, and `timestamp`
+    the unix time the event happened at, or None if it happened just now.
+    '''
+    __slots__ = ('_index', '_keys', '_values', '_units', 'sample_rate', 'timestamp')
+
+    def __init__(self, base=None):
+        if base is None:
+            self._index = {}
+            self._keys = []
+            self._values = []
+            self._units = []
+            self.sample_rate = None
+            self.timestamp = None
+        else:
+            self._index = base._index.copy() # pylint: disable=protected-access
+            self._keys = base._keys[:] # pylint: disable=protected-access
+            self._values = base._values[:] # pylint: disable=protected-access
+            self._units = base._units[:] # pylint: disable=protected-access
+            self.sample_rate = base.sample_rate
+            self.timestamp = base.timestamp
+
+
+    def set(self, key, value, unit=None):
+        if unit is None and value.__class__ is UnitedMetric:
+            value, unit = value
+
+        position = self._index.get(key)
+        if position is None:
+            self._index[key] = len(self._keys)
+            self._keys.append(key)
+            self._values.append(value)
+            self._units.append(unit)
+        else:
+            self._values[position] = value
+            self._units[position] = unit
+
+
+    def copy(self):
+        return EventRecord(self)
+
+
+    def columns(self):
+        '''The key, value and unit lists. These must not be modified.'''
+        return self._keys, self._values, self._units
+
+
+    def fields(self):
+        '''Iterate over (key, value, unit) for every field.'''
+        return zip(self._keys, self._values, self._units)
+
+
+    def __getitem__(self, key):
+        position = self._index[key]
+        unit = self._units[position]
+        if unit is None:
+            return self._values[position]
+        return UnitedMetric(self._values[position], unit)
+
+
+    def get(self, key, default=None):
+        if key in self._index:
+            return self[key]
+        return default
+
+
+    def __contains__(self, key):
+        return key in self._index
+
+
+    def __iter__(self):
+        return iter(self._keys)
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def keys(self):
+        return list(self._keys)
+
+
+    def values(self):
+        return [self[key] for key in self._keys]
+
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+
+    def __repr__(self):
+        return 'EventRecord(%r)' % self.items()
+
+
+def iter_fields(event_data):
+    '''Iterate over (key, value, unit) for an event record or a plain mapping
+    that might have UnitedMetric values.'''
+    if isinstance(event_data, EventRecord):
+        return event_data.fields()
+    return _iter_mapping_fields(event_data)
+
+
+def _iter_mapping_fields(event_data):
+    for key, value in event_data.items():
+        if isinstance(value, UnitedMetric):
+            yield key, value.value, value.unit
+        else:
+            yield key, value, None
@@ -0,0 +1,159 @@
+import math
+import random
+import threading
+import time
+
+
+class Sampler:
+    '''
+    Decides which requests to emit events for, to reduce the volume from high
+    traffic endpoints.
+
+    Rates are given as in Honeycomb, a rate of N keeps one in N events and a
+    rate of 0 drops all of them. The rate for a request is picked from the
+    first of these that applies:
+
+    - `status_rates`, keyed by response status
+    - `endpoint_rates`, keyed by flask endpoint
+    - the dynamic rate for the endpoint if `target_events_per_second` is set,
+      which aims to emit that many events per second for each endpoint
+    - `rate`
+
+    When the request is done the decision can be overridden based on the
+    outcome of the request. Requests that fail, are slower than
+    `keep_slower_than` seconds, spent more than `keep_database_slower_than`
+    seconds on database queries or that `keep_if` returns True for are kept
+    with a rate of 1. `keep_if` is called with the `RequestFacts` for the
+    request.
+    '''
+
+    def __init__(self,
+            rate=1,
+            endpoint_rates=None,
+            status_rates=None,
+            target_events_per_second=None,
+            window=30.0,
+            keep_errors=True,
+            keep_slower_than=None,
+            keep_database_slower_than=None,
+            keep_if=None,
+    ):
+        self.rate = rate
+        self.endpoint_rates = endpoint_rates or {}
+        self.status_rates = status_rates or {}
+        self.keep_errors = keep_errors
+        self.keep_slower_than = keep_slower_than
+        self.keep_database_slower_than = keep_database_slower_than
+        self.keep_if = keep_if
+        self.dynamic_sampler = None
+        if target_events_per_second:
+            self.dynamic_sampler = DynamicSampler(target_events_per_second, window)
+
+
+    def sample_endpoint(self, endpoint):
+        '''Make the initial decision for a request before it's handled.
+        Returns a tuple of whether to keep the event and the sample rate.'''
+        rate = self.endpoint_rates.get(endpoint)
+        if rate is None:
+            if self.dynamic_sampler is not None:
+                rate = self.dynamic_sampler.get_rate(endpoint)
+            else:
+                rate = self.rate
+        return should_keep(rate), rate
+
+
+    def sample_response(self, keep, rate, facts):
+        '''Revise the initial decision when the outcome of the request is known.'''
+        if self.keep_errors and (facts.error is not None or facts.status >= 500):
+            return True, 1
+
+        if self.keep_slower_than is not None and facts.request_total >= self.keep_slower_than:
+            return True, 1
+
+        if (self.keep_database_slower_than is not None
+                and facts.database_query_time >= self.keep_database_slower_than):
+            return True, 1
+
+        if self.keep_if is not None and self.keep_if(facts):
+            return True, 1
+
+        status_rate = self.status_rates.get(facts.status)
+        if status_rate is not None:
+            return should_keep(status_rate), status_rate
+
+        return keep, rate
+
+
+class RequestFacts:
+    '''What's known about a request before the full event is built.'''
+    __slots__ = ('endpoint', 'status', 'request_total', 'error', 'database_query_time')
+
+    def __init__(self, endpoint, status, request_total, error, database_query_time):
+        self.endpoint = endpoint
+        self.status = status
+        self.request_total = request_total
+        self.error = error
+        self.database_query_time = database_query_time
+
+
+class DynamicSampler:
+    '''
+    Picks a rate per key so that each key emits about
+    `target_events_per_second`, based on the traffic seen for the key in the
+    previous window.
+    '''
+
+    def __init__(self, target_events_per_second, window=30.0, clock=time.monotonic):
+        self.target_per_window = target_events_per_second * window
+        self.window = window
+        self.clock = clock
+        self._counts = {}
+        self._rates = {}
+        self._window_end = clock() + window
+        self._lock = threading.Lock()
+
+
+    def get_rate(self, key):
+        now = self.clock()
+        with self._lock:
+            if now >= self._window_end:
+                self._rates = {
+                    key: max(1, math.ceil(count / self.target_per_window))
+                    for key, count in self._counts.items()
+                }
+                self._counts = {}
+                self._window_end = now + self.window
+
+            self._counts[key] = self._counts.get(key, 0) + 1
+            return self._rates.get(key, 1)
+
+
+def should_keep(rate):
+    if rate == 1:
+        return True
+    if rate <= 0:
+        return False
+    return random.random() * rate < 1
+
+
+def create_sampler(config):
+    '''Create a sampler from the app config, or None if sampling is not configured.'''
+    rate = config.get('EVENTS_SAMPLE_RATE', 1)
+    endpoint_rates = config.get('EVENTS_SAMPLE_ENDPOINT_RATES')
+    status_rates = config.get('EVENTS_SAMPLE_STATUS_RATES')
+    target_events_per_second = config.get('EVENTS_SAMPLE_TARGET_EPS')
+
+    if rate == 1 and not endpoint_rates and not status_rates and not target_events_per_second:
+        return None
+
+    return Sampler(
+        rate=rate,
+        endpoint_rates=endpoint_rates,
+        status_rates=status_rates,
+        target_events_per_second=target_events_per_second,
+        window=config.get('EVENTS_SAMPLE_WINDOW', 30.0),
+        keep_errors=config.get('EVENTS_KEEP_ERRORS', True),
+        keep_slower_than=config.get('EVENTS_KEEP_SLOWER_THAN'),
+        keep_database_slower_than=config.get('EVENTS_KEEP_DATABASE_SLOWER_THAN'),
+        keep_if=config.get('EVENTS_KEEP_IF'),
+    )
@@ -0,0 +1,113 @@
+'''
+Turns events into JSON for the outlets that send JSON.
+
+Values with a unit are flattened into a key with the unit appended, and
+values JSON can't represent are converted up front based on their exact
+type, so the encoder never needs a fallback.
+'''
+import datetime
+import decimal
+import json
+import uuid
+
+from .capture import LazyRepr
+from .record import iter_fields
+
+HAS_ORJSON = False
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    pass
+
+
+# Max number of (key, unit) pairs to keep the flattened key for
+FLATTENED_KEY_CACHE_SIZE = 4096
+
+_flattened_keys = {}
+
+_NATIVE_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+def flatten_key(key, unit):
+    '''The key a value with a unit is sent with, like `request_total_seconds`.'''
+    try:
+        return _flattened_keys[key, unit]
+    except KeyError:
+        pass
+
+    if len(_flattened_keys) >= FLATTENED_KEY_CACHE_SIZE:
+        _flattened_keys.clear()
+    flattened_key = _flattened_keys[key, unit] = '%s_%s' % (key, unit)
+    return flattened_key
+
+
+def flatten(event_data, base=None):
+    '''A dict with the fields of the event with flattened keys and values
+    that can be encoded as JSON, added to a copy of `base` if given.'''
+    flattened = {} if base is None else base.copy()
+    for key, value, unit in iter_fields(event_data):
+        if value.__class__ not in _NATIVE_TYPES:
+            value = to_json_value(value)
+        if unit is None:
+            flattened[key] = value
+        else:
+            flattened[flatten_key(key, unit)] = value
+    return flattened
+
+
+def to_json_value(value):
+    '''Convert a value to something JSON can represent.'''
+    value_type = value.__class__
+    if value_type in _NATIVE_TYPES:
+        return value
+
+    converter = _CONVERTERS.get(value_type)
+    if converter is not None:
+        return converter(value)
+
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [to_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): to_json_value(item) for key, item in value.items()}
+    if isinstance(value, (str, int, float)):
+        # Subclasses like enums, encode as the plain value
+        for native_type in (bool, int, float, str):
+            if isinstance(value, native_type):
+                return native_type(value)
+    return str(value)
+
+
+def _decode_bytes(value):
+    return bytes(value).decode('utf-8', 'backslashreplace')
+
+
+_CONVERTERS = {
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+    datetime.timedelta: datetime.timedelta.total_seconds,
+    decimal.Decimal: float,
+    uuid.UUID: str,
+    LazyRepr: str,
+    bytes: _decode_bytes,
+    bytearray: _decode_bytes,
+    memoryview: _decode_bytes,
+}
+
+
+def _dumps_stdlib(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+if HAS_ORJSON:
+    def dumps(data):
+        '''Encode JSON compatible data as a compact JSON string.'''
+        try:
+            return orjson.dumps(data).decode('utf-8') # pylint: disable=no-member
+        except TypeError:
+            # orjson is stricter, f. ex. on integers above 64 bits and
+            # non-string keys
+            return _dumps_stdlib(data)
+else:
+    dumps = _dumps_stdlib
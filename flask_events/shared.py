@@ -0,0 +1,220 @@
+'''
+Host level request stats for pre-forking servers like gunicorn and uWSGI.
+
+The stats live in an anonymous shared memory map that must be created before
+the workers are forked, f. ex. by creating the app in the master process with
+gunicorn's `preload_app`. Each worker claims a slot of its own and only ever
+increments the counters in it, so workers never wait on each other. A slot
+left behind by a worker that died is taken over by the next worker that needs
+one, and since the counters are never reset nothing the old worker recorded
+is lost.
+
+Whichever worker first notices that the interval has passed merges all the
+slots and emits the difference from the previous merge as one event.
+'''
+import logging
+import mmap
+import multiprocessing
+import os
+import threading
+from array import array
+from operator import add, sub
+
+from .histograms import BUCKET_COUNT, MAX_VALUE, PERCENTILES, bucket_index, bucket_percentiles
+from .record import EventRecord
+from .timing import NS_PER_SECOND, clock_ns, ns_to_seconds
+
+
+_logger = logging.getLogger(__name__)
+
+# Offsets of the counters in a slot
+REQUESTS = 0
+STATUS_CLASSES = 1 # 1xx to 5xx, other statuses are only counted as requests
+REQUEST_TOTAL_SUM = 6
+DATABASE_REQUESTS = 7
+DATABASE_QUERY_TIME_SUM = 8
+DATABASE_EXECUTES_SUM = 9
+REQUEST_TOTAL_BUCKETS = 10
+DATABASE_QUERY_TIME_BUCKETS = REQUEST_TOTAL_BUCKETS + BUCKET_COUNT
+VALUES_SIZE = DATABASE_QUERY_TIME_BUCKETS + BUCKET_COUNT
+
+# Header with the start of the current interval, followed by the totals at
+# the last merge and then the slots, each a pid followed by the counters
+INTERVAL_START = 0
+BASELINE = 1
+SLOTS = BASELINE + VALUES_SIZE
+SLOT_SIZE = 1 + VALUES_SIZE
+
+ITEM_SIZE = array('Q').itemsize
+
+
+class SharedStats:
+    '''
+    Request counters and histograms shared between the processes forked
+    after it's created. See the module docstring for how it works.
+    '''
+
+    def __init__(self, slots=64, interval=10.0, clock=clock_ns):
+        self.slots = slots
+        self.interval = interval
+        self.clock = clock
+        self._interval_ns = int(interval * NS_PER_SECOND)
+        self._map = mmap.mmap(-1, (SLOTS + slots * SLOT_SIZE) * ITEM_SIZE)
+        self._values = memoryview(self._map).cast('Q')
+        self._values[INTERVAL_START] = clock()
+
+        # Only taken to claim a slot or merge the slots, never to record
+        self._process_lock = multiprocessing.Lock()
+
+        self._slot = None
+        self._slot_pid = None
+        self._thread_lock = threading.Lock()
+        self._warned_full = False
+
+
+    def record(self, status, request_total, query_stats=None):
+        if self._slot_pid != os.getpid():
+            self._claim_slot()
+        slot = self._slot
+        if slot is None:
+            return
+
+        values = self._values
+        with self._thread_lock:
+            values[slot + REQUESTS] += 1
+            status_class = status // 100
+            if 1 <= status_class <= 5:
+                values[slot + STATUS_CLASSES + status_class - 1] += 1
+            values[slot + REQUEST_TOTAL_SUM] += request_total
+            values[slot + REQUEST_TOTAL_BUCKETS + bucket_index(clamp(request_total))] += 1
+
+            if query_stats is not None:
+                query_time = query_stats.total_time
+                values[slot + DATABASE_REQUESTS] += 1
+                values[slot + DATABASE_QUERY_TIME_SUM] += query_time
+                values[slot + DATABASE_EXECUTES_SUM] += query_stats.executes
+                values[slot + DATABASE_QUERY_TIME_BUCKETS + bucket_index(clamp(query_time))] += 1
+
+
+    def is_due(self):
+        return self.clock() - self._values[INTERVAL_START] >= self._interval_ns
+
+
+    def collect(self, force=False):
+        '''Merge the slots and return an event with the stats since the last
+        merge, or None if another process is merging or the interval hasn't
+        passed and `force` isn't set.'''
+        if not self._process_lock.acquire(block=force): # pylint: disable=consider-using-with
+            return None
+
+        try:
+            now = self.clock()
+            interval_ns = now - self._values[INTERVAL_START]
+            if not force and interval_ns < self._interval_ns:
+                return None
+
+            totals = [0] * VALUES_SIZE
+            workers = 0
+            for slot in self._slot_offsets():
+                if not self._values[slot - 1]:
+                    continue
+                if is_alive(self._values[slot - 1]):
+                    workers += 1
+                totals = list(map(add, totals, self._values[slot:slot + VALUES_SIZE]))
+
+            baseline = self._values[BASELINE:BASELINE + VALUES_SIZE]
+            delta = list(map(sub, totals, baseline))
+            baseline[:] = array('Q', totals)
+            self._values[INTERVAL_START] = now
+        finally:
+            self._process_lock.release()
+
+        return summarize(delta, interval_ns, workers)
+
+
+    def _slot_offsets(self):
+        # The offset of the counters in each slot, the pid is right before
+        return range(SLOTS + 1, SLOTS + self.slots * SLOT_SIZE, SLOT_SIZE)
+
+
+    def _claim_slot(self):
+        pid = os.getpid()
+        self._slot = None
+        self._slot_pid = pid
+        # The lock might have been held by another thread when forking
+        self._thread_lock = threading.Lock()
+
+        with self._process_lock:
+            for slot in self._slot_offsets():
+                slot_pid = self._values[slot - 1]
+                if slot_pid == 0 or slot_pid == pid or not is_alive(slot_pid):
+                    self._values[slot - 1] = pid
+                    self._slot = slot
+                    return
+
+        if not self._warned_full:
+            self._warned_full = True
+            _logger.warning('All %d shared stats slots are taken, requests in process %d '
+                'are not counted', self.slots, pid)
+
+
+def clamp(value):
+    if value < 0:
+        return 0
+    if value > MAX_VALUE:
+        return MAX_VALUE
+    return value
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def summarize(delta, interval_ns, workers):
+    record = EventRecord()
+    record.set('event_type', 'host')
+    record.set('interval', ns_to_seconds(interval_ns), 'seconds')
+    record.set('workers', workers)
+    requests = delta[REQUESTS]
+    record.set('count', requests)
+    for status_class in range(1, 6):
+        record.set('status_%dxx' % status_class, delta[STATUS_CLASSES + status_class - 1])
+
+    add_bucket_stats(record, 'request_total', requests, delta[REQUEST_TOTAL_SUM],
+        delta[REQUEST_TOTAL_BUCKETS:REQUEST_TOTAL_BUCKETS + BUCKET_COUNT])
+
+    database_requests = delta[DATABASE_REQUESTS]
+    if database_requests:
+        record.set('database_executes', delta[DATABASE_EXECUTES_SUM])
+        add_bucket_stats(record, 'database_query_time', database_requests,
+            delta[DATABASE_QUERY_TIME_SUM],
+            delta[DATABASE_QUERY_TIME_BUCKETS:DATABASE_QUERY_TIME_BUCKETS + BUCKET_COUNT])
+
+    return record
+
+
+def add_bucket_stats(record, name, count, total, buckets):
+    if not count:
+        return
+
+    record.set('%s_avg' % name, ns_to_seconds(total // count), 'seconds')
+    values = bucket_percentiles(buckets, count, PERCENTILES + (100,))
+    for percentile, value in zip(PERCENTILES, values):
+        record.set('%s_p%d' % (name, percentile), ns_to_seconds(value), 'seconds')
+    record.set('%s_max' % name, ns_to_seconds(values[-1]), 'seconds')
+
+
+def create_shared_stats(config):
+    '''Create the shared stats from the app config, or None if not enabled.'''
+    if not config.get('EVENTS_SHARED_STATS', False):
+        return None
+    return SharedStats(
+        slots=config.get('EVENTS_SHARED_STATS_SLOTS', 64),
+        interval=config.get('EVENTS_SHARED_STATS_INTERVAL', 10.0),
+    )
@@ -0,0 +1,128 @@
+import contextvars
+import time
+from array import array
+
+from .ids import generate_span_id
+from .record import EventRecord
+from .timing import clock_ns, ns_to_seconds
+
+ROLLUP = 'rollup'
+TRACE = 'trace'
+
+SPAN_MODES = (ROLLUP, TRACE)
+
+# The buffer and index of the innermost unfinished span, or None. Kept in a
+# context variable so coroutines run concurrently during a request, which
+# share its buffer, each get the spans they started as parents.
+_current_span = contextvars.ContextVar('flask_events_current_span', default=None)
+
+
+class SpanBuffer:
+    '''
+    The spans recorded during a request or task, as a tree through the index
+    of each span's parent.
+
+    The columns are allocated up front for `max_spans` spans, so starting and
+    finishing a span only writes to them. Spans started when the buffer is
+    full are counted as dropped, and their children are attached to the
+    closest recorded ancestor.
+
+    The current span, the parent of the next span started, is tracked per
+    context, so concurrent tasks each have a parent chain of their own.
+    '''
+    __slots__ = ('names', 'parents', 'starts', 'ends', 'errors', 'count', 'dropped')
+
+    def __init__(self, max_spans=64):
+        self.names = [None] * max_spans
+        self.parents = array('i', [-1]) * max_spans
+        self.starts = array('q', [0]) * max_spans
+        self.ends = array('q', [0]) * max_spans
+        self.errors = [None] * max_spans
+        self.count = 0
+        self.dropped = 0
+
+
+    @property
+    def current(self):
+        '''The index of the current span in this context, or -1 if none.'''
+        current = _current_span.get()
+        if current is None or current[0] is not self:
+            return -1
+        return current[1]
+
+
+    def start(self, name, now):
+        '''Start a span as a child of the current one and make it current.
+        Returns the index of the span, or -1 if the buffer is full.'''
+        index = self.count
+        if index >= len(self.names):
+            self.dropped += 1
+            return -1
+
+        self.names[index] = name
+        self.parents[index] = self.current
+        self.starts[index] = now
+        self.ends[index] = 0
+        self.errors[index] = None
+        self.count = index + 1
+        _current_span.set((self, index))
+        return index
+
+
+    def finish(self, index, now, error=None):
+        if index < 0:
+            return
+        self.ends[index] = now
+        self.errors[index] = error
+        parent = self.parents[index]
+        _current_span.set((self, parent) if parent >= 0 else None)
+
+
+    def finished(self):
+        '''Iterate over (index, name, parent index, start, end, error) of the
+        spans that have finished.'''
+        for index in range(self.count):
+            end = self.ends[index]
+            if end:
+                yield (index, self.names[index], self.parents[index], self.starts[index], end,
+                    self.errors[index])
+
+
+def add_span_rollup(record, spans):
+    '''Add the total time spent in spans of each name as `time_<name>`.'''
+    totals = {}
+    for _, name, _, start, end, _ in spans.finished():
+        totals[name] = totals.get(name, 0) + end - start
+
+    for name, total in totals.items():
+        record.set('time_%s' % name, ns_to_seconds(total), 'seconds')
+
+    if spans.dropped:
+        record.set('spans_dropped', spans.dropped)
+
+
+def create_span_events(record, spans, trace_id, root_span_id):
+    '''Create an event per span with the trace.* fields Honeycomb uses to
+    build the trace, under the record as the root span `root_span_id`.'''
+    if spans.dropped:
+        record.set('spans_dropped', spans.dropped)
+
+    # Translates the monotonic clock to timestamps
+    wall_offset = time.time() - ns_to_seconds(clock_ns())
+
+    span_ids = [generate_span_id() for _ in range(spans.count)]
+    events = []
+    for index, name, parent, start, end, error in spans.finished():
+        event = EventRecord()
+        event.set('name', name)
+        event.set('trace.trace_id', trace_id)
+        event.set('trace.span_id', span_ids[index])
+        event.set('trace.parent_id', root_span_id if parent < 0 else span_ids[parent])
+        event.timestamp = wall_offset + ns_to_seconds(start)
+        event.set('timestamp', event.timestamp)
+        event.set('duration_ms', (end - start) / 1e6)
+        if error is not None:
+            event.set('error', error)
+        events.append(event)
+
+    return events
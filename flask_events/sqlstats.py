@@ -0,0 +1,130 @@
+import functools
+import re
+
+from .context import get_context
+from .timing import clock_ns, ns_to_seconds
+
+HAS_SQLALCHEMY = False
+try:
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    HAS_SQLALCHEMY = True
+except ImportError:
+    pass
+
+
+# Max number of distinct statements tracked per request, the rest are counted
+# together as OTHER_STATEMENTS
+MAX_STATEMENTS = 64
+OTHER_STATEMENTS = '<other>'
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.IGNORECASE)
+_HEX_RE = re.compile(r'\b0x[0-9a-f]+\b', re.IGNORECASE)
+_PLACEHOLDER_RE = re.compile(r'%\(\w+\)s|%s|(?<!:):\w+|\$\d+|\?')
+_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ROWS_RE = re.compile(r'(\(\?\))(?:\s*,\s*\(\?\))+')
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(statement):
+    '''Normalize a statement so that statements that only differ in literals,
+    placeholders style, whitespace or the length of IN lists and VALUES rows
+    are the same.'''
+    statement = _STRING_RE.sub('?', statement)
+    statement = _PLACEHOLDER_RE.sub('?', statement)
+    statement = _HEX_RE.sub('?', statement)
+    statement = _NUMBER_RE.sub('?', statement)
+    statement = _LIST_RE.sub('(?)', statement)
+    statement = _ROWS_RE.sub(r'\1', statement)
+    return ' '.join(statement.split())
+
+
+class QueryStats:
+    '''
+    Aggregates the queries executed during a request by statement
+    fingerprint. Uses constant memory regardless of the number of queries.
+    Durations are integer nanoseconds.
+    '''
+    __slots__ = ('executes', 'total_time', 'slowest_time', '_statements')
+
+    def __init__(self):
+        self.executes = 0
+        self.total_time = 0
+        self.slowest_time = 0
+        # Fingerprint -> [count, total time, slowest time]
+        self._statements = {}
+
+
+    def add(self, statement, duration):
+        self.executes += 1
+        self.total_time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+
+        key = fingerprint(statement)
+        stats = self._statements.get(key)
+        if stats is None:
+            if len(self._statements) >= MAX_STATEMENTS:
+                key = OTHER_STATEMENTS
+                stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = [0, 0, 0]
+
+        stats[0] += 1
+        stats[1] += duration
+        if duration > stats[2]:
+            stats[2] = duration
+
+
+    @property
+    def distinct_statements(self):
+        return len(self._statements)
+
+
+    def statement_stats(self, statement_fingerprint):
+        '''(count, total time, slowest time) for the given fingerprint.'''
+        return tuple(self._statements[statement_fingerprint])
+
+
+    def top_statement(self):
+        '''The fingerprint with the most total time spent, or None.'''
+        if not self._statements:
+            return None
+        return max(self._statements.items(), key=lambda item: item[1][1])[0]
+
+
+def add_query_stats(record, query_stats):
+    record.set('database_query_time', ns_to_seconds(query_stats.total_time), 'seconds')
+    record.set('database_executes', query_stats.executes)
+    record.set('database_slowest_query_time', ns_to_seconds(query_stats.slowest_time), 'seconds')
+    record.set('database_distinct_statements', query_stats.distinct_statements)
+
+    top_statement = query_stats.top_statement()
+    record.set('database_top_statement', top_statement)
+    record.set('database_top_statement_executes', query_stats.statement_stats(top_statement)[0])
+
+
+if HAS_SQLALCHEMY:
+    # Tracking something more accurate like actual roundtrip count is much more
+    # complex since sqlalchemy doesn't give before/after signals on
+    # commit/rollback, thus ignore that for now
+
+    # Register as event handler on the database to track time spent on queries
+    @event.listens_for(Engine, "before_cursor_execute")
+    def receive_before_cursor_execute(conn, cursor, statement,
+                            parameters, context, executemany):
+        # pylint: disable=unused-argument,too-many-arguments
+        conn.info.setdefault('flask_events_query_start_time', []).append(clock_ns())
+
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def receive_after_cursor_execute(conn, cursor, statement,
+                            parameters, context, executemany):
+        # pylint: disable=unused-argument,too-many-arguments,too-many-locals
+        total = clock_ns() - conn.info['flask_events_query_start_time'].pop(-1)
+        context = get_context()
+        query_stats = context.get('query_stats')
+        if query_stats is None:
+            query_stats = context['query_stats'] = QueryStats()
+        query_stats.add(statement, total)
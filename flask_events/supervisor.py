@@ -0,0 +1,308 @@
+'''
+Isolates the outlets from each other, so an outlet that fails or is slow
+doesn't keep the event from the others or fail the request.
+
+Each outlet is called through an `OutletSupervisor`, which catches and logs
+its errors, times it, and opens a circuit breaker that skips the outlet for
+a while after repeated failures or a call over the latency budget.
+'''
+import asyncio
+import inspect
+import logging
+import threading
+
+from .record import EventRecord
+from .timing import NS_PER_SECOND, clock_ns, ns_to_seconds
+
+_logger = logging.getLogger(__name__)
+
+# Tasks handing events to async outlets on a running loop, referenced until
+# they're done so they aren't garbage collected while pending
+_pending_tasks = set()
+
+CLOSED = 'closed'
+OPEN = 'open'
+
+
+class OutletSupervisor:
+    '''
+    Calls an outlet and keeps stats of the calls.
+
+    The circuit is opened after `failure_threshold` consecutive failures, or
+    a call taking longer than `latency_budget` seconds, and events for the
+    outlet are then skipped for `cooldown` seconds. The next call after that
+    is let through as a trial, a failure reopens the circuit right away.
+
+    A call that hangs can't be interrupted, but the circuit is opened once
+    it returns, so the following calls don't hang as well.
+    '''
+
+    def __init__(self, outlet, failure_threshold=5, latency_budget=None, cooldown=30.0,
+            clock=clock_ns):
+        self.outlet = outlet
+        self.name = outlet.__class__.__name__
+        self.is_async = is_async_outlet(outlet)
+        self.failure_threshold = failure_threshold
+        self.latency_budget = latency_budget
+        self.cooldown = cooldown
+        self.clock = clock
+        self._latency_budget_ns = (int(latency_budget * NS_PER_SECOND)
+            if latency_budget is not None else None)
+        self._cooldown_ns = int(cooldown * NS_PER_SECOND)
+        self._lock = threading.Lock()
+        self._open_until = None
+        self._consecutive_failures = 0
+
+        self.calls = 0
+        self.events = 0
+        self.failures = 0
+        self.skipped = 0
+        self.trips = 0
+        self.handle_time = 0
+        self.handle_time_max = 0
+        self._interval_max = 0
+        self._reported = (0, 0, 0, 0, 0)
+
+
+    def handle(self, event_data):
+        if self.is_async:
+            loop = get_running_loop()
+            if loop is not None:
+                schedule(loop, self.handle_batch_async([event_data]))
+                return
+
+        if self._skip(1):
+            return
+        start = self.clock()
+        try:
+            if self.is_async:
+                asyncio.run(self.outlet.handle_batch([event_data]))
+            else:
+                self.outlet.handle(event_data)
+        except Exception as exception: # pylint: disable=broad-except
+            self._finish(start, 1, exception)
+        else:
+            self._finish(start, 1)
+
+
+    def handle_batch(self, batch):
+        '''Hand a batch to the outlet. Async outlets are scheduled as a task if
+        called from a running event loop, and run to completion otherwise.'''
+        if self.is_async:
+            loop = get_running_loop()
+            if loop is not None:
+                schedule(loop, self.handle_batch_async(batch))
+                return
+
+        if self._skip(len(batch)):
+            return
+        start = self.clock()
+        try:
+            send_batch_to_outlet(self.outlet, batch)
+        except Exception as exception: # pylint: disable=broad-except
+            self._finish(start, len(batch), exception)
+        else:
+            self._finish(start, len(batch))
+
+
+    async def handle_batch_async(self, batch):
+        '''Hand a batch to an async outlet on the running event loop.'''
+        if self._skip(len(batch)):
+            return
+        start = self.clock()
+        try:
+            await self.outlet.handle_batch(batch)
+        except Exception as exception: # pylint: disable=broad-except
+            self._finish(start, len(batch), exception)
+        else:
+            self._finish(start, len(batch))
+
+
+    @property
+    def state(self):
+        return OPEN if self._open_until is not None else CLOSED
+
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'calls': self.calls,
+                'events': self.events,
+                'failures': self.failures,
+                'skipped': self.skipped,
+                'trips': self.trips,
+                'handle_ms_avg': self.handle_time / self.calls / 1e6 if self.calls else 0.0,
+                'handle_ms_max': self.handle_time_max / 1e6,
+            }
+
+
+    def collect(self):
+        '''The counters since the last call, as (calls, events, failures,
+        skipped, handle time, max handle time).'''
+        with self._lock:
+            current = (self.calls, self.events, self.failures, self.skipped, self.handle_time)
+            delta = tuple(value - reported for value, reported in zip(current, self._reported))
+            interval_max = self._interval_max
+            self._reported = current
+            self._interval_max = 0
+        return delta + (interval_max,)
+
+
+    def _skip(self, event_count):
+        if self._open_until is None:
+            # Checked without the lock first to keep the common case cheap
+            return False
+
+        with self._lock:
+            if self._open_until is None:
+                return False
+            if self.clock() < self._open_until:
+                self.skipped += event_count
+                return True
+            # Let this call through as a trial
+            self._open_until = None
+            return False
+
+
+    def _finish(self, start, event_count, exception=None):
+        elapsed = self.clock() - start
+        reason = None
+        with self._lock:
+            self.calls += 1
+            self.events += event_count
+            self.handle_time += elapsed
+            if elapsed > self._interval_max:
+                self._interval_max = elapsed
+                if elapsed > self.handle_time_max:
+                    self.handle_time_max = elapsed
+
+            if exception is None:
+                self._consecutive_failures = 0
+            else:
+                self.failures += 1
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.failure_threshold:
+                    reason = '%d consecutive failures' % self._consecutive_failures
+
+            budget = self._latency_budget_ns
+            if budget is not None and elapsed > budget:
+                reason = 'a call taking %.3f seconds' % ns_to_seconds(elapsed)
+
+            if reason is not None:
+                self._open_until = self.clock() + self._cooldown_ns
+                self.trips += 1
+
+        if exception is not None:
+            _logger.error('Outlet %r failed to handle %d events', self.outlet, event_count,
+                exc_info=exception)
+        if reason is not None:
+            _logger.warning('Skipping outlet %r for %.1f seconds after %s', self.outlet,
+                self.cooldown, reason)
+
+
+class OutletTelemetry:
+    '''
+    Summarizes the cost of the outlets every `interval` seconds, as one event
+    per outlet with `event_type=outlet_stats` and the time spent handling
+    events as `flask_events_outlet_ms`.
+    '''
+
+    def __init__(self, interval=60.0, clock=clock_ns):
+        self.interval = interval
+        self.clock = clock
+        self._interval_ns = int(interval * NS_PER_SECOND)
+        self._interval_start = clock()
+        self._lock = threading.Lock()
+
+
+    def is_due(self):
+        return self.clock() - self._interval_start >= self._interval_ns
+
+
+    def collect(self, supervisors, force=False):
+        '''Start a new interval and return the events for the last one, unless
+        another thread just did.'''
+        with self._lock:
+            now = self.clock()
+            if not force and now - self._interval_start < self._interval_ns:
+                return []
+            interval_ns = now - self._interval_start
+            self._interval_start = now
+
+        return [summarize(supervisor, interval_ns) for supervisor in supervisors]
+
+
+def summarize(supervisor, interval_ns):
+    calls, events, failures, skipped, handle_time, handle_time_max = supervisor.collect()
+    record = EventRecord()
+    record.set('event_type', 'outlet_stats')
+    record.set('outlet', supervisor.name)
+    record.set('interval', ns_to_seconds(interval_ns), 'seconds')
+    record.set('flask_events_outlet_ms', handle_time / 1e6)
+    record.set('flask_events_outlet_ms_max', handle_time_max / 1e6)
+    record.set('calls', calls)
+    record.set('events', events)
+    record.set('failures', failures)
+    record.set('skipped', skipped)
+    record.set('circuit', supervisor.state)
+    return record
+
+
+def is_async_outlet(outlet):
+    '''Whether the outlet implements `async def handle_batch(events)`.'''
+    return inspect.iscoroutinefunction(getattr(outlet, 'handle_batch', None))
+
+
+def send_batch_to_outlet(outlet, batch):
+    '''Hand a batch to an outlet. Async outlets are scheduled as a task if
+    called from a running event loop, and run to completion otherwise.'''
+    if is_async_outlet(outlet):
+        loop = get_running_loop()
+        if loop is not None:
+            schedule(loop, outlet.handle_batch(batch))
+        else:
+            asyncio.run(outlet.handle_batch(batch))
+        return
+
+    handle_batch = getattr(outlet, 'handle_batch', None)
+    if handle_batch is not None:
+        handle_batch(batch)
+    else:
+        for params in batch:
+            outlet.handle(params)
+
+
+def get_running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def schedule(loop, coroutine):
+    '''Run the coroutine as a task on the loop without waiting for it.'''
+    task = loop.create_task(coroutine)
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+    return task
+
+
+def create_supervisor_factory(config):
+    '''A function creating the supervisor for an outlet from the app config.'''
+    failure_threshold = config.get('EVENTS_OUTLET_FAILURE_THRESHOLD', 5)
+    latency_budget = config.get('EVENTS_OUTLET_LATENCY_BUDGET')
+    cooldown = config.get('EVENTS_OUTLET_COOLDOWN', 30.0)
+
+    def create_supervisor(outlet):
+        return OutletSupervisor(outlet, failure_threshold=failure_threshold,
+            latency_budget=latency_budget, cooldown=cooldown)
+
+    return create_supervisor
+
+
+def create_outlet_telemetry(config):
+    '''Create the outlet telemetry from the app config, or None if not enabled.'''
+    if not config.get('EVENTS_OUTLET_STATS', False):
+        return None
+    return OutletTelemetry(interval=config.get('EVENTS_OUTLET_STATS_INTERVAL', 60.0))
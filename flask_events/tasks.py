@@ -0,0 +1,178 @@
+'''
+Events for celery tasks, and the timing of tasks before they start running.
+
+The publisher stamps the wall clock time in the message headers, and the
+worker stamps when it received the message in the request that's passed to
+the pool. Together with the eta that splits the wait into the time spent in
+the broker, the requested delay and the time the worker held on to the
+message before a pool process was free to run it.
+
+The stamps come from different hosts, so the durations are only as accurate
+as their clocks are in sync, and are clamped at 0.
+'''
+import datetime
+import time
+
+from flask import has_app_context
+
+from .capture import SKIP
+from .context import current_slot, get_context, get_prop, store_prop
+from .ids import TRACEPARENT_HEADER, add_trace_ids, format_traceparent
+from .timing import NS_PER_SECOND, clock_ns, ns_to_seconds
+
+PUBLISHED_AT_HEADER = 'flask_events_published_at'
+RECEIVED_AT_KEY = 'flask_events_received_at'
+REQUEST_ID_HEADER = 'flask_events_request_id'
+
+
+class CeleryMixin:
+    '''
+    The celery setup methods of Events, emitting an event per task run.
+    '''
+
+    def init_celery_app(self, app):
+        self._init(app)
+
+        self.autoadd_celery_args = app.config.get('EVENTS_AUTOADD_CELERY_ARGS', True)
+
+        from celery import signals # pylint: disable=import-outside-toplevel
+
+        self.init_celery_producer()
+        signals.task_received.connect(stamp_received_at)
+
+        @signals.task_prerun.connect(weak=False)
+        def before_task(task=None, args=None, kwargs=None, **kw): # pylint: disable=unused-argument
+            started_at = time.time()
+            # A task run eagerly during a request handled by EventsMiddleware
+            # gets a context of its own like it does with the Flask hooks
+            slot_token = current_slot.set(None)
+            app_context = app.app_context()
+            app_context.push()
+            store_prop('app_context', app_context)
+            store_prop('slot_token', slot_token)
+            store_prop('task_start_time', clock_ns())
+            self._start_trace(get_context(), task.request.get(TRACEPARENT_HEADER),
+                task.request.get(REQUEST_ID_HEADER))
+            self.add('task', task.name)
+            record = self.get_record()
+            add_task_timings(record, task.request, started_at)
+            add_trace_ids(record, get_context())
+
+            if not self.autoadd_celery_args:
+                return
+
+            self.add_function_arguments(task.run, args, kwargs)
+
+
+        @signals.task_failure.connect(weak=False)
+        def on_task_failure(exception=None, **kw): # pylint: disable=unused-argument
+            record = self.get_record()
+            record.set('error', exception.__class__.__name__)
+            record.set('error_msg', str(exception))
+
+
+        @signals.task_postrun.connect(weak=False)
+        def after_task(retval=None, task_id=None, state=None, **kw): # pylint: disable=unused-argument
+            task_start_time = get_prop('task_start_time')
+            record = self.get_record()
+            record.set('state', state)
+            retval = self.capture_policy.capture('retval', retval)
+            if retval is not SKIP:
+                record.set('retval', retval)
+            record.set('task_total', ns_to_seconds(clock_ns() - task_start_time), 'seconds')
+
+            # Add the task_id last to try to keep the generally most relevant data first
+            record.set('task_id', task_id)
+
+            span_events = self._finish_spans(record, get_context())
+            self._emit(record)
+            for span_event in span_events:
+                self._emit(span_event)
+
+            # Pop the context pushed for the task, a new one would be a
+            # different context
+            slot_token = get_prop('slot_token')
+            get_prop('app_context').pop()
+            current_slot.reset(slot_token)
+
+
+    def init_celery_producer(self):
+        '''Stamp the time tasks are published, to get their queue time when
+        they run, and the ids of the current request or task, to link the
+        task to it. Needed in processes that publish tasks but aren't
+        initialized with init_celery_app, like the web app, to get the queue
+        time and continue the trace in the tasks.'''
+        from celery import signals # pylint: disable=import-outside-toplevel
+        signals.before_task_publish.connect(stamp_published_at)
+        signals.before_task_publish.connect(stamp_trace_ids)
+
+
+def stamp_published_at(headers=None, **kwargs): # pylint: disable=unused-argument
+    '''Handler for celery's before_task_publish signal.'''
+    if headers is not None:
+        headers[PUBLISHED_AT_HEADER] = time.time()
+
+
+def stamp_trace_ids(headers=None, **kwargs): # pylint: disable=unused-argument
+    '''Handler for celery's before_task_publish signal, making tasks
+    published during a request or task part of its trace.'''
+    if headers is None or not has_app_context():
+        return
+
+    context = get_context()
+    trace_id = context.get('trace_id')
+    if trace_id is not None:
+        headers[TRACEPARENT_HEADER] = format_traceparent(trace_id, context['span_id'])
+    request_id = context.get('request_id')
+    if request_id is not None:
+        headers[REQUEST_ID_HEADER] = request_id
+
+
+def stamp_received_at(request=None, **kwargs): # pylint: disable=unused-argument
+    '''Handler for celery's task_received signal, in the worker's main process.'''
+    request_dict = getattr(request, 'request_dict', None)
+    if request_dict is not None:
+        request_dict[RECEIVED_AT_KEY] = time.time()
+
+
+def add_task_timings(record, task_request, started_at):
+    '''Add the retry count and the time the task waited before it started
+    at `started_at`, as a unix timestamp.'''
+    record.set('task_retries', task_request.retries or 0)
+
+    published_at = task_request.get(PUBLISHED_AT_HEADER)
+    received_at = task_request.get(RECEIVED_AT_KEY)
+    eta = parse_eta(task_request.eta)
+
+    if published_at is not None and eta is not None:
+        record.set('task_eta_delay', _seconds_between(published_at, eta), 'seconds')
+
+    if published_at is not None:
+        # Without the received stamp the broker and worker waits can't be told
+        # apart, so it's all counted as queue time
+        queue_end = received_at if received_at is not None else started_at
+        queue_time = _seconds_between(published_at, queue_end)
+        if received_at is None and eta is not None:
+            queue_time = _seconds_between(max(published_at, eta), started_at)
+        record.set('task_queue_time', queue_time, 'seconds')
+
+    if received_at is not None:
+        ready_at = max(received_at, eta) if eta is not None else received_at
+        record.set('task_prefetch_time', _seconds_between(ready_at, started_at), 'seconds')
+
+
+def parse_eta(eta):
+    '''The eta of a task request as a unix timestamp, or None if it has none.'''
+    if eta is None:
+        return None
+    if isinstance(eta, str):
+        eta = datetime.datetime.fromisoformat(eta)
+    if eta.tzinfo is None:
+        # Naive etas are in UTC
+        eta = eta.replace(tzinfo=datetime.timezone.utc)
+    return eta.timestamp()
+
+
+def _seconds_between(start, end):
+    # Rounded to whole nanoseconds like the other durations
+    return max(0, round((end - start) * NS_PER_SECOND)) / NS_PER_SECOND
@@ -0,0 +1,114 @@
+'''
+Aggregate stats emitted next to the request events: the latency histograms,
+the host level stats shared by the worker processes and the outlet stats, and
+the time flask-events itself spends on requests with `EVENTS_PROFILE_SELF`.
+'''
+import atexit
+import functools
+
+from .context import get_context
+from .histograms import create_histograms
+from .shared import create_shared_stats
+from .supervisor import create_outlet_telemetry
+from .timing import clock_ns, ns_to_seconds
+
+
+class TelemetryMixin:
+    '''
+    The aggregate stats methods of Events, kept in its `histograms`,
+    `shared_stats` and `outlet_telemetry`.
+    '''
+
+    def _init_telemetry(self, config):
+        if self.histograms is not None:
+            self.flush_histograms()
+            atexit.unregister(self.flush_histograms)
+        self.histograms = create_histograms(config)
+        if self.histograms is not None:
+            # Registered after the dispatcher so the last histograms are
+            # emitted before it's closed
+            atexit.register(self.flush_histograms)
+
+        self.shared_stats = create_shared_stats(config)
+        if self.outlet_telemetry is not None:
+            atexit.unregister(self.flush_outlet_telemetry)
+        self.outlet_telemetry = create_outlet_telemetry(config)
+        if self.outlet_telemetry is not None:
+            atexit.register(self.flush_outlet_telemetry)
+
+
+    def flush_histograms(self):
+        '''Emit the histograms collected since the last flush.'''
+        if self.histograms is None:
+            return
+        for record in self.histograms.collect():
+            self._emit(record)
+
+
+    def collect_shared_stats(self, force=True):
+        '''Emit the host level stats from all the worker processes, unless
+        another process is already doing it. Without `force` the stats are
+        only emitted if the interval has passed.'''
+        if self.shared_stats is None:
+            return
+        record = self.shared_stats.collect(force=force)
+        if record is not None:
+            self._emit(record)
+
+
+    def outlet_stats(self):
+        '''Stats of the calls to each outlet, by the outlet's class name.'''
+        stats = {}
+        for supervisor in self._get_supervisors():
+            name = supervisor.name
+            if name in stats:
+                name = '%s_%d' % (name, len(stats))
+            stats[name] = supervisor.stats()
+        return stats
+
+
+    def flush_outlet_telemetry(self, force=True):
+        '''Emit the outlet stats since the last flush. Without `force` they're
+        only emitted if the interval has passed.'''
+        if self.outlet_telemetry is None:
+            return
+        for record in self.outlet_telemetry.collect(self._get_supervisors(), force=force):
+            self._dispatch(record)
+
+
+    def _record_request_stats(self, context, request_total, query_stats):
+        '''Add a finished request to the histograms and shared stats, which
+        count every request, sampled or not.'''
+        if self.histograms is not None:
+            histogram_key = context.get('histogram_key')
+            if histogram_key is not None:
+                self.histograms.record(histogram_key, request_total, query_stats)
+            if self.histograms.is_due():
+                self.flush_histograms()
+
+        if self.shared_stats is not None:
+            self.shared_stats.record(context.get('response_status', 500), request_total,
+                query_stats)
+            if self.shared_stats.is_due():
+                self.collect_shared_stats(force=False)
+
+
+def profile_self(hook):
+    '''Wrap a request hook to add the time spent in it to the time
+    flask-events spends on the request.'''
+    @functools.wraps(hook)
+    def profiled_hook(*args):
+        start = clock_ns()
+        try:
+            return hook(*args)
+        finally:
+            context = get_context()
+            context['self_time'] = context.get('self_time', 0) + clock_ns() - start
+    return profiled_hook
+
+
+def add_self_time(record, context, start):
+    '''Add the time flask-events spent on the request, from the profiled hooks
+    and since it started finishing the request at `start`.'''
+    self_time = context.get('self_time', 0) + clock_ns() - start
+    record.set('flask_events_self_time', ns_to_seconds(self_time), 'seconds')
@@ -0,0 +1,58 @@
+'''
+Durations are measured with a monotonic high-resolution clock and kept as
+integer nanoseconds until they're added to an event.
+'''
+import re
+import time
+
+clock_ns = time.perf_counter_ns
+
+NS_PER_SECOND = 1000000000
+
+_REQUEST_START_RE = re.compile(r'(?:t=)?(\d+(?:\.\d+)?)')
+
+# Timestamps above the threshold are assumed to be in nano-, micro- or
+# milliseconds, and seconds if below them all. The second element is the
+# number of decimals needed to convert it to nanoseconds.
+_UNITS = (
+    (10**17, 0),
+    (10**14, 3),
+    (10**11, 6),
+    (0, 9),
+)
+
+
+def ns_to_seconds(nanoseconds):
+    return nanoseconds / NS_PER_SECOND
+
+
+def parse_request_start(header_value):
+    '''Parse the time the request was received by an upstream proxy from a
+    `X-Request-Start` or `X-Queue-Start` style header, like `t=1577836800.123`.
+    The unit is guessed from the magnitude, since seconds, milliseconds and
+    microseconds are all in use. Returns wall clock nanoseconds or None.
+    '''
+    match = _REQUEST_START_RE.search(header_value)
+    if not match:
+        return None
+
+    # Parsed without going through float to not lose precision
+    whole, _, fraction = match.group(1).partition('.')
+    whole = int(whole)
+    for threshold, fraction_digits in _UNITS:
+        if whole > threshold:
+            break
+
+    fraction = int((fraction + '0' * fraction_digits)[:fraction_digits] or 0)
+    return whole * 10**fraction_digits + fraction
+
+
+def get_queue_time_ns(header_value):
+    '''Time from the upstream proxy received the request until now, or None
+    if the header can't be parsed. This has to use the wall clock to compare
+    with the proxy, thus clock skew could make it negative, which is clamped to 0.
+    '''
+    request_start = parse_request_start(header_value)
+    if request_start is None:
+        return None
+    return max(0, time.time_ns() - request_start)
@@ -1,3 +1,6 @@
+import os
+import weakref
+
 UNITS = (
     (2**40.0, 'TB'),
     (2**30.0, 'GB'),
@@ -25,3 +28,21 @@ def _hfloat(value, precision=4):
     """
     i = int(value)
     return i if i == value else '{0:.{precision}}'.format(value, precision=precision)
+
+
+def register_after_fork(method):
+    """Call the bound `method` in forked children, for as long as its object
+    is alive. Fork hooks can't be unregistered, so the object is only
+    referenced weakly to let it be garbage collected.
+    """
+    if not hasattr(os, 'register_at_fork'):
+        return
+
+    reference = weakref.WeakMethod(method)
+
+    def after_fork():
+        callback = reference()
+        if callback is not None:
+            callback()
+
+    os.register_at_fork(after_in_child=after_fork)
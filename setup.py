@@ -22,7 +22,8 @@ setup(
     install_requires=[
         'libhoney >= 1.3.0',
     ],
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
+    python_requires='>=3.7',
     license='Hippocratic-2.1',
     classifiers=[
         # 'Development Status :: 1 - Planning',
@@ -38,8 +39,6 @@ setup(
         'Intended Audience :: System Administrators',
         'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3 :: Only',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Topic :: System :: Logging',
@@ -0,0 +1,72 @@
+'''
+A local stand-in for the Honeycomb batch API, to test and benchmark the
+libhoney outlet without network access.
+'''
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeHoneycomb:
+    def __init__(self, status=202):
+        self.status = status
+        self.events = []
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._received = threading.Condition(self._lock)
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._create_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+
+    @property
+    def api_host(self):
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+
+    def start(self):
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+    def wait_for_events(self, count, timeout=5):
+        with self._lock:
+            return self._received.wait_for(lambda: len(self.events) >= count, timeout=timeout)
+
+
+    def _record(self, events):
+        with self._lock:
+            self.events.extend(events)
+            self.batches += 1
+            self._received.notify_all()
+
+
+    def _create_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self): # pylint: disable=invalid-name
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Content-Encoding') == 'gzip' or body[:2] == b'\x1f\x8b':
+                    body = gzip.decompress(body)
+                events = json.loads(body.decode('utf-8'))
+                fake._record(events) # pylint: disable=protected-access
+
+                response = json.dumps([{'status': fake.status} for _ in events]).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+
+            def log_message(self, format, *args): # pylint: disable=redefined-builtin
+                pass
+
+        return Handler
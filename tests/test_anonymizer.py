@@ -23,3 +23,36 @@ def test_anonymizer_custom_mask(ipv4_mask, ipv6_mask, original_ip, expected):
     anonymizer = Anonymizer(ipv4_mask, ipv6_mask)
     ip = anonymizer.anonymize(original_ip)
     assert ip == expected
+
+
+def test_anonymizer_cache():
+    anonymizer = Anonymizer()
+    assert anonymizer.anonymize('1.2.3.4') == '1.2.3.0'
+    assert anonymizer.anonymize('1.2.3.4') == '1.2.3.0'
+    assert anonymizer.anonymize('1.2.3.5') == '1.2.3.0'
+
+    cache_info = anonymizer.cache_info()
+    assert cache_info.hits == 1
+    assert cache_info.misses == 2
+
+
+def test_anonymizer_cache_bounded():
+    anonymizer = Anonymizer(cache_size=2)
+    for address in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+        anonymizer.anonymize(address)
+
+    assert anonymizer.cache_info().currsize == 2
+
+
+def test_anonymize_many():
+    anonymizer = Anonymizer()
+    assert anonymizer.anonymize_many(iter([
+        '10.0.0.1',
+        '2001:1db8:85a3:3a4b:1a2a:8a2e:0370:7334',
+        '10.0.0.1',
+    ])) == ['10.0.0.0', '2001:1db8:85a3::', '10.0.0.0']
+
+
+def test_anonymize_invalid_ip():
+    with pytest.raises(ValueError):
+        Anonymizer().anonymize('not an ip')
@@ -0,0 +1,231 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from flask_events import Events
+from flask_events.dispatcher import AsyncioDispatcher
+from flask_events.supervisor import send_batch_to_outlet
+
+from .conftest import create_app, CapturingOutlet
+
+# pylint: disable=redefined-outer-name
+
+
+def test_instrument_coroutine(app):
+    @app.events.instrument()
+    async def some_coroutine(first_arg, delay): # pylint: disable=unused-argument
+        await asyncio.sleep(delay)
+
+    assert asyncio.iscoroutinefunction(some_coroutine)
+
+    with app.app_context():
+        asyncio.run(some_coroutine('bar', delay=0.02))
+
+    event_data = app.test_outlet.event_data
+    assert event_data['func_name'] == 'some_coroutine'
+    assert event_data['first_arg'] == 'bar'
+    assert event_data['delay'] == 0.02
+    assert event_data['duration'].value >= 0.02
+    assert 'error' not in event_data
+
+
+def test_instrument_coroutine_with_exception(app):
+    @app.events.instrument()
+    async def some_coroutine():
+        await asyncio.sleep(0)
+        raise ValueError('thing broke')
+
+    with app.app_context():
+        asyncio.run(some_coroutine())
+
+    assert app.test_outlet.event_data['error'] == 'ValueError'
+    assert app.test_outlet.event_data['error_msg'] == 'thing broke'
+
+
+def test_instrument_coroutine_returns_result(app):
+    @app.events.instrument()
+    async def some_coroutine(value):
+        await asyncio.sleep(0)
+        return value * 2
+
+    with app.app_context():
+        assert asyncio.run(some_coroutine(2)) == 4
+
+
+def test_instrument_coroutine_raise_errors(app):
+    @app.events.instrument(raise_errors=True)
+    async def some_coroutine():
+        await asyncio.sleep(0)
+        raise ValueError('thing broke')
+
+    with app.app_context():
+        with pytest.raises(ValueError):
+            asyncio.run(some_coroutine())
+
+    assert app.test_outlet.event_data['error'] == 'ValueError'
+
+
+def test_async_outlet_without_dispatcher():
+    app = create_app()
+    events = Events(app)
+    outlet = AsyncOutlet()
+    events.outlets = [outlet]
+
+    app.test_client().get('/')
+
+    assert [event['status'] for event in outlet.events] == [200]
+
+
+def test_async_outlet_from_running_loop():
+    app = create_app()
+    events = Events(app)
+    outlet = AsyncOutlet()
+    events.outlets = [outlet]
+
+    @events.instrument()
+    async def some_coroutine():
+        await asyncio.sleep(0)
+
+    async def main():
+        await some_coroutine()
+        # The outlet is called from a task scheduled on the loop
+        await asyncio.sleep(0.01)
+
+    with app.app_context():
+        asyncio.run(main())
+
+    assert [event['func_name'] for event in outlet.events] == ['some_coroutine']
+    assert events.outlet_stats()['AsyncOutlet']['calls'] == 1
+
+
+def test_send_batch_to_async_outlet_from_running_loop():
+    outlet = AsyncOutlet()
+
+    async def main():
+        send_batch_to_outlet(outlet, ['event'])
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+
+    assert outlet.events == ['event']
+
+
+def test_async_outlet_with_thread_dispatcher():
+    app = create_app()
+    app.config['EVENTS_DISPATCHER'] = True
+    events = Events(app)
+    outlet = AsyncOutlet()
+    events.outlets = [outlet]
+
+    app.test_client().get('/')
+    events.dispatcher.close()
+
+    assert [event['status'] for event in outlet.events] == [200]
+
+
+def test_asyncio_dispatcher(asyncio_app):
+    async_outlet = AsyncOutlet()
+    sync_outlet = ThreadCapturingOutlet()
+    asyncio_app.events.outlets = [async_outlet, sync_outlet]
+
+    client = asyncio_app.test_client()
+    for _ in range(3):
+        client.get('/')
+
+    assert asyncio_app.events.dispatcher.flush(timeout=2)
+    assert [event['path'] for event in async_outlet.events] == ['/', '/', '/']
+    assert sync_outlet.event_data['path'] == '/'
+    assert sync_outlet.thread is not threading.current_thread()
+    asyncio_app.events.dispatcher.close()
+
+
+def test_asyncio_dispatcher_runs_outlets_concurrently(asyncio_app):
+    outlets = [AsyncOutlet(delay=0.2) for _ in range(3)]
+    asyncio_app.events.outlets = outlets
+
+    asyncio_app.test_client().get('/')
+
+    start = time.monotonic()
+    assert asyncio_app.events.dispatcher.flush(timeout=2)
+    assert time.monotonic() - start < 0.5
+    assert all(len(outlet.events) == 1 for outlet in outlets)
+    asyncio_app.events.dispatcher.close()
+
+
+def test_asyncio_dispatcher_isolates_failing_outlet(asyncio_app):
+    outlet = AsyncOutlet()
+    asyncio_app.events.outlets = [FailingAsyncOutlet(), outlet]
+
+    asyncio_app.test_client().get('/')
+    asyncio_app.events.dispatcher.close()
+
+    assert len(outlet.events) == 1
+
+
+def test_asyncio_dispatcher_close_without_worker():
+    batches = []
+
+    async def send_batch(batch):
+        await asyncio.sleep(0)
+        batches.append(batch)
+
+    dispatcher = AsyncioDispatcher(send_batch, flush_interval=10)
+    dispatcher.put('event')
+    dispatcher.close()
+
+    assert batches == [['event']]
+
+
+def test_async_view_with_asyncio_dispatcher(asyncio_app):
+    pytest.importorskip('asgiref')
+
+    @asyncio_app.route('/async')
+    async def async_view(): # pylint: disable=unused-variable
+        await asyncio.sleep(0.01)
+        return 'Async'
+
+    outlet = AsyncOutlet()
+    asyncio_app.events.outlets = [outlet]
+
+    asyncio_app.test_client().get('/async')
+    asyncio_app.events.dispatcher.close()
+
+    assert outlet.events[0]['request_total'].value >= 0.01
+
+
+class AsyncOutlet:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.events = []
+
+
+    async def handle_batch(self, events):
+        await asyncio.sleep(self.delay)
+        self.events.extend(events)
+
+
+class FailingAsyncOutlet:
+    async def handle_batch(self, events):
+        raise ValueError('outlet broke')
+
+
+class ThreadCapturingOutlet(CapturingOutlet):
+    def __init__(self):
+        super().__init__()
+        self.thread = None
+
+
+    def handle(self, event_data):
+        super().handle(event_data)
+        self.thread = threading.current_thread()
+
+
+@pytest.fixture
+def asyncio_app():
+    app = create_app()
+    app.config['EVENTS_DISPATCHER'] = 'asyncio'
+    app.config['EVENTS_DISPATCHER_FLUSH_INTERVAL'] = 0.01
+    app.events = Events(app)
+    return app
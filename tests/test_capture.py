@@ -0,0 +1,150 @@
+import datetime
+import decimal
+import json
+import uuid
+
+import pytest
+from flask import Flask
+
+from flask_events import Events
+from flask_events.capture import SKIP, CapturePolicy, LazyRepr, bounded_repr
+from flask_events.outlets.logfmt import format_event
+from flask_events.serialization import dumps, flatten
+
+from .conftest import CapturingOutlet
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.mark.parametrize('value', [1, 1.5, True, None])
+def test_capture_scalars_unchanged(value):
+    assert CapturePolicy().capture('arg', value) is value
+
+
+def test_capture_truncates_strings():
+    policy = CapturePolicy(max_length=5)
+    assert policy.capture('arg', 'short') == 'short'
+    assert policy.capture('arg', 'much too long') == 'much ...[8 more chars]'
+
+
+@pytest.mark.parametrize('value,expected', [
+    (b'x' * 5 * 2**20, '<bytes 5MB>'),
+    (bytearray(10), '<bytearray 10B>'),
+    (list(range(1000)), '<list len=1000>'),
+    (dict.fromkeys(range(101)), '<dict len=101>'),
+])
+def test_capture_summaries(value, expected):
+    assert CapturePolicy().capture('arg', value) == expected
+
+
+@pytest.mark.parametrize('value', [
+    datetime.datetime(2020, 1, 1, 12, 30),
+    datetime.date(2020, 1, 1),
+    datetime.timedelta(seconds=5),
+    decimal.Decimal('1.5'),
+    uuid.UUID(int=1),
+    [1, 'a', None],
+    {'key': datetime.date(2020, 1, 1)},
+])
+def test_capture_plain_values_unchanged(value):
+    assert CapturePolicy().capture('arg', value) is value
+
+
+def test_capture_plain_values_are_serialized():
+    policy = CapturePolicy()
+    event = {
+        'day': policy.capture('day', datetime.date(2020, 1, 1)),
+        'amounts': policy.capture('amounts', [decimal.Decimal('1.5')]),
+    }
+    assert json.loads(dumps(flatten(event))) == {'day': '2020-01-01', 'amounts': [1.5]}
+
+
+def test_capture_lazy_repr():
+    value = ['abcdefghij'] * 50
+    captured = CapturePolicy(max_length=20).capture('arg', value)
+    assert isinstance(captured, LazyRepr)
+    assert captured.value is value
+    assert str(captured) == "['abcdefghij', 'abcd..."
+    assert str(captured) is str(captured)
+
+
+@pytest.mark.parametrize('value', [
+    [[1, 2], {'a': (3,)}, {4}, frozenset([5]), ()],
+    {'nested': [{}]},
+])
+def test_bounded_repr_matches_repr(value):
+    assert bounded_repr(value, 1000) == repr(value)
+
+
+def test_bounded_repr_stops_at_max_length():
+    value = [['x' * 10**6]] * 10**6
+    assert bounded_repr(value, 10) == "[['xxxxxxx..."
+
+    recursive = []
+    recursive.append(recursive)
+    assert bounded_repr(recursive, 100) == '[[[[[[...]]]]]]'
+
+
+def test_capture_allow_and_deny():
+    policy = CapturePolicy(allow=['user_id', 'password'], deny=['password'])
+    assert policy.capture('user_id', 1) == 1
+    assert policy.capture('password', 'hunter2') is SKIP
+    assert policy.capture('other', 2) is SKIP
+
+
+def test_lazy_repr_is_only_stringified_when_serialized():
+    class Tracked:
+        stringified = 0
+
+        def __str__(self):
+            Tracked.stringified += 1
+            return 'tracked'
+
+    captured = CapturePolicy().capture('arg', Tracked())
+    assert Tracked.stringified == 0
+
+    event = {'arg': captured}
+    assert format_event(event) == 'arg=tracked'
+    assert json.loads(dumps(flatten(event))) == {'arg': 'tracked'}
+    assert Tracked.stringified == 1
+
+
+def test_instrument_uses_capture_policy(app):
+    app.config['EVENTS_CAPTURE_MAX_LENGTH'] = 10
+    app.config['EVENTS_CAPTURE_DENY'] = ['secret']
+    app.events.init_app(app)
+    app.events.outlets = [app.test_outlet]
+
+    @app.events.instrument()
+    def some_func(payload, secret, *args, **kwargs): # pylint: disable=unused-argument
+        pass
+
+    with app.app_context():
+        some_func('x' * 100, 'hunter2', b'\x00' * 2048, items=list(range(500)))
+
+    event_data = app.test_outlet.event_data
+    assert event_data['payload'] == 'xxxxxxxxxx...[90 more chars]'
+    assert 'secret' not in event_data
+    assert event_data['args_0'] == '<bytes 2kB>'
+    assert event_data['items'] == '<list len=500>'
+
+
+def test_celery_retval_uses_capture_policy():
+    # pylint: disable=import-outside-toplevel
+    from celery import signals
+    from .test_celery import clean_celery_signal_receivers, fake_test_task
+
+    app = Flask('test_app')
+    app.config['EVENTS_CAPTURE_MAX_LENGTH'] = 4
+    app.test_outlet = CapturingOutlet()
+    app.events = Events()
+    app.events.init_celery_app(app)
+    app.events.outlets = [app.test_outlet]
+    try:
+        signals.task_prerun.send(sender='foo', task=fake_test_task, args=['first'])
+        signals.task_postrun.send(sender='foo', retval='long result')
+    finally:
+        clean_celery_signal_receivers(signals.task_prerun)
+        clean_celery_signal_receivers(signals.task_postrun)
+
+    assert app.test_outlet.event_data['retval'] == 'long...[7 more chars]'
@@ -1,8 +1,16 @@
+import datetime
+import time
+
 from celery import Celery, signals
+from celery.contrib.testing.worker import start_worker
 import pytest
 from flask import Flask
 
 from flask_events import Events
+from flask_events.context import RequestSlot, current_slot, get_context
+from flask_events.record import EventRecord
+from flask_events.tasks import (PUBLISHED_AT_HEADER, RECEIVED_AT_KEY, REQUEST_ID_HEADER,
+    add_task_timings, parse_eta, stamp_trace_ids)
 
 from .conftest import CapturingOutlet
 
@@ -21,6 +29,28 @@ def pos_or_kwargs(posarg, either=None, *varargs): # pylint: disable=unused-argum
     pass
 
 
+broker_celery = Celery('broker_tasks', broker='memory://', backend='cache+memory://')
+broker_celery.conf.broker_transport_options = {'polling_interval': 0.01}
+
+
+@broker_celery.task(name='slow_task')
+def slow_task(delay):
+    time.sleep(delay)
+    return 'done'
+
+
+@broker_celery.task(name='failing_task')
+def failing_task():
+    raise ValueError('task broke')
+
+
+@broker_celery.task(name='retried_task', bind=True, max_retries=2)
+def retried_task(self):
+    if self.request.retries < 2:
+        raise self.retry(countdown=0)
+    return self.request.retries
+
+
 @pytest.mark.usefixtures('clean_celery_signals')
 def test_celery_app(celery_app):
     signals.task_prerun.send(sender='foo', task=fake_test_task)
@@ -73,6 +103,236 @@ def test_celery_kwargs(celery_app):
     assert celery_app.test_outlet.event_data['somekey'] == 'somevalue'
 
 
+@pytest.mark.usefixtures('clean_celery_signals')
+def test_celery_app_context_is_popped(celery_app):
+    with celery_app.app_context() as outer_context:
+        signals.task_prerun.send(sender='foo', task=fake_test_task)
+        signals.task_postrun.send(sender='foo')
+
+        from flask.globals import app_ctx # pylint: disable=import-outside-toplevel
+        assert app_ctx._get_current_object() is outer_context # pylint: disable=protected-access
+
+
+@pytest.mark.usefixtures('clean_celery_signals')
+def test_celery_task_failure(celery_app):
+    signals.task_prerun.send(sender='foo', task=fake_test_task)
+    signals.task_failure.send(sender=fake_test_task, exception=KeyError('missing'))
+    signals.task_postrun.send(sender='foo', state='FAILURE')
+
+    assert celery_app.test_outlet.event_data['error'] == 'KeyError'
+    assert celery_app.test_outlet.event_data['error_msg'] == "'missing'"
+    assert celery_app.test_outlet.event_data['state'] == 'FAILURE'
+
+
+@pytest.mark.usefixtures('clean_celery_signals')
+def test_celery_task_in_middleware_request(celery_app):
+    slot = RequestSlot({}, 0)
+    token = current_slot.set(slot)
+    try:
+        signals.task_prerun.send(sender='foo', task=fake_test_task)
+        signals.task_postrun.send(sender='foo')
+        assert current_slot.get() is slot
+    finally:
+        current_slot.reset(token)
+
+    assert celery_app.test_outlet.event_data['task'] == 'test_task'
+    assert slot.context == {'request_start_time': 0}
+
+
+def test_task_timings():
+    published_at = 1000.0
+    request = FakeRequest({
+        PUBLISHED_AT_HEADER: published_at,
+        RECEIVED_AT_KEY: published_at + 2,
+    }, retries=1, eta='1970-01-01T00:16:50+00:00')
+    record = EventRecord()
+
+    add_task_timings(record, request, published_at + 15)
+
+    assert record['task_retries'] == 1
+    assert record['task_queue_time'] == (2, 'seconds')
+    assert record['task_eta_delay'] == (10, 'seconds')
+    assert record['task_prefetch_time'] == (5, 'seconds')
+
+
+def test_task_timings_without_stamps():
+    record = EventRecord()
+    add_task_timings(record, FakeRequest({}), time.time())
+    assert record.items() == [('task_retries', 0)]
+
+
+def test_task_timings_without_received_stamp():
+    record = EventRecord()
+    add_task_timings(record, FakeRequest({PUBLISHED_AT_HEADER: 1000.0}), 1003.0)
+    assert record['task_queue_time'] == (3, 'seconds')
+    assert 'task_prefetch_time' not in record
+
+
+def test_task_timings_clamped():
+    record = EventRecord()
+    add_task_timings(record, FakeRequest({PUBLISHED_AT_HEADER: 1000.0}), 999.0)
+    assert record['task_queue_time'] == (0, 'seconds')
+
+
+@pytest.mark.parametrize('eta,expected', [
+    (None, None),
+    ('1970-01-01T00:00:10+00:00', 10),
+    ('1970-01-01T01:00:10+01:00', 10),
+    (datetime.datetime(1970, 1, 1, 0, 0, 10), 10),
+])
+def test_parse_eta(eta, expected):
+    assert parse_eta(eta) == expected
+
+
+@pytest.mark.usefixtures('clean_celery_signals', 'celery_worker')
+def test_celery_worker_timings(celery_app):
+    slow_task.apply_async((0.05,)).get(timeout=10)
+
+    event_data = wait_for_event(celery_app.test_outlet, 'SUCCESS')
+    assert event_data['task'] == 'slow_task'
+    assert event_data['retval'] == 'done'
+    assert event_data['task_total'].value >= 0.05
+    assert event_data['task_retries'] == 0
+    assert 0 <= event_data['task_queue_time'].value < 5
+    assert 0 <= event_data['task_prefetch_time'].value < 5
+    assert 'task_eta_delay' not in event_data
+
+
+@pytest.mark.usefixtures('clean_celery_signals', 'celery_worker')
+def test_celery_worker_eta(celery_app):
+    slow_task.apply_async((0,), countdown=0.3).get(timeout=10)
+
+    event_data = wait_for_event(celery_app.test_outlet, 'SUCCESS')
+    assert event_data['task_eta_delay'].value == pytest.approx(0.3, abs=0.05)
+    assert event_data['task_prefetch_time'].value < 0.3
+
+
+@pytest.mark.usefixtures('clean_celery_signals', 'celery_worker')
+def test_celery_worker_failure(celery_app):
+    result = failing_task.apply_async()
+    with pytest.raises(ValueError):
+        result.get(timeout=10)
+
+    event_data = wait_for_event(celery_app.test_outlet, 'FAILURE')
+    assert event_data['error'] == 'ValueError'
+    assert event_data['error_msg'] == 'task broke'
+
+
+@pytest.mark.usefixtures('clean_celery_signals', 'celery_worker')
+def test_celery_worker_retries(celery_app):
+    assert retried_task.apply_async().get(timeout=10) == 2
+
+    assert wait_for_event(celery_app.test_outlet, 'SUCCESS')['task_retries'] == 2
+
+
+def test_stamp_trace_ids(celery_app):
+    headers = {}
+    stamp_trace_ids(headers=headers)
+    assert not headers
+
+    with celery_app.app_context():
+        context = get_context()
+        context.update(trace_id='0af7651916cd43dd8448eb211c80319c', span_id='b7ad6b7169203331',
+            request_id='myrequestid')
+        stamp_trace_ids(headers=headers)
+
+    assert headers == {
+        'traceparent': '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01',
+        REQUEST_ID_HEADER: 'myrequestid',
+    }
+
+
+def create_publishing_app():
+    app = Flask('test_app')
+    events = Events(app)
+
+    @app.route('/publish')
+    def publish(): # pylint: disable=unused-variable
+        headers = {}
+        signals.before_task_publish.send(sender='test_task', headers=headers)
+        return headers
+
+    return app, events
+
+
+def test_init_celery_producer_stamps_trace_ids():
+    app, events = create_publishing_app()
+    events.init_celery_producer()
+
+    try:
+        response = app.test_client().get('/publish', headers={
+            'traceparent': '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01',
+        })
+    finally:
+        clean_celery_signal_receivers(signals.before_task_publish)
+
+    headers = response.get_json()
+    assert headers['traceparent'].startswith('00-0af7651916cd43dd8448eb211c80319c-')
+    assert headers[REQUEST_ID_HEADER] == '0af7651916cd43dd8448eb211c80319c'
+
+
+def test_init_app_does_not_connect_to_celery():
+    app, _ = create_publishing_app()
+
+    try:
+        response = app.test_client().get('/publish', headers={
+            'traceparent': '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01',
+        })
+    finally:
+        clean_celery_signal_receivers(signals.before_task_publish)
+
+    assert response.get_json() == {}
+
+
+@pytest.mark.usefixtures('clean_celery_signals', 'celery_worker')
+def test_celery_worker_joins_trace(celery_app):
+    with celery_app.app_context():
+        context = get_context()
+        context.update(trace_id='0af7651916cd43dd8448eb211c80319c', span_id='b7ad6b7169203331',
+            request_id='myrequestid')
+        slow_task.apply_async((0,)).get(timeout=10)
+
+    event_data = wait_for_event(celery_app.test_outlet, 'SUCCESS')
+    assert event_data['request_id'] == 'myrequestid'
+    assert event_data['trace.trace_id'] == '0af7651916cd43dd8448eb211c80319c'
+    assert event_data['trace.parent_id'] == 'b7ad6b7169203331'
+    assert len(event_data['trace.span_id']) == 16
+
+
+@pytest.mark.usefixtures('clean_celery_signals')
+def test_celery_task_generates_ids(celery_app):
+    signals.task_prerun.send(sender='foo', task=fake_test_task)
+    signals.task_postrun.send(sender='foo')
+
+    event_data = celery_app.test_outlet.event_data
+    assert event_data['request_id'] == event_data['trace.trace_id']
+    assert 'trace.parent_id' not in event_data
+
+
+def wait_for_event(outlet, state, timeout=5):
+    # The result is stored before task_postrun is sent, so the event might
+    # not have been emitted yet when the result is ready
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if outlet.event_data is not None and outlet.event_data.get('state') == state:
+            return outlet.event_data
+        time.sleep(0.01)
+    raise AssertionError('No event with state %s, last event was %r' % (state, outlet.event_data))
+
+
+@pytest.fixture(scope='module')
+def celery_worker():
+    with start_worker(broker_celery, pool='solo', perform_ping_check=False) as worker:
+        yield worker
+
+
+class FakeRequest(dict):
+    def __init__(self, headers, retries=0, eta=None):
+        super().__init__(headers)
+        self.retries = retries
+        self.eta = eta
+
+
 @pytest.fixture
 def celery_app():
     app = Flask('test_app')
@@ -89,6 +349,7 @@ def clean_celery_signals():
         yield
     finally:
         clean_celery_signal_receivers(signals.task_prerun)
+        clean_celery_signal_receivers(signals.task_failure)
         clean_celery_signal_receivers(signals.task_postrun)
 
 
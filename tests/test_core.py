@@ -1,10 +1,13 @@
 import os
+import time
 from unittest import mock
 
 import pytest
 from flask import Flask
 
 from flask_events import Events, UnitedMetric
+from flask_events.instrument import ArgumentSpec, get_argument_spec
+from flask_events.params import HandlerCache
 
 from .conftest import app_factory, create_app, CapturingOutlet
 
@@ -41,6 +44,21 @@ def test_anonymize_ips(forwarded_for, expected):
     assert client.application.test_outlet.event_data['fwd'] == expected
 
 
+def test_anonymizer_created_once_per_app():
+    app = create_app()
+    app.config['EVENTS_ANONYMIZE_IPS'] = True
+    events = Events(app)
+    app.test_outlet = CapturingOutlet()
+    events.outlets = [app.test_outlet]
+    client = app.test_client()
+    for _ in range(3):
+        client.get('/', headers={'X-Forwarded-For': '1.2.3.4'})
+
+    anonymizer = app.extensions['flask_events_anonymizer']
+    assert anonymizer.cache_info().hits == 2
+    assert app.test_outlet.event_data['fwd'] == '1.2.3.0'
+
+
 @pytest.mark.parametrize('forwarded_for,expected', [
     ('1.2.3.4,5.6.7.8', '1.2.0.0,5.6.7.8'),
     ('2001:1db8:85a3:3a4b:1a2a:8a2e:0370:7334', '2001:1db8:85a3:3a4b::'),
@@ -158,3 +176,175 @@ def test_instrument_func_with_exception(app):
     assert app.test_outlet.event_data['error'] == 'ValueError'
     assert app.test_outlet.event_data['error_msg'] == 'thing broke'
     assert 'duration' in app.test_outlet.event_data
+
+
+def test_instrument_func_returns_result(app):
+    @app.events.instrument()
+    def some_func(value):
+        return value * 2
+
+    with app.app_context():
+        assert some_func(2) == 4
+
+    assert app.test_outlet.event_data['func_name'] == 'some_func'
+
+
+def test_instrument_func_raise_errors(app):
+    @app.events.instrument(raise_errors=True)
+    def some_func():
+        raise ValueError('thing broke')
+
+    with app.app_context():
+        with pytest.raises(ValueError):
+            some_func()
+
+    assert app.test_outlet.event_data['error'] == 'ValueError'
+    assert 'duration' in app.test_outlet.event_data
+
+
+def test_instrument_resolves_signature_once(app):
+    @app.events.instrument()
+    def some_func(first_arg): # pylint: disable=unused-argument
+        pass
+
+    with mock.patch('flask_events.instrument.inspect.signature') as signature:
+        with app.app_context():
+            some_func('bar')
+            some_func('zoo')
+
+    signature.assert_not_called()
+    assert app.test_outlet.event_data['first_arg'] == 'zoo'
+
+
+def test_argument_spec():
+    def func(first, second, *rest, keyword=None): # pylint: disable=unused-argument
+        pass
+
+    spec = get_argument_spec(func)
+    assert spec == ArgumentSpec(('first', 'second'), 'rest')
+    assert get_argument_spec(func) is spec
+
+
+def test_argument_spec_bound_method():
+    class Task:
+        def run(self, first, *args):
+            pass
+
+    task = Task()
+    spec = get_argument_spec(task.run)
+    assert spec == ArgumentSpec(('first',), 'args')
+    assert get_argument_spec(Task().run) is spec
+    assert get_argument_spec(Task.run) == ArgumentSpec(('self', 'first'), 'args')
+
+
+def test_argument_spec_not_weakrefable():
+    assert get_argument_spec(len) == ArgumentSpec(('obj',), 'args')
+
+
+def test_handler_after_redirect():
+    app = app_factory()
+
+    @app.route('/directory/')
+    def directory(): # pylint: disable=unused-variable
+        return 'Listing'
+
+    response = app.test_client().get('/directory')
+    assert response.status_code == 308
+    assert app.test_outlet.event_data['handler'] == (
+        'tests.test_core.test_handler_after_redirect.<locals>.directory')
+
+
+def test_no_handler_for_unknown_route(client):
+    response = client.get('/does-not-exist')
+    assert response.status_code == 404
+    assert 'handler' not in client.application.test_outlet.event_data
+
+
+def test_handler_cache_invalidated_by_new_view(app):
+    client = app.test_client()
+    client.get('/')
+    assert app.test_outlet.event_data['handler'].endswith('main_route')
+
+    def replacement_view():
+        return 'Replaced'
+
+    app.view_functions['main_route'] = replacement_view
+    client.get('/')
+    assert app.test_outlet.event_data['handler'].endswith('replacement_view')
+
+
+def test_handler_cache_bounded():
+    handler_cache = HandlerCache(maxsize=2)
+    view_functions = {
+        'first': create_app,
+        'second': app_factory,
+        'third': Events,
+    }
+    for endpoint in view_functions:
+        handler_cache.get(view_functions, endpoint)
+
+    assert len(handler_cache._handlers) <= 2 # pylint: disable=protected-access
+    assert handler_cache.get(view_functions, 'third') == 'flask_events.events.Events'
+    assert handler_cache.get(view_functions, 'missing') is None
+
+
+def test_add_all_overridden_by_add(app):
+    app.events.add_all('version', 1)
+    app.events.add_all('env', 'test')
+    with app.test_request_context('/'):
+        app.preprocess_request()
+        app.events.add('version', 2)
+
+    event_data = app.test_outlet.event_data
+    assert list(event_data)[:2] == ['version', 'env']
+    assert event_data['version'] == 2
+
+
+def test_add_all_not_modified_by_requests(app):
+    app.events.add_all('version', 1)
+    app.test_client().get('/')
+
+    assert app.events.add_all_data.items() == [('version', 1)]
+
+
+def test_queue_time_header():
+    app = app_factory()
+    app.config['EVENTS_QUEUE_TIME_HEADER'] = 'X-Request-Start'
+    app.events.init_app(app)
+    app.events.outlets = [app.test_outlet]
+
+    with mock.patch('flask_events.timing.time.time_ns', return_value=1577836800500000000):
+        app.test_client().get('/', headers={'X-Request-Start': 't=1577836800250'})
+
+    assert app.test_outlet.event_data['time_queue'] == UnitedMetric(0.25, 'seconds')
+
+
+def test_no_queue_time_by_default(client):
+    client.get('/', headers={'X-Request-Start': 't=1577836800250'})
+    assert 'time_queue' not in client.application.test_outlet.event_data
+
+
+def test_profile_self():
+    app = create_app()
+    app.config['EVENTS_PROFILE_SELF'] = True
+    events = Events()
+    events.init_app(app)
+    outlet = CapturingOutlet()
+    events.outlets = [outlet]
+
+    @app.route('/slow')
+    def slow(): # pylint: disable=unused-variable
+        time.sleep(0.05)
+        return 'Slow'
+
+    app.test_client().get('/slow')
+
+    self_time = outlet.event_data['flask_events_self_time']
+    assert self_time.unit == 'seconds'
+    # The view isn't counted
+    assert 0 < self_time.value < 0.05
+
+
+def test_no_self_profile_by_default(client):
+    client.get('/')
+    assert 'flask_events_self_time' not in client.application.test_outlet.event_data
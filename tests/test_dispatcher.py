@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+from unittest import mock
+
+import pytest
+
+from flask_events import Events
+from flask_events.dispatcher import BatchDispatcher
+
+from .conftest import create_app, CapturingOutlet
+
+# pylint: disable=redefined-outer-name
+
+
+def test_dispatcher_batches():
+    batches = []
+    dispatcher = BatchDispatcher(batches.append, batch_size=10, flush_interval=0.01)
+    for i in range(25):
+        dispatcher.put(i)
+
+    assert dispatcher.flush(timeout=2)
+
+    assert [event for batch in batches for event in batch] == list(range(25))
+    assert all(len(batch) <= 10 for batch in batches)
+    assert dispatcher.stats() == {
+        'enqueued': 25,
+        'dropped': 0,
+        'flushed': 25,
+        'queued': 0,
+    }
+    dispatcher.close()
+
+
+@pytest.mark.parametrize('overflow,expected_events,expected_dropped', [
+    ('drop-newest', ['blocker', 0, 1], 2),
+    ('drop-oldest', ['blocker', 2, 3], 2),
+])
+def test_dispatcher_overflow(overflow, expected_events, expected_dropped, stalled_sender):
+    dispatcher = BatchDispatcher(stalled_sender, queue_size=2, batch_size=1, overflow=overflow)
+    dispatcher.put('blocker')
+    assert stalled_sender.started.wait(2)
+
+    for i in range(4):
+        dispatcher.put(i)
+
+    stalled_sender.release.set()
+    dispatcher.close()
+
+    assert stalled_sender.events == expected_events
+    assert dispatcher.dropped == expected_dropped
+    assert dispatcher.flushed == 3
+
+
+def test_dispatcher_overflow_block(stalled_sender):
+    dispatcher = BatchDispatcher(stalled_sender, queue_size=1, batch_size=1, overflow='block')
+    dispatcher.put('blocker')
+    assert stalled_sender.started.wait(2)
+    dispatcher.put(0)
+
+    producer = threading.Thread(target=dispatcher.put, args=(1,))
+    producer.start()
+    producer.join(0.05)
+    assert producer.is_alive()
+
+    stalled_sender.release.set()
+    producer.join(2)
+    dispatcher.close()
+
+    assert stalled_sender.events == ['blocker', 0, 1]
+    assert dispatcher.dropped == 0
+
+
+def test_dispatcher_invalid_overflow():
+    with pytest.raises(ValueError):
+        BatchDispatcher(list, overflow='explode')
+
+
+def test_dispatcher_close_flushes_and_rejects():
+    batches = []
+    dispatcher = BatchDispatcher(batches.append, flush_interval=10)
+    dispatcher.put('first')
+    dispatcher.close()
+
+    assert batches == [['first']]
+    assert not dispatcher.put('late')
+    assert dispatcher.dropped == 1
+
+
+def test_dispatcher_survives_failing_sender():
+    def failing_sender(batch): # pylint: disable=unused-argument
+        raise ValueError('outlet broke')
+
+    dispatcher = BatchDispatcher(failing_sender, flush_interval=0.01)
+    dispatcher.put('event')
+    assert dispatcher.flush(timeout=2)
+    assert dispatcher.flushed == 1
+    dispatcher.close()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_dispatcher_after_fork(tmpdir):
+    path = str(tmpdir.join('child.json'))
+    sent = []
+    dispatcher = BatchDispatcher(sent.extend, flush_interval=10)
+    dispatcher.put('parent')
+
+    # Fork while another thread holds the lock
+    locked = threading.Event()
+    release = threading.Event()
+
+    def hold_lock():
+        with dispatcher._lock: # pylint: disable=protected-access
+            locked.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    assert locked.wait(2)
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            dispatcher.put('child')
+            dispatcher.close()
+            with open(path, 'w') as child_file:
+                json.dump({'sent': sent, 'stats': dispatcher.stats()}, child_file)
+        finally:
+            os._exit(0) # pylint: disable=protected-access
+
+    release.set()
+    holder.join()
+    os.waitpid(pid, 0)
+    dispatcher.close()
+
+    assert sent == ['parent']
+    with open(path) as child_file:
+        assert json.load(child_file) == {
+            'sent': ['child'],
+            'stats': {'enqueued': 1, 'dropped': 0, 'flushed': 1, 'queued': 0},
+        }
+
+
+def test_dispatcher_close_unregisters_atexit():
+    dispatcher = BatchDispatcher(lambda batch: None)
+    with mock.patch('flask_events.dispatcher.atexit.unregister') as unregister:
+        dispatcher.close()
+        dispatcher.close()
+    unregister.assert_called_once_with(dispatcher.close)
+
+
+def test_app_with_dispatcher():
+    app = create_app()
+    app.config['EVENTS_DISPATCHER'] = True
+    app.config['EVENTS_DISPATCHER_FLUSH_INTERVAL'] = 0.01
+    events = Events(app)
+    test_outlet = CapturingOutlet()
+    events.outlets = [test_outlet]
+
+    response = app.test_client().get('/')
+    assert response.status_code == 200
+
+    assert events.dispatcher.flush(timeout=2)
+    assert test_outlet.event_data['status'] == 200
+    assert events.dispatcher.enqueued == 1
+    events.dispatcher.close()
+
+
+def test_app_dispatcher_uses_handle_batch():
+    app = create_app()
+    app.config['EVENTS_DISPATCHER'] = True
+    events = Events(app)
+    batch_outlet = BatchCapturingOutlet()
+    events.outlets = [batch_outlet]
+
+    client = app.test_client()
+    for _ in range(3):
+        client.get('/')
+
+    events.dispatcher.close()
+    assert [event['path'] for event in batch_outlet.events] == ['/', '/', '/']
+
+
+class BatchCapturingOutlet:
+    def __init__(self):
+        self.events = []
+
+
+    def handle_batch(self, batch):
+        self.events.extend(batch)
+
+
+class StalledSender:
+    def __init__(self):
+        self.events = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+
+    def __call__(self, batch):
+        self.started.set()
+        self.release.wait(2)
+        self.events.extend(batch)
+
+
+@pytest.fixture
+def stalled_sender():
+    return StalledSender()
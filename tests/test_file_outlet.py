@@ -0,0 +1,226 @@
+import gzip
+import json
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from flask_events import Events, UnitedMetric
+from flask_events.outlets.file import FileOutlet, HAS_ZSTANDARD, format_json
+from flask_events.outlets.logfmt import parse_logfmt
+from flask_events.record import EventRecord
+
+from .conftest import create_app
+
+# pylint: disable=redefined-outer-name
+
+
+def test_format_json():
+    record = EventRecord()
+    record.set('status', 200)
+    record.set('request_total', 0.5, 'seconds')
+    record.set('path', '/"quoted"\n')
+    record.set('obj', object)
+
+    assert json.loads(format_json(record)) == {
+        'status': 200,
+        'request_total_seconds': 0.5,
+        'path': '/"quoted"\n',
+        'obj': "<class 'object'>",
+    }
+    assert json.loads(format_json({'size': UnitedMetric(12, 'bytes')})) == {'size_bytes': 12}
+
+
+def test_file_outlet_ndjson(tmpdir):
+    path = str(tmpdir.join('events.ndjson'))
+    outlet = FileOutlet(path)
+    outlet.handle({'key': 'value'})
+    outlet.handle_batch([{'index': 1}, {'index': 2}])
+
+    # Buffered until flushed
+    assert not os.path.exists(path)
+    outlet.close()
+
+    assert read_lines(path) == [{'key': 'value'}, {'index': 1}, {'index': 2}]
+
+
+def test_file_outlet_logfmt(tmpdir):
+    path = str(tmpdir.join('events.log'))
+    outlet = FileOutlet(path, format='logfmt')
+    outlet.handle({'key': 'some value'})
+    outlet.close()
+
+    with open(path) as events_file:
+        assert [parse_logfmt(line) for line in events_file] == [{'key': 'some value'}]
+
+
+def test_file_outlet_flushes_when_buffer_is_full(tmpdir):
+    path = str(tmpdir.join('events.ndjson'))
+    outlet = FileOutlet(path, buffer_size=30, flush_interval=100)
+    outlet.handle({'index': 1})
+    assert not os.path.exists(path)
+
+    outlet.handle({'index': 2, 'padding': 'x' * 20})
+    assert [event['index'] for event in read_lines(path)] == [1, 2]
+    outlet.close()
+
+
+def test_file_outlet_flushes_after_interval(tmpdir):
+    clock = FakeClock()
+    path = str(tmpdir.join('events.ndjson'))
+    outlet = FileOutlet(path, flush_interval=1, clock=clock)
+    outlet.handle({'index': 1})
+    assert not os.path.exists(path)
+
+    clock.now += 1
+    outlet.handle({'index': 2})
+    assert len(read_lines(path)) == 2
+    outlet.close()
+
+
+def test_file_outlet_flushes_in_background(tmpdir):
+    path = str(tmpdir.join('events.ndjson'))
+    outlet = FileOutlet(path, flush_interval=0.01)
+    outlet.handle({'index': 1})
+
+    deadline = time.monotonic() + 2
+    while not os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read_lines(path) == [{'index': 1}]
+    outlet.close()
+
+
+def test_file_outlet_rotates_by_size(tmpdir):
+    path = str(tmpdir.join('events.ndjson'))
+    outlet = FileOutlet(path, buffer_size=0, max_bytes=24, backup_count=2)
+    for index in range(10):
+        outlet.handle({'index': index})
+    outlet.close()
+
+    rotated = sorted(name for name in os.listdir(str(tmpdir)) if name != 'events.ndjson')
+    assert len(rotated) == 2
+    assert all(name.startswith('events.ndjson.') for name in rotated)
+
+    # Each file has two events, the newest are in the current file
+    assert [event['index'] for event in read_lines(path)] == [8, 9]
+
+
+def test_file_outlet_rotates_by_time(tmpdir):
+    clock = FakeClock()
+    path = str(tmpdir.join('events.ndjson'))
+    outlet = FileOutlet(path, buffer_size=0, rotate_interval=60, clock=clock)
+    outlet.handle({'index': 1})
+    clock.now += 60
+    outlet.handle({'index': 2})
+    outlet.close()
+
+    assert len(os.listdir(str(tmpdir))) == 2
+    assert read_lines(path) == [{'index': 2}]
+
+
+def test_file_outlet_gzip(tmpdir):
+    path = str(tmpdir.join('events.ndjson.gz'))
+    outlet = FileOutlet(path, compression='gzip')
+    outlet.handle({'index': 1})
+    outlet.flush()
+    outlet.handle({'index': 2})
+    outlet.close()
+
+    # Every flush is a gzip member, which decompress as one stream
+    with gzip.open(path, 'rt') as events_file:
+        assert [json.loads(line) for line in events_file] == [{'index': 1}, {'index': 2}]
+
+
+@pytest.mark.skipif(not HAS_ZSTANDARD, reason='requires zstandard')
+def test_file_outlet_zstd(tmpdir):
+    import zstandard # pylint: disable=import-outside-toplevel
+
+    path = str(tmpdir.join('events.ndjson.zst'))
+    outlet = FileOutlet(path, compression='zstd')
+    outlet.handle({'index': 1})
+    outlet.flush()
+    outlet.handle({'index': 2})
+    outlet.close()
+
+    with open(path, 'rb') as events_file:
+        reader = zstandard.ZstdDecompressor().stream_reader(events_file, read_across_frames=True)
+        lines = reader.read().decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == [{'index': 1}, {'index': 2}]
+
+
+def test_file_outlet_invalid_options(tmpdir):
+    path = str(tmpdir.join('events'))
+    with pytest.raises(ValueError):
+        FileOutlet(path, format='xml')
+    with pytest.raises(ValueError):
+        FileOutlet(path, compression='lzma')
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_file_outlet_after_fork(tmpdir):
+    path = str(tmpdir.join('events-{pid}.ndjson'))
+    outlet = FileOutlet(path, compression='gzip')
+    outlet.handle({'from': 'parent'})
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            outlet.handle({'from': 'child'})
+            outlet.close()
+        finally:
+            os._exit(0) # pylint: disable=protected-access
+    os.waitpid(pid, 0)
+    outlet.close()
+
+    with gzip.open(path.replace('{pid}', str(pid)), 'rt') as events_file:
+        assert [json.loads(line) for line in events_file] == [{'from': 'child'}]
+    with gzip.open(outlet.current_path(), 'rt') as events_file:
+        assert [json.loads(line) for line in events_file] == [{'from': 'parent'}]
+
+
+def test_app_with_file_outlet(tmpdir):
+    path = str(tmpdir.join('events.ndjson'))
+    app = create_app()
+    app.config['EVENTS_FILE_PATH'] = path
+    events = Events(app)
+    file_outlet = events.outlets[-1]
+    assert isinstance(file_outlet, FileOutlet)
+
+    app.test_client().get('/')
+    file_outlet.close()
+
+    event = read_lines(path)[0]
+    assert event['status'] == 200
+    assert 'request_total_seconds' in event
+
+
+def test_app_closes_file_outlet_on_init(tmpdir):
+    path = str(tmpdir.join('events.ndjson'))
+    app = create_app()
+    app.config['EVENTS_FILE_PATH'] = path
+    events = Events(app)
+    file_outlet = events.outlets[-1]
+    file_outlet.handle({'status': 200})
+
+    with mock.patch('flask_events.outlets.file.atexit.unregister') as unregister:
+        events.init_app(app)
+
+    unregister.assert_called_once_with(file_outlet.close)
+    assert file_outlet._flusher is None # pylint: disable=protected-access
+    assert events.outlets[-1] is not file_outlet
+    assert read_lines(path)[0]['status'] == 200
+
+
+def read_lines(path):
+    with open(path) as events_file:
+        return [json.loads(line) for line in events_file]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+
+    def __call__(self):
+        return self.now
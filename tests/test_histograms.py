@@ -0,0 +1,171 @@
+from unittest import mock
+
+import pytest
+
+from flask_events import Events
+from flask_events.histograms import (
+    BUCKET_COUNT,
+    EXACT_LIMIT,
+    LatencyHistograms,
+    LogHistogram,
+    MAX_VALUE,
+    bucket_index,
+    bucket_upper_bound,
+    create_histograms,
+)
+from flask_events.sqlstats import QueryStats
+
+from .conftest import create_app
+
+# pylint: disable=redefined-outer-name
+
+
+def test_no_histograms_by_default():
+    assert create_histograms({}) is None
+
+
+def test_buckets_are_contiguous():
+    previous_upper = -1
+    for index in range(BUCKET_COUNT):
+        assert bucket_index(previous_upper + 1) == index
+        upper = bucket_upper_bound(index)
+        assert bucket_index(upper) == index
+        previous_upper = upper
+    assert previous_upper == MAX_VALUE
+
+
+@pytest.mark.parametrize('value', [0, 1, EXACT_LIMIT - 1, EXACT_LIMIT, 12345, 10**9, MAX_VALUE])
+def test_bucket_relative_error(value):
+    upper = bucket_upper_bound(bucket_index(value))
+    assert value <= upper <= value + value / 16
+
+
+def test_histogram_percentiles():
+    histogram = LogHistogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+
+    p50, p90, p99 = histogram.percentiles()
+    assert 500000 <= p50 <= 500000 * 17 / 16
+    assert 900000 <= p90 <= 900000 * 17 / 16
+    assert 990000 <= p99 <= 1000000
+    assert histogram.count == 1000
+    assert histogram.max == 1000000
+
+
+def test_histogram_clamps():
+    histogram = LogHistogram()
+    histogram.record(-5)
+    histogram.record(MAX_VALUE * 2)
+    assert histogram.percentiles((0, 100)) == [0, MAX_VALUE]
+
+
+def test_empty_histogram_percentiles():
+    assert LogHistogram().percentiles() == [0, 0, 0]
+
+
+def test_latency_histograms_collect():
+    clock = FakeClock()
+    histograms = LatencyHistograms(interval=10, clock=clock)
+    query_stats = QueryStats()
+    query_stats.add('SELECT 1', 2000000)
+
+    histograms.record(('app.index', 'GET', 2), 10000000, query_stats)
+    histograms.record(('app.index', 'GET', 2), 30000000, query_stats)
+    histograms.record(('app.index', 'GET', 5), 1000000)
+
+    assert not histograms.is_due()
+    clock.now += 10 * 10**9
+    assert histograms.is_due()
+
+    events = {event['status_class']: event for event in histograms.collect()}
+    assert set(events) == {'2xx', '5xx'}
+
+    ok_event = events['2xx']
+    assert ok_event['event_type'] == 'histogram'
+    assert ok_event['handler'] == 'app.index'
+    assert ok_event['method'] == 'GET'
+    assert ok_event['count'] == 2
+    assert ok_event['interval'].value == 10
+    assert ok_event['request_total_max'].value == 0.03
+    assert ok_event['request_total_p50'].unit == 'seconds'
+    assert 0.01 <= ok_event['request_total_p50'].value <= 0.011
+    assert ok_event['database_executes_p99'] == 1
+
+    assert 'database_query_time_p50' not in events['5xx']
+
+    assert histograms.collect() == []
+    assert not histograms.is_due()
+
+
+def test_app_histograms_count_sampled_out_requests(histogram_app):
+    client = histogram_app.test_client()
+    for _ in range(3):
+        client.get('/')
+    client.get('/abort')
+    client.get('/nonexistent')
+
+    histogram_app.events.flush_histograms()
+
+    events = {
+        (event['handler'], event['status_class']): event
+        for event in histogram_app.test_outlet.events
+        if event.get('event_type') == 'histogram'
+    }
+    assert events[('tests.conftest.create_app.<locals>.main_route', '2xx')]['count'] == 3
+    assert events[('tests.conftest.create_app.<locals>.crash', '5xx')]['count'] == 1
+    assert events[(None, '4xx')]['count'] == 1
+    assert all(event['method'] == 'GET' for event in events.values())
+
+
+def test_app_histograms_flushed_on_interval(histogram_app):
+    clock = FakeClock()
+    histogram_app.events.histograms = LatencyHistograms(interval=10, clock=clock)
+
+    client = histogram_app.test_client()
+    client.get('/')
+    assert histogram_app.test_outlet.events == []
+
+    clock.now += 10 * 10**9
+    client.get('/')
+    assert [event['count'] for event in histogram_app.test_outlet.events] == [2]
+
+
+def test_app_histograms_flushed_at_exit_once_after_multiple_init(histogram_app):
+    with mock.patch('flask_events.telemetry.atexit') as atexit:
+        histogram_app.events.init_app(histogram_app)
+        histogram_app.events.init_app(histogram_app)
+
+    assert atexit.unregister.call_count == 2
+    assert atexit.register.call_count == 2
+    atexit.unregister.assert_called_with(histogram_app.events.flush_histograms)
+    atexit.register.assert_called_with(histogram_app.events.flush_histograms)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+
+    def __call__(self):
+        return self.now
+
+
+class ListOutlet:
+    def __init__(self):
+        self.events = []
+
+
+    def handle(self, event_data):
+        self.events.append(event_data)
+
+
+@pytest.fixture
+def histogram_app():
+    app = create_app()
+    app.config['EVENTS_HISTOGRAMS'] = True
+    app.config['EVENTS_SAMPLE_RATE'] = 0
+    app.events = Events(app)
+    app.test_outlet = ListOutlet()
+    app.events.outlets = [app.test_outlet]
+    return app
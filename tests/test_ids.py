@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+from flask_events.ids import (IdPool, TraceParent, format_traceparent, generate_span_id,
+    generate_trace_id, parse_traceparent)
+
+from .conftest import app_factory
+
+TRACEPARENT = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+
+def test_generate_ids():
+    trace_ids = {generate_trace_id() for _ in range(1000)}
+    assert len(trace_ids) == 1000
+    assert all(len(trace_id) == 32 for trace_id in trace_ids)
+    assert all(int(trace_id, 16) >= 0 for trace_id in trace_ids)
+    assert len(generate_span_id()) == 16
+
+
+def test_pool_refills():
+    pool = IdPool(8, batch_size=2)
+    ids = [pool.generate() for _ in range(5)]
+    assert len(set(ids)) == 5
+    assert all(len(generated_id) == 16 for generated_id in ids)
+
+
+def test_pool_reset():
+    pool = IdPool(8)
+    before = pool.generate()
+    pool.reset()
+    assert pool.generate() != before
+
+
+def test_forked_child_gets_new_ids():
+    generate_span_id() # Make sure the pool is filled before forking
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, generate_span_id().encode('ascii'))
+        os._exit(0) # pylint: disable=protected-access
+
+    os.waitpid(pid, 0)
+    child_id = os.read(read_fd, 16).decode('ascii')
+    os.close(read_fd)
+    os.close(write_fd)
+    assert child_id != generate_span_id()
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(TRACEPARENT) == TraceParent(
+        '0af7651916cd43dd8448eb211c80319c', 'b7ad6b7169203331')
+    # Later versions may have more fields
+    assert parse_traceparent('01-%s-extra' % TRACEPARENT[3:]) is not None
+
+
+@pytest.mark.parametrize('header', [
+    '',
+    'garbage',
+    '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331',
+    '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01-extra',
+    'ff-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01',
+    '00-0AF7651916CD43DD8448EB211C80319C-b7ad6b7169203331-01',
+    '00-0af7651916cd43dd8448eb211c8031-b7ad6b7169203331-01',
+    '00-00000000000000000000000000000000-b7ad6b7169203331-01',
+    '00-0af7651916cd43dd8448eb211c80319c-0000000000000000-01',
+    '00-0af7651916cd43dd8448eb211c80319c-b7ad6b716920333g-01',
+])
+def test_parse_invalid_traceparent(header):
+    assert parse_traceparent(header) is None
+
+
+def test_format_traceparent():
+    assert format_traceparent('0af7651916cd43dd8448eb211c80319c', 'b7ad6b7169203331') == TRACEPARENT
+
+
+def test_generated_request_ids(client):
+    client.get('/')
+    event_data = client.application.test_outlet.event_data
+    assert len(event_data['trace.trace_id']) == 32
+    assert len(event_data['trace.span_id']) == 16
+    assert event_data['request_id'] == event_data['trace.trace_id']
+    assert 'trace.parent_id' not in event_data
+
+    client.get('/')
+    assert client.application.test_outlet.event_data['request_id'] != event_data['request_id']
+
+
+def test_traceparent_header(client):
+    client.get('/', headers={'traceparent': TRACEPARENT, 'x-request-id': 'myrequestid'})
+    event_data = client.application.test_outlet.event_data
+    assert event_data['request_id'] == 'myrequestid'
+    assert event_data['trace.trace_id'] == '0af7651916cd43dd8448eb211c80319c'
+    assert event_data['trace.parent_id'] == 'b7ad6b7169203331'
+    assert event_data['trace.span_id'] != 'b7ad6b7169203331'
+
+
+def test_invalid_traceparent_header_starts_new_trace(client):
+    client.get('/', headers={'traceparent': 'garbage'})
+    event_data = client.application.test_outlet.event_data
+    assert len(event_data['trace.trace_id']) == 32
+    assert 'trace.parent_id' not in event_data
+
+
+def test_generate_ids_disabled():
+    app = app_factory()
+    app.config['EVENTS_GENERATE_IDS'] = False
+    app.events.init_app(app)
+    app.events.outlets = [app.test_outlet]
+    client = app.test_client()
+
+    client.get('/')
+    assert 'request_id' not in app.test_outlet.event_data
+    assert 'trace.trace_id' not in app.test_outlet.event_data
+
+    client.get('/', headers={'traceparent': TRACEPARENT})
+    assert app.test_outlet.event_data['trace.trace_id'] == '0af7651916cd43dd8448eb211c80319c'
+    assert 'request_id' not in app.test_outlet.event_data
@@ -1,10 +1,17 @@
 import socket
+import time
 from unittest import mock
 
 import pytest
+from flask import Flask
 
-from flask_events import UnitedMetric
+from flask_events import Events, UnitedMetric
 from flask_events.outlets import LibhoneyOutlet
+from flask_events.record import EventRecord
+
+from .fake_honeycomb import FakeHoneycomb
+
+# pylint: disable=redefined-outer-name
 
 
 def test_libhoney():
@@ -12,10 +19,11 @@ def test_libhoney():
     outlet = LibhoneyOutlet(client_mock)
     outlet.handle({'key': 'value'})
 
-    client_mock.send_now.assert_called_with({
+    client_mock.new_event.assert_called_with({
         'key': 'value',
         'hostname': socket.getfqdn(),
     })
+    client_mock.new_event.return_value.send.assert_called_with()
 
 
 @pytest.mark.parametrize('test_input,expected_output', [
@@ -31,4 +39,136 @@ def test_libhoney_units(test_input, expected_output):
         'hostname': socket.getfqdn(),
     })
 
-    client_mock.send_now.assert_called_with(expected_output)
+    client_mock.new_event.assert_called_with(expected_output)
+
+
+def test_libhoney_timestamp():
+    client_mock = mock.Mock()
+    outlet = LibhoneyOutlet(client_mock)
+    record = EventRecord()
+    record.set('name', 'render')
+    record.timestamp = 1577836800.5
+    outlet.handle(record)
+
+    client_mock.new_event.assert_called_with({'name': 'render', 'hostname': socket.getfqdn()})
+    created_at = client_mock.new_event.return_value.created_at
+    assert created_at.timestamp() == 1577836800.5
+
+
+def test_libhoney_timestamp_field_is_data():
+    client_mock = mock.Mock(spec=['new_event'])
+    client_mock.new_event.return_value = mock.Mock(spec=['send'])
+    outlet = LibhoneyOutlet(client_mock)
+    outlet.handle({'name': 'render', 'timestamp': 'yesterday'})
+
+    client_mock.new_event.assert_called_with({
+        'name': 'render',
+        'timestamp': 'yesterday',
+        'hostname': socket.getfqdn(),
+    })
+    assert not hasattr(client_mock.new_event.return_value, 'created_at')
+
+
+def test_libhoney_batch():
+    client_mock = mock.Mock()
+    outlet = LibhoneyOutlet(client_mock)
+    outlet.handle_batch([{'first': 1}, {'second': 2}])
+
+    assert client_mock.new_event.call_count == 2
+    assert client_mock.new_event.return_value.send.call_count == 2
+
+
+def test_libhoney_sends_batches(fake_honeycomb):
+    events = create_events(fake_honeycomb, EVENTS_HONEYCOMB_MAX_BATCH_SIZE=10)
+    outlet = events.outlets[1]
+    outlet.handle_batch([{'index': index} for index in range(50)])
+
+    assert fake_honeycomb.wait_for_events(50)
+    assert sorted(event['data']['index'] for event in fake_honeycomb.events) == list(range(50))
+    assert fake_honeycomb.batches < 50
+    assert wait_for_stats(outlet, lambda stats: stats['successes'] == 50)
+    assert outlet.stats()['failures'] == 0
+    assert outlet.stats()['latency_ms_max'] > 0
+
+
+def test_libhoney_counts_failures():
+    fake_honeycomb = FakeHoneycomb(status=400).start()
+    try:
+        events = create_events(fake_honeycomb)
+        outlet = events.outlets[1]
+        outlet.handle({'key': 'value'})
+
+        assert wait_for_stats(outlet, lambda stats: stats['failures'] == 1)
+        assert outlet.stats()['successes'] == 0
+    finally:
+        fake_honeycomb.stop()
+
+
+def test_libhoney_config(fake_honeycomb):
+    events = create_events(fake_honeycomb,
+        EVENTS_HONEYCOMB_MAX_BATCH_SIZE=5,
+        EVENTS_HONEYCOMB_SEND_FREQUENCY=0.5,
+        EVENTS_HONEYCOMB_MAX_CONCURRENT_BATCHES=2,
+    )
+    transmission = events.outlets[1].libhoney_client.xmit
+    assert transmission.max_batch_size == 5
+    assert transmission.send_frequency == 0.5
+    assert transmission.max_concurrent_batches == 2
+
+
+def test_libhoney_sample_rate():
+    client_mock = mock.Mock()
+    outlet = LibhoneyOutlet(client_mock)
+    record = EventRecord()
+    record.set('key', 'value')
+    record.sample_rate = 10
+    outlet.handle(record)
+
+    client_mock.new_event.assert_called_with({
+        'key': 'value',
+        'hostname': socket.getfqdn(),
+    })
+    event = client_mock.new_event.return_value
+    assert event.sample_rate == 10
+    event.send_presampled.assert_called_with()
+    event.send.assert_not_called()
+
+
+def test_libhoney_sample_rate_field_is_data():
+    client_mock = mock.Mock()
+    outlet = LibhoneyOutlet(client_mock)
+    outlet.handle({'key': 'value', 'sample_rate': 10})
+
+    client_mock.new_event.assert_called_with({
+        'key': 'value',
+        'sample_rate': 10,
+        'hostname': socket.getfqdn(),
+    })
+    client_mock.new_event.return_value.send.assert_called_with()
+
+
+def create_events(fake_honeycomb, **config):
+    app = Flask('test_app')
+    app.config['EVENTS_HONEYCOMB_KEY'] = 'foobar'
+    app.config['EVENTS_HONEYCOMB_API_HOST'] = fake_honeycomb.api_host
+    app.config['EVENTS_HONEYCOMB_SEND_FREQUENCY'] = 0.01
+    app.config.update(config)
+    return Events(app)
+
+
+def wait_for_stats(outlet, predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate(outlet.stats()):
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def fake_honeycomb():
+    server = FakeHoneycomb().start()
+    try:
+        yield server
+    finally:
+        server.stop()
@@ -1,10 +1,16 @@
+import enum
 from collections import OrderedDict
 
 import pytest
 from testfixtures import LogCapture
 
 from flask_events import UnitedMetric
-from flask_events.outlets.logfmt import LogfmtOutlet
+from flask_events.outlets.logfmt import (
+    LogfmtOutlet,
+    format_event,
+    format_key_value_pair,
+    parse_logfmt,
+)
 
 # pylint: disable=redefined-outer-name
 
@@ -29,6 +35,13 @@ def test_logfmt(outlet):
     ({'false': False}, 'false=false'),
     ({'float': 1.23456789}, 'float=1.2346'),
     ({'mykey': 'my custom value'}, 'mykey="my custom value"'),
+    ({'quote': 'say "hi"'}, r'quote="say \"hi\""'),
+    ({'path': r'C:\temp'}, r'path=C:\temp'),
+    ({'msg': 'back\\slash and space'}, r'msg="back\\slash and space"'),
+    ({'error_msg': 'line one\nline two'}, r'error_msg="line one\nline two"'),
+    ({'ctrl': 'bell\x07'}, r'ctrl="bell\u0007"'),
+    ({'sep': 'a\u2028b'}, r'sep="a\u2028b"'),
+    ({'bad key': 1}, 'bad_key=1'),
 ])
 def test_logfmt_formatting(event_data, expected_output, outlet):
     with LogCapture() as logs:
@@ -55,6 +68,65 @@ def test_logfmt_unit_unknown_unit(outlet):
     assert logs.records[0].msg == 'thing=3foobars'
 
 
+class Color(enum.IntEnum):
+    RED = 1
+
+
+class Label(str):
+    def __str__(self):
+        return 'label with spaces'
+
+
+@pytest.mark.parametrize('value', [
+    None, True, False, 0, 17, -3, 1.5, 2.0, 'plain', 'has space', 'a=b', '',
+    Color.RED, Label('label'), [1, 2], object,
+])
+def test_format_event_matches_key_value_pair(value):
+    assert format_event({'key': value}) == format_key_value_pair('key', value)
+
+
+def test_logfmt_unit_with_space(outlet):
+    with LogCapture() as logs:
+        outlet.handle({'thing': UnitedMetric(3, 'foo bars')})
+    assert logs.records[0].msg == 'thing="3foo bars"'
+
+
+def test_format_event_same_keys_different_types():
+    assert format_event(OrderedDict((('a', 1), ('b', 'x')))) == 'a=1 b=x'
+    assert format_event(OrderedDict((('a', 'x y'), ('b', None)))) == 'a="x y" b='
+    assert format_event(OrderedDict((('a', 1), ('b', 'x')))) == 'a=1 b=x'
+
+
+@pytest.mark.parametrize('value', [
+    'plain',
+    '',
+    'with space',
+    'a=b',
+    'quote " in the middle',
+    '"',
+    'ends with backslash\\',
+    r'C:\Users\someone',
+    'multi\nline\r\nvalue\twith tabs',
+    'control \x00\x1b[31m chars',
+    'unicode æøå \u2028 \x85',
+])
+def test_logfmt_round_trip(value):
+    line = format_event(OrderedDict((('first', value), ('second', 'after'))))
+    assert '\n' not in line
+    assert len(line.splitlines()) == 1
+    assert parse_logfmt(line) == OrderedDict((('first', value), ('second', 'after')))
+
+
+def test_parse_logfmt():
+    assert parse_logfmt(r'a=1 b="two words" c= d e="esc\"aped"') == OrderedDict((
+        ('a', '1'),
+        ('b', 'two words'),
+        ('c', ''),
+        ('d', ''),
+        ('e', 'esc"aped'),
+    ))
+
+
 @pytest.fixture
 def outlet():
     return LogfmtOutlet('test_app')
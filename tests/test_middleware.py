@@ -0,0 +1,173 @@
+import time
+
+import pytest
+from flask import Response
+
+from flask_events import Events, EventsMiddleware
+from flask_events.context import current_slot
+
+from .conftest import CapturingOutlet, create_app
+
+# pylint: disable=redefined-outer-name
+
+
+def get(client, path, **kwargs):
+    # The test client leaves closing the response to the caller, like a WSGI
+    # server would
+    response = client.get(path, **kwargs)
+    response.get_data()
+    response.close()
+    return response
+
+
+def test_middleware(middleware_app):
+    response = get(middleware_app.test_client(), '/?q=1', headers={
+        'X-Forwarded-For': '10.1.2.3',
+        'X-Request-ID': 'myrequestid',
+    })
+    assert response.status_code == 200
+
+    event_data = middleware_app.test_outlet.event_data
+    assert event_data['fwd'] == '10.1.2.3'
+    assert event_data['method'] == 'GET'
+    assert event_data['path'] == '/?q=1'
+    assert event_data['status'] == 200
+    assert event_data['handler'] == 'tests.conftest.create_app.<locals>.main_route'
+    assert event_data['request_id'] == 'myrequestid'
+    assert event_data['request_total'].unit == 'seconds'
+
+
+def test_no_flask_hooks(middleware_app):
+    assert isinstance(middleware_app.wsgi_app, EventsMiddleware)
+    assert not middleware_app.before_request_funcs
+    assert not middleware_app.teardown_request_funcs
+    assert not middleware_app.teardown_appcontext_funcs
+
+
+def test_slot_cleared_after_request(middleware_app):
+    get(middleware_app.test_client(), '/')
+    assert current_slot.get() is None
+
+
+def test_not_emitted_before_close(middleware_app):
+    response = middleware_app.test_client().get('/')
+    assert middleware_app.test_outlet.event_data is None
+    response.close()
+    assert middleware_app.test_outlet.event_data['status'] == 200
+
+
+def test_streamed_response_timed_to_last_byte(middleware_app):
+    @middleware_app.route('/stream')
+    def stream(): # pylint: disable=unused-variable
+        def generate():
+            yield 'first'
+            time.sleep(0.05)
+            yield 'second'
+        return Response(generate())
+
+    response = get(middleware_app.test_client(), '/stream')
+
+    assert response.data == b'firstsecond'
+    assert middleware_app.test_outlet.event_data['request_total'].value >= 0.05
+
+
+def test_data_added_during_request(middleware_app):
+    @middleware_app.route('/added')
+    def added(): # pylint: disable=unused-variable
+        middleware_app.events.add('item_count', 3)
+        with middleware_app.events.span('render'):
+            pass
+        return 'Added'
+
+    get(middleware_app.test_client(), '/added')
+
+    event_data = middleware_app.test_outlet.event_data
+    assert event_data['item_count'] == 3
+    assert 'time_render' in event_data
+
+
+def test_not_found(middleware_app):
+    response = get(middleware_app.test_client(), '/missing')
+    assert response.status_code == 404
+    assert middleware_app.test_outlet.event_data['status'] == 404
+    assert 'handler' not in middleware_app.test_outlet.event_data
+
+
+def test_error(middleware_app):
+    @middleware_app.route('/broken')
+    def broken(): # pylint: disable=unused-variable
+        raise ValueError('broke')
+
+    response = get(middleware_app.test_client(), '/broken')
+
+    assert response.status_code == 500
+    event_data = middleware_app.test_outlet.event_data
+    assert event_data['status'] == 500
+    assert event_data['error'] == 'ValueError'
+    assert event_data['error_msg'] == 'broke'
+
+
+def test_propagated_error(middleware_app):
+    middleware_app.testing = True
+
+    @middleware_app.route('/broken')
+    def broken(): # pylint: disable=unused-variable
+        raise ValueError('broke')
+
+    with pytest.raises(ValueError):
+        get(middleware_app.test_client(), '/broken')
+
+    assert middleware_app.test_outlet.event_data['error'] == 'ValueError'
+    assert current_slot.get() is None
+
+
+def test_database_queries(middleware_app):
+    sqlalchemy = pytest.importorskip('sqlalchemy')
+    engine = sqlalchemy.create_engine('sqlite://')
+
+    @middleware_app.route('/queries')
+    def queries(): # pylint: disable=unused-variable
+        with engine.connect() as connection:
+            for _ in range(3):
+                connection.execute(sqlalchemy.text('SELECT 1'))
+        return 'Queried'
+
+    get(middleware_app.test_client(), '/queries')
+
+    assert middleware_app.test_outlet.event_data['database_executes'] == 3
+
+
+def test_sampled_out():
+    app = create_app()
+    app.config['EVENTS_SAMPLE_RATE'] = 0
+    app.events = Events()
+    app.events.init_middleware(app)
+    app.test_outlet = CapturingOutlet()
+    app.events.outlets = [app.test_outlet]
+
+    get(app.test_client(), '/')
+
+    assert app.test_outlet.event_data is None
+
+
+def test_queue_time_header():
+    app = create_app()
+    app.config['EVENTS_QUEUE_TIME_HEADER'] = 'X-Request-Start'
+    app.events = Events()
+    app.events.init_middleware(app)
+    app.test_outlet = CapturingOutlet()
+    app.events.outlets = [app.test_outlet]
+
+    get(app.test_client(), '/', headers={'X-Request-Start': 't=%f' % (time.time() - 0.25)})
+
+    assert app.test_outlet.event_data['time_queue'].value >= 0.25
+
+
+@pytest.fixture
+def middleware_app():
+    app = create_app()
+    app.events = Events()
+    app.events.init_middleware(app)
+    app.test_outlet = CapturingOutlet()
+    app.events.outlets = [app.test_outlet]
+    return app
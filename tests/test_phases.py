@@ -0,0 +1,86 @@
+import time
+
+import pytest
+from flask import abort
+
+from flask_events import Events
+
+from .conftest import create_app, CapturingOutlet
+
+# pylint: disable=redefined-outer-name
+
+PHASES = ('time_before_request', 'time_view', 'time_after_request', 'time_teardown')
+
+
+def test_phases_not_recorded_by_default(client):
+    client.get('/')
+    for phase in PHASES:
+        assert phase not in client.application.test_outlet.event_data
+
+
+def test_phases(phased_app):
+    @phased_app.before_request
+    def slow_before_request(): # pylint: disable=unused-variable
+        time.sleep(0.02)
+
+    @phased_app.route('/slow')
+    def slow_view(): # pylint: disable=unused-variable
+        time.sleep(0.03)
+        return 'Slow'
+
+    @phased_app.after_request
+    def slow_after_request(response): # pylint: disable=unused-variable
+        time.sleep(0.01)
+        return response
+
+    phased_app.test_client().get('/slow')
+
+    event_data = phased_app.test_outlet.event_data
+    # Only lower bounds, a busy machine can make any phase take longer
+    assert event_data['time_before_request'].value >= 0.02
+    assert event_data['time_view'].value >= 0.03
+    assert event_data['time_after_request'].value >= 0.01
+    assert event_data['time_teardown'].value >= 0
+    phases_total = sum(event_data[phase].value for phase in PHASES)
+    assert phases_total <= event_data['request_total'].value + 0.001
+    assert event_data['time_before_request'].unit == 'seconds'
+
+
+def test_phases_failing_view(phased_app):
+    phased_app.test_client().get('/abort')
+
+    event_data = phased_app.test_outlet.event_data
+    for phase in PHASES:
+        assert phase in event_data
+
+
+def test_phases_short_circuited_before_request(phased_app):
+    @phased_app.before_request
+    def deny(): # pylint: disable=unused-variable
+        abort(403)
+
+    phased_app.test_client().get('/')
+
+    event_data = phased_app.test_outlet.event_data
+    assert event_data['status'] == 403
+    assert 'time_view' not in event_data
+    assert 'time_before_request' in event_data
+    assert 'time_teardown' in event_data
+
+
+def test_phases_multiple_init(phased_app):
+    phased_app.events.init_app(phased_app)
+    phased_app.events.outlets = [phased_app.test_outlet]
+
+    phased_app.test_client().get('/')
+    assert 'time_view' in phased_app.test_outlet.event_data
+
+
+@pytest.fixture
+def phased_app():
+    app = create_app()
+    app.config['EVENTS_REQUEST_PHASES'] = True
+    app.events = Events(app)
+    app.test_outlet = CapturingOutlet()
+    app.events.outlets = [app.test_outlet]
+    return app
@@ -0,0 +1,66 @@
+from flask_events import UnitedMetric
+from flask_events.record import EventRecord, iter_fields
+
+
+def test_record_keeps_insertion_order():
+    record = EventRecord()
+    record.set('first', 1)
+    record.set('second', 2)
+    record.set('first', 3)
+
+    assert list(record) == ['first', 'second']
+    assert record.items() == [('first', 3), ('second', 2)]
+    assert len(record) == 2
+
+
+def test_record_units():
+    record = EventRecord()
+    record.set('time', 1.5, 'seconds')
+    record.set('size', UnitedMetric(10, 'bytes'))
+    record.set('count', 3)
+
+    assert record['time'] == UnitedMetric(1.5, 'seconds')
+    assert record['size'] == UnitedMetric(10, 'bytes')
+    assert list(record.fields()) == [
+        ('time', 1.5, 'seconds'),
+        ('size', 10, 'bytes'),
+        ('count', 3, None),
+    ]
+
+
+def test_record_overwrite_clears_unit():
+    record = EventRecord()
+    record.set('value', 1.5, 'seconds')
+    record.set('value', 'n/a')
+
+    assert record['value'] == 'n/a'
+
+
+def test_record_copy_is_independent():
+    record = EventRecord()
+    record.set('shared', 1)
+    copy = record.copy()
+    copy.set('shared', 2)
+    copy.set('new', 3)
+
+    assert record.items() == [('shared', 1)]
+    assert copy.items() == [('shared', 2), ('new', 3)]
+
+
+def test_record_mapping_interface():
+    record = EventRecord()
+    record.set('key', 'value')
+
+    assert 'key' in record
+    assert 'missing' not in record
+    assert record.get('key') == 'value'
+    assert record.get('missing', 'default') == 'default'
+    assert record.keys() == ['key']
+    assert record.values() == ['value']
+
+
+def test_iter_fields_mapping():
+    assert list(iter_fields({'time': UnitedMetric(1, 'seconds'), 'plain': 2})) == [
+        ('time', 1, 'seconds'),
+        ('plain', 2, None),
+    ]
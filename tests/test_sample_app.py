@@ -16,6 +16,10 @@ def test_sample_app(sample_app_client):
     assert len(logs.records) == 1
     assert 'method=GET path=/ status=200' in logs.records[0].msg
     assert 'database_query_time=' in logs.records[0].msg
+    assert 'database_distinct_statements=1' in logs.records[0].msg
+    top_statement = 'SELECT item.id AS item_id, item.name AS item_name FROM item'
+    assert 'database_top_statement="%s"' % top_statement in logs.records[0].msg
+    assert 'database_top_statement_executes=1' in logs.records[0].msg
 
 
 def test_sample_app_add_random(sample_app_client):
@@ -0,0 +1,151 @@
+from unittest import mock
+
+import pytest
+
+from flask_events import Events
+from flask_events.sampling import (
+    DynamicSampler,
+    RequestFacts,
+    Sampler,
+    create_sampler,
+    should_keep,
+)
+
+from .conftest import create_app, CapturingOutlet
+
+# pylint: disable=redefined-outer-name
+
+
+def test_no_sampler_by_default():
+    assert create_sampler({}) is None
+
+
+@pytest.mark.parametrize('rate,random_value,expected', [
+    (1, 0.99, True),
+    (0, 0.0, False),
+    (4, 0.2, True),
+    (4, 0.3, False),
+])
+def test_should_keep(rate, random_value, expected):
+    with mock.patch('flask_events.sampling.random.random', return_value=random_value):
+        assert should_keep(rate) == expected
+
+
+def test_sampler_endpoint_rates():
+    sampler = Sampler(rate=1, endpoint_rates={'health': 0})
+    assert sampler.sample_endpoint('health') == (False, 0)
+    assert sampler.sample_endpoint('index') == (True, 1)
+
+
+def test_sampler_keeps_errors_and_slow_requests():
+    sampler = Sampler(rate=0, keep_slower_than=1.0, keep_database_slower_than=0.5)
+    assert sampler.sample_response(False, 0, facts(status=500)) == (True, 1)
+    assert sampler.sample_response(False, 0, facts(error='ValueError')) == (True, 1)
+    assert sampler.sample_response(False, 0, facts(request_total=2.5)) == (True, 1)
+    assert sampler.sample_response(False, 0, facts(database_query_time=0.6)) == (True, 1)
+    assert sampler.sample_response(False, 0, facts()) == (False, 0)
+
+
+def test_sampler_errors_not_kept_if_disabled():
+    sampler = Sampler(rate=0, keep_errors=False)
+    assert sampler.sample_response(False, 0, facts(status=500)) == (False, 0)
+
+
+def test_sampler_keep_if():
+    sampler = Sampler(rate=0, keep_if=lambda facts: facts.endpoint == 'checkout')
+    assert sampler.sample_response(False, 0, facts(endpoint='checkout')) == (True, 1)
+    assert sampler.sample_response(False, 0, facts(endpoint='index')) == (False, 0)
+
+
+def test_sampler_status_rates():
+    sampler = Sampler(status_rates={404: 0})
+    assert sampler.sample_response(True, 1, facts(status=404)) == (False, 0)
+    assert sampler.sample_response(True, 1, facts()) == (True, 1)
+
+
+def test_dynamic_sampler():
+    now = [0]
+    sampler = DynamicSampler(target_events_per_second=1, window=10, clock=lambda: now[0])
+
+    for _ in range(100):
+        assert sampler.get_rate('busy') == 1
+    for _ in range(5):
+        sampler.get_rate('quiet')
+
+    now[0] = 10
+    assert sampler.get_rate('busy') == 10
+    assert sampler.get_rate('quiet') == 1
+    assert sampler.get_rate('new') == 1
+
+
+def test_app_sampled_out(sampled_app):
+    with mock.patch('flask_events.events.add_request_params') as add_request_params:
+        response = sampled_app.test_client().get('/')
+
+    assert response.status_code == 200
+    assert sampled_app.test_outlet.event_data is None
+    add_request_params.assert_not_called()
+
+
+def test_app_sampling_keeps_errors(sampled_app):
+    response = sampled_app.test_client().get('/abort')
+
+    assert response.status_code == 503
+    assert sampled_app.test_outlet.event_data['status'] == 503
+    assert sampled_app.test_outlet.event_data['sample_rate'] == 1
+
+
+def test_app_sampling_keeps_slow_requests(sampled_app):
+    sampled_app.config['EVENTS_KEEP_SLOWER_THAN'] = 0
+    sampled_app.events.init_app(sampled_app)
+    sampled_app.events.outlets = [sampled_app.test_outlet]
+    sampled_app.test_client().get('/')
+
+    assert sampled_app.test_outlet.event_data['sample_rate'] == 1
+
+
+def test_app_keep_if(sampled_app):
+    kept_facts = []
+    def keep_if(facts):
+        kept_facts.append(facts)
+        return facts.request_total >= 0
+
+    sampled_app.config['EVENTS_KEEP_IF'] = keep_if
+    sampled_app.events.init_app(sampled_app)
+    sampled_app.events.outlets = [sampled_app.test_outlet]
+    sampled_app.test_client().get('/')
+
+    assert sampled_app.test_outlet.event_data['sample_rate'] == 1
+    assert kept_facts[0].endpoint == 'main_route'
+    assert kept_facts[0].status == 200
+    assert kept_facts[0].error is None
+    assert kept_facts[0].database_query_time == 0
+
+
+def test_app_endpoint_rate():
+    app = create_sampled_app(EVENTS_SAMPLE_ENDPOINT_RATES={'main_route': 3})
+
+    with mock.patch('flask_events.sampling.random.random', return_value=0.1):
+        app.test_client().get('/')
+
+    assert app.test_outlet.event_data['sample_rate'] == 3
+    assert app.test_outlet.event_data.sample_rate == 3
+
+
+def facts(endpoint='index', status=200, request_total=0.01, error=None,
+        database_query_time=0.0):
+    return RequestFacts(endpoint, status, request_total, error, database_query_time)
+
+
+def create_sampled_app(**config):
+    app = create_app()
+    app.config.update(config)
+    app.events = Events(app)
+    app.test_outlet = CapturingOutlet()
+    app.events.outlets = [app.test_outlet]
+    return app
+
+
+@pytest.fixture
+def sampled_app():
+    return create_sampled_app(EVENTS_SAMPLE_RATE=0)
@@ -0,0 +1,102 @@
+import datetime
+import decimal
+import enum
+import json
+import uuid
+from collections import OrderedDict
+
+import pytest
+
+from flask_events import UnitedMetric
+from flask_events import serialization
+from flask_events.record import EventRecord
+from flask_events.serialization import dumps, flatten, flatten_key, to_json_value
+
+
+def test_flatten_key_is_cached():
+    key = flatten_key('request_total', 'seconds')
+    assert key == 'request_total_seconds'
+    assert flatten_key('request_total', 'seconds') is key
+
+
+def test_flatten_key_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(serialization, 'FLATTENED_KEY_CACHE_SIZE', 2)
+    monkeypatch.setattr(serialization, '_flattened_keys', {})
+    for index in range(5):
+        flatten_key('key%d' % index, 'bytes')
+    assert len(serialization._flattened_keys) <= 2 # pylint: disable=protected-access
+
+
+def test_flatten_record():
+    record = EventRecord()
+    record.set('status', 200)
+    record.set('request_total', 0.5, 'seconds')
+    record.set('when', datetime.datetime(2020, 1, 2, 3, 4, 5))
+
+    assert flatten(record, {'hostname': 'example.com'}) == {
+        'hostname': 'example.com',
+        'status': 200,
+        'request_total_seconds': 0.5,
+        'when': '2020-01-02T03:04:05',
+    }
+
+
+def test_flatten_mapping():
+    event_data = OrderedDict([
+        ('size', UnitedMetric(12, 'bytes')),
+        ('price', decimal.Decimal('1.5')),
+    ])
+    assert flatten(event_data) == {'size_bytes': 12, 'price': 1.5}
+
+
+def test_flatten_does_not_modify_base():
+    base = {'hostname': 'example.com'}
+    flatten({'key': 'value'}, base)
+    assert base == {'hostname': 'example.com'}
+
+
+class Color(enum.Enum):
+    RED = 'red'
+
+
+class Size(enum.IntEnum):
+    LARGE = 3
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('text', 'text'),
+    (None, None),
+    (True, True),
+    (datetime.date(2020, 1, 2), '2020-01-02'),
+    (datetime.time(12, 30), '12:30:00'),
+    (datetime.timedelta(seconds=90), 90.0),
+    (decimal.Decimal('2.25'), 2.25),
+    (uuid.UUID(int=1), '00000000-0000-0000-0000-000000000001'),
+    (b'caf\xc3\xa9', 'café'),
+    (b'\xff', '\\xff'),
+    (bytearray(b'abc'), 'abc'),
+    ((1, b'a', {2: decimal.Decimal(3)}), [1, 'a', {'2': 3.0}]),
+    (Size.LARGE, 3),
+    (Color.RED, 'Color.RED'),
+    (object, "<class 'object'>"),
+])
+def test_to_json_value(value, expected):
+    converted = to_json_value(value)
+    assert converted == expected
+    assert type(converted) is type(expected) # pylint: disable=unidiomatic-typecheck
+
+
+def test_dumps():
+    data = {'key': 'välue', 'number': 1.5, 'list': [1, None]}
+    encoded = dumps(data)
+    assert json.loads(encoded) == data
+    assert ' ' not in encoded.replace('välue', '')
+
+
+def test_dumps_big_integers():
+    assert json.loads(dumps({'big': 2**70})) == {'big': 2**70}
+
+
+def test_dumps_stdlib():
+    encoded = serialization._dumps_stdlib({'key': 'välue'}) # pylint: disable=protected-access
+    assert encoded == '{"key":"välue"}'
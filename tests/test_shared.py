@@ -0,0 +1,154 @@
+import os
+
+import pytest
+
+from flask_events import Events
+from flask_events.shared import SharedStats, create_shared_stats
+from flask_events.sqlstats import QueryStats
+
+from .conftest import create_app
+
+# pylint: disable=redefined-outer-name
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+
+
+def test_no_shared_stats_by_default():
+    assert create_shared_stats({}) is None
+
+
+def test_shared_stats_merges_workers():
+    stats = SharedStats(slots=4)
+
+    def work():
+        query_stats = QueryStats()
+        query_stats.add('SELECT 1', 1000000)
+        for _ in range(10):
+            stats.record(200, 20000000, query_stats)
+        stats.record(503, 40000000)
+
+    pids = [run_in_child(work) for _ in range(3)]
+    for pid in pids:
+        assert wait(pid) == 0
+
+    event = stats.collect(force=True)
+    assert event['event_type'] == 'host'
+    assert event['count'] == 33
+    assert event['status_2xx'] == 30
+    assert event['status_5xx'] == 3
+    assert event['workers'] == 0
+    assert event['database_executes'] == 30
+    assert event['request_total_max'].value == pytest.approx(0.04, rel=1 / 16)
+    assert event['request_total_p50'].value == pytest.approx(0.02, rel=1 / 16)
+    assert event['request_total_avg'].value == pytest.approx((30 * 0.02 + 3 * 0.04) / 33)
+    assert event['database_query_time_p99'].value == pytest.approx(0.001, rel=1 / 16)
+
+
+def test_shared_stats_collect_emits_deltas():
+    stats = SharedStats(slots=2)
+    stats.record(200, 1000)
+    assert stats.collect(force=True)['count'] == 1
+
+    stats.record(200, 1000)
+    stats.record(404, 1000)
+    event = stats.collect(force=True)
+    assert event['count'] == 2
+    assert event['status_4xx'] == 1
+    assert event['workers'] == 1
+    assert 'database_query_time_p50' not in event
+
+
+def test_shared_stats_reuses_slots_of_dead_workers():
+    stats = SharedStats(slots=1)
+
+    for _ in range(2):
+        assert wait(run_in_child(lambda: stats.record(200, 1000))) == 0
+
+    assert stats.collect(force=True)['count'] == 2
+
+
+def test_shared_stats_full():
+    stats = SharedStats(slots=1)
+    stats.record(200, 1000)
+
+    # The slot is held by this process, which is alive
+    assert wait(run_in_child(lambda: stats.record(200, 1000))) == 0
+
+    assert stats.collect(force=True)['count'] == 1
+
+
+def test_shared_stats_collect_interval():
+    clock = FakeClock()
+    stats = SharedStats(slots=1, interval=10, clock=clock)
+    stats.record(200, 1000)
+
+    assert not stats.is_due()
+    assert stats.collect() is None
+
+    clock.now += 10 * 10**9
+    assert stats.is_due()
+    event = stats.collect()
+    assert event['count'] == 1
+    assert event['interval'].value == 10
+    assert not stats.is_due()
+
+
+def test_app_shared_stats():
+    app = create_app()
+    app.config['EVENTS_SHARED_STATS'] = True
+    app.config['EVENTS_SAMPLE_RATE'] = 0
+    events = Events(app)
+    outlet = ListOutlet()
+    events.outlets = [outlet]
+
+    def work():
+        client = app.test_client()
+        client.get('/')
+        client.get('/abort')
+
+    for pid in [run_in_child(work) for _ in range(2)]:
+        assert wait(pid) == 0
+
+    events.collect_shared_stats()
+    host_events = [event for event in outlet.events if event.get('event_type') == 'host']
+    assert len(host_events) == 1
+    assert host_events[0]['count'] == 4
+    assert host_events[0]['status_2xx'] == 2
+    assert host_events[0]['status_5xx'] == 2
+
+
+def run_in_child(func):
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            func()
+        except BaseException: # pylint: disable=broad-except
+            exit_code = 1
+        finally:
+            os._exit(exit_code) # pylint: disable=protected-access
+    return pid
+
+
+def wait(pid):
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status)
+    return os.WEXITSTATUS(status)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+
+    def __call__(self):
+        return self.now
+
+
+class ListOutlet:
+    def __init__(self):
+        self.events = []
+
+
+    def handle(self, event_data):
+        self.events.append(event_data)
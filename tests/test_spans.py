@@ -0,0 +1,242 @@
+import asyncio
+import time
+
+import pytest
+
+from flask_events import Events
+from flask_events.spans import SpanBuffer, add_span_rollup
+from flask_events.record import EventRecord
+
+from .conftest import create_app
+
+# pylint: disable=redefined-outer-name
+
+
+def test_span_buffer_tree():
+    spans = SpanBuffer(max_spans=4)
+    outer = spans.start('outer', 10)
+    inner = spans.start('inner', 20)
+    spans.finish(inner, 30)
+    sibling = spans.start('sibling', 40)
+    spans.finish(sibling, 50, 'ValueError')
+    spans.finish(outer, 60)
+
+    assert list(spans.finished()) == [
+        (0, 'outer', -1, 10, 60, None),
+        (1, 'inner', outer, 20, 30, None),
+        (2, 'sibling', outer, 40, 50, 'ValueError'),
+    ]
+    assert spans.current == -1
+
+
+def test_span_buffer_drops_when_full():
+    spans = SpanBuffer(max_spans=1)
+    outer = spans.start('outer', 10)
+    dropped = spans.start('dropped', 20)
+    assert dropped == -1
+    spans.finish(dropped, 30)
+    assert spans.current == outer
+    spans.finish(outer, 40)
+
+    assert spans.dropped == 1
+    assert [span[1] for span in spans.finished()] == ['outer']
+
+
+def test_span_buffer_parents_per_task():
+    spans = SpanBuffer()
+
+    async def child(name):
+        index = spans.start(name, 10)
+        await asyncio.sleep(0)
+        spans.finish(spans.start('%s_inner' % name, 20), 30)
+        spans.finish(index, 40)
+
+    async def main():
+        outer = spans.start('outer', 0)
+        await asyncio.gather(child('first'), child('second'))
+        spans.finish(outer, 50)
+
+    asyncio.run(main())
+
+    names = {index: name for index, name, _, _, _, _ in spans.finished()}
+    parents = {name: names.get(parent) for _, name, parent, _, _, _ in spans.finished()}
+    assert parents == {
+        'outer': None,
+        'first': 'outer',
+        'second': 'outer',
+        'first_inner': 'first',
+        'second_inner': 'second',
+    }
+    assert spans.current == -1
+
+
+def test_span_rollup():
+    spans = SpanBuffer()
+    for start in (0, 100):
+        spans.finish(spans.start('query', start), start + 10**6)
+    spans.start('unfinished', 0)
+    record = EventRecord()
+
+    add_span_rollup(record, spans)
+
+    assert record['time_query'] == (0.002, 'seconds')
+    assert 'time_unfinished' not in record
+
+
+def test_spans_rolled_up_on_request_event(app):
+    @app.events.instrument()
+    def load_items():
+        time.sleep(0.01)
+        return ['item']
+
+    @app.route('/spans')
+    def spans_view(): # pylint: disable=unused-variable
+        with app.events.span('render'):
+            items = load_items()
+            time.sleep(0.01)
+        return ', '.join(items)
+
+    response = app.test_client().get('/spans')
+    assert response.data == b'item'
+
+    event_data = app.test_outlet.event_data
+    assert event_data['time_render'].value >= 0.02
+    assert 0.01 <= event_data['time_load_items'].value < event_data['time_render'].value
+    assert 'func_name' not in event_data
+    assert 'duration' not in event_data
+
+
+def test_instrumented_errors_are_recorded_in_requests(app):
+    @app.events.instrument()
+    def broken():
+        raise ValueError('broke')
+
+    @app.route('/broken')
+    def broken_view(): # pylint: disable=unused-variable
+        return repr(broken())
+
+    response = app.test_client().get('/broken')
+    assert response.status_code == 200
+    assert response.data == b'None'
+    assert app.test_outlet.event_data['error'] == 'ValueError'
+    assert app.test_outlet.event_data['error_msg'] == 'broke'
+    assert 'time_broken' in app.test_outlet.event_data
+
+
+def test_instrumented_errors_raised_in_requests(app):
+    @app.events.instrument(raise_errors=True)
+    def broken():
+        raise ValueError('broke')
+
+    @app.route('/broken')
+    def broken_view(): # pylint: disable=unused-variable
+        broken()
+        return 'Unreachable'
+
+    response = app.test_client().get('/broken')
+    assert response.status_code == 500
+    assert app.test_outlet.event_data['error'] == 'ValueError'
+    assert 'time_broken' in app.test_outlet.event_data
+
+
+def test_span_outside_request_does_nothing():
+    events = Events()
+    with events.span('outside') as span:
+        pass
+    assert span._spans is None # pylint: disable=protected-access
+
+
+def test_max_spans(app):
+    app.config['EVENTS_MAX_SPANS'] = 2
+    app.events.init_app(app)
+    app.events.outlets = [app.test_outlet]
+
+    @app.route('/many')
+    def many_spans(): # pylint: disable=unused-variable
+        for _ in range(5):
+            with app.events.span('step'):
+                pass
+        return 'Many'
+
+    app.test_client().get('/many')
+    assert app.test_outlet.event_data['spans_dropped'] == 3
+
+
+def test_trace_spans(trace_app):
+    @trace_app.route('/traced')
+    def traced(): # pylint: disable=unused-variable
+        with trace_app.events.span('outer'):
+            with trace_app.events.span('inner'):
+                pass
+        return 'Traced'
+
+    before = time.time()
+    trace_app.test_client().get('/traced')
+
+    request_event, outer, inner = trace_app.test_outlet.events
+    trace_id = request_event['trace.trace_id']
+    assert len(trace_id) == 32
+    assert 'time_outer' not in request_event
+
+    assert outer['name'] == 'outer'
+    assert inner['name'] == 'inner'
+    assert outer['trace.trace_id'] == inner['trace.trace_id'] == trace_id
+    assert outer['trace.parent_id'] == request_event['trace.span_id']
+    assert inner['trace.parent_id'] == outer['trace.span_id']
+    assert before <= outer['timestamp'] <= inner['timestamp'] <= time.time()
+    assert outer.timestamp == outer['timestamp']
+    assert request_event.timestamp is None
+    assert 0 <= inner['duration_ms'] <= outer['duration_ms']
+
+
+def test_trace_spans_of_concurrent_coroutines(trace_app):
+    @trace_app.events.instrument()
+    async def load(delay):
+        with trace_app.events.span('query'):
+            await asyncio.sleep(delay)
+
+    async def load_all():
+        await asyncio.gather(load(0.01), load(0))
+
+    @trace_app.route('/concurrent')
+    def concurrent_view(): # pylint: disable=unused-variable
+        asyncio.run(load_all())
+        return 'Loaded'
+
+    trace_app.test_client().get('/concurrent')
+
+    request_event = trace_app.test_outlet.events[0]
+    span_events = trace_app.test_outlet.events[1:]
+    assert [event['trace.parent_id'] for event in span_events if event['name'] == 'load'] == [
+        request_event['trace.span_id']] * 2
+    span_ids = {event['trace.span_id']: event['name'] for event in span_events}
+    query_parents = [event['trace.parent_id'] for event in span_events
+        if event['name'] == 'query']
+    assert [span_ids[parent] for parent in query_parents] == ['load', 'load']
+    assert len(set(query_parents)) == 2
+
+
+def test_invalid_span_mode():
+    app = create_app()
+    app.config['EVENTS_SPANS'] = 'flamegraph'
+    with pytest.raises(ValueError):
+        Events(app)
+
+
+class ListOutlet:
+    def __init__(self):
+        self.events = []
+
+
+    def handle(self, event_data):
+        self.events.append(event_data)
+
+
+@pytest.fixture
+def trace_app():
+    app = create_app()
+    app.config['EVENTS_SPANS'] = 'trace'
+    app.events = Events(app)
+    app.test_outlet = ListOutlet()
+    app.events.outlets = [app.test_outlet]
+    return app
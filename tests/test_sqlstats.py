@@ -0,0 +1,47 @@
+import pytest
+
+from flask_events import sqlstats
+from flask_events.sqlstats import QueryStats, fingerprint
+
+
+@pytest.mark.parametrize('statement,expected', [
+    ('SELECT * FROM item WHERE id = 12', 'SELECT * FROM item WHERE id = ?'),
+    ("SELECT * FROM item WHERE name = 'O''Brien'", 'SELECT * FROM item WHERE name = ?'),
+    ('SELECT *\n  FROM item\n WHERE id = %(id_1)s', 'SELECT * FROM item WHERE id = ?'),
+    ('SELECT * FROM item WHERE id IN (1, 2, 3)', 'SELECT * FROM item WHERE id IN (?)'),
+    ('SELECT * FROM item WHERE id IN (?, ?)', 'SELECT * FROM item WHERE id IN (?)'),
+    ('INSERT INTO item (name) VALUES (?), (?), (?)', 'INSERT INTO item (name) VALUES (?)'),
+    ('SELECT * FROM table2 WHERE x = :x_1', 'SELECT * FROM table2 WHERE x = ?'),
+    ('SELECT created::date FROM item LIMIT $1', 'SELECT created::date FROM item LIMIT ?'),
+    ('SELECT 0xff, 1.5e3', 'SELECT ?, ?'),
+])
+def test_fingerprint(statement, expected):
+    assert fingerprint(statement) == expected
+
+
+def test_query_stats():
+    stats = QueryStats()
+    stats.add('SELECT * FROM item WHERE id = 1', 10000000)
+    stats.add('SELECT * FROM item WHERE id = 2', 20000000)
+    stats.add('SELECT * FROM user', 25000000)
+
+    assert stats.executes == 3
+    assert stats.total_time == 55000000
+    assert stats.slowest_time == 25000000
+    assert stats.distinct_statements == 2
+    assert stats.top_statement() == 'SELECT * FROM item WHERE id = ?'
+    assert stats.statement_stats('SELECT * FROM item WHERE id = ?') == (2, 30000000, 20000000)
+
+
+def test_query_stats_bounded():
+    stats = QueryStats()
+    for index in range(sqlstats.MAX_STATEMENTS * 3):
+        stats.add('SELECT * FROM table_%s' % ('x' * index), 1000)
+
+    assert stats.executes == sqlstats.MAX_STATEMENTS * 3
+    assert stats.distinct_statements == sqlstats.MAX_STATEMENTS + 1
+    assert stats.statement_stats(sqlstats.OTHER_STATEMENTS)[0] == sqlstats.MAX_STATEMENTS * 2
+
+
+def test_query_stats_empty():
+    assert QueryStats().top_statement() is None
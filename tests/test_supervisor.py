@@ -0,0 +1,208 @@
+import asyncio
+from unittest import mock
+
+from flask_events import Events
+from flask_events.supervisor import CLOSED, OPEN, OutletSupervisor, OutletTelemetry
+
+from .conftest import CapturingOutlet, app_factory, create_app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+
+    def __call__(self):
+        return self.now
+
+
+class FailingOutlet:
+    def __init__(self):
+        self.calls = 0
+
+
+    def handle(self, event_data): # pylint: disable=unused-argument
+        self.calls += 1
+        raise ValueError('outlet broke')
+
+
+class SlowOutlet:
+    def __init__(self, clock, delay):
+        self.clock = clock
+        self.delay = delay
+
+
+    def handle(self, event_data): # pylint: disable=unused-argument
+        self.clock.now += self.delay
+
+
+class FailingAsyncOutlet:
+    async def handle_batch(self, events): # pylint: disable=unused-argument
+        await asyncio.sleep(0)
+        raise ValueError('outlet broke')
+
+
+def test_failing_outlet_is_isolated():
+    app = app_factory()
+    failing_outlet = FailingOutlet()
+    app.events.outlets = [failing_outlet, app.test_outlet]
+
+    response = app.test_client().get('/')
+
+    assert response.status_code == 200
+    assert failing_outlet.calls == 1
+    assert app.test_outlet.event_data['status'] == 200
+
+
+def test_circuit_opens_after_consecutive_failures():
+    clock = FakeClock()
+    outlet = FailingOutlet()
+    supervisor = OutletSupervisor(outlet, failure_threshold=3, cooldown=10, clock=clock)
+
+    for _ in range(5):
+        supervisor.handle({})
+
+    assert outlet.calls == 3
+    assert supervisor.state == OPEN
+    assert supervisor.stats()['skipped'] == 2
+
+    # Let through as a trial after the cooldown, reopened when it fails
+    clock.now += 10 * 10**9
+    supervisor.handle({})
+    supervisor.handle({})
+    assert outlet.calls == 4
+    stats = supervisor.stats()
+    assert stats['failures'] == 4
+    assert stats['skipped'] == 3
+    assert stats['trips'] == 2
+
+
+def test_circuit_closes_after_successful_trial():
+    clock = FakeClock()
+    outlet = CapturingOutlet()
+    supervisor = OutletSupervisor(outlet, failure_threshold=1, cooldown=10, clock=clock)
+    supervisor._open_until = 5 # pylint: disable=protected-access
+
+    supervisor.handle({'dropped': True})
+    assert outlet.event_data is None
+
+    clock.now = 5
+    supervisor.handle({'sent': True})
+    assert outlet.event_data == {'sent': True}
+    assert supervisor.state == CLOSED
+
+
+def test_failures_must_be_consecutive():
+    outlet = FailingOutlet()
+    supervisor = OutletSupervisor(outlet, failure_threshold=2)
+    supervisor.handle({})
+    supervisor.outlet = CapturingOutlet()
+    supervisor.handle({})
+    supervisor.outlet = outlet
+    supervisor.handle({})
+
+    assert supervisor.state == CLOSED
+
+
+def test_circuit_opens_when_over_latency_budget():
+    clock = FakeClock()
+    supervisor = OutletSupervisor(SlowOutlet(clock, 2 * 10**9), latency_budget=1.0, clock=clock)
+
+    supervisor.handle({})
+
+    assert supervisor.state == OPEN
+    stats = supervisor.stats()
+    assert stats['calls'] == 1
+    assert stats['handle_ms_max'] == 2000.0
+
+
+def test_batch_failures():
+    supervisor = OutletSupervisor(FailingAsyncOutlet(), failure_threshold=1)
+    supervisor.handle_batch([{}, {}])
+    assert supervisor.stats()['failures'] == 1
+    assert supervisor.stats()['events'] == 2
+
+    asyncio.run(supervisor.handle_batch_async([{}]))
+    assert supervisor.stats()['skipped'] == 1
+
+
+def test_outlet_stats(app):
+    app.test_client().get('/')
+    app.test_client().get('/')
+
+    stats = app.events.outlet_stats()
+    assert stats['CapturingOutlet']['calls'] == 2
+    assert stats['CapturingOutlet']['state'] == CLOSED
+
+
+def test_stats_kept_when_outlets_change(app):
+    app.test_client().get('/')
+    app.events.outlets.append(CapturingOutlet())
+    app.test_client().get('/')
+
+    stats = app.events.outlet_stats()
+    assert stats['CapturingOutlet']['calls'] == 2
+    assert stats['CapturingOutlet_1']['calls'] == 1
+
+
+def test_outlet_telemetry():
+    clock = FakeClock()
+    supervisor = OutletSupervisor(SlowOutlet(clock, 3 * 10**6), clock=clock)
+    telemetry = OutletTelemetry(interval=60, clock=clock)
+    supervisor.handle({})
+    supervisor.handle({})
+
+    assert not telemetry.is_due()
+    assert telemetry.collect([supervisor]) == []
+
+    clock.now += 60 * 10**9
+    assert telemetry.is_due()
+    record, = telemetry.collect([supervisor])
+    assert record['event_type'] == 'outlet_stats'
+    assert record['outlet'] == 'SlowOutlet'
+    assert record['flask_events_outlet_ms'] == 6.0
+    assert record['flask_events_outlet_ms_max'] == 3.0
+    assert record['calls'] == 2
+    assert record['circuit'] == CLOSED
+
+    # Counted per interval
+    record, = telemetry.collect([supervisor], force=True)
+    assert record['calls'] == 0
+    assert record['flask_events_outlet_ms_max'] == 0.0
+
+
+def test_outlet_telemetry_emitted():
+    app = create_app()
+    app.config['EVENTS_OUTLET_STATS'] = True
+    app.config['EVENTS_OUTLET_STATS_INTERVAL'] = 0
+    app.events = Events(app)
+    events = []
+    app.events.outlets = [EventListOutlet(events)]
+
+    app.test_client().get('/')
+
+    assert [event.get('event_type') for event in events] == ['outlet_stats', None]
+
+
+def test_outlet_telemetry_flushed_at_exit_once_after_multiple_init():
+    app = create_app()
+    app.config['EVENTS_OUTLET_STATS'] = True
+    app.events = Events(app)
+
+    with mock.patch('flask_events.telemetry.atexit') as atexit:
+        app.events.init_app(app)
+        app.events.init_app(app)
+
+    assert atexit.unregister.call_count == 2
+    assert atexit.register.call_count == 2
+    atexit.unregister.assert_called_with(app.events.flush_outlet_telemetry)
+    atexit.register.assert_called_with(app.events.flush_outlet_telemetry)
+
+
+class EventListOutlet:
+    def __init__(self, events):
+        self.events = events
+
+
+    def handle(self, event_data):
+        self.events.append(event_data)
@@ -0,0 +1,31 @@
+from unittest import mock
+
+import pytest
+
+from flask_events.timing import get_queue_time_ns, ns_to_seconds, parse_request_start
+
+
+@pytest.mark.parametrize('header_value,expected', [
+    ('t=1577836800', 1577836800000000000),
+    ('t=1577836800.25', 1577836800250000000),
+    ('1577836800250', 1577836800250000000),
+    ('t=1577836800250000', 1577836800250000000),
+    ('t=1577836800250000000', 1577836800250000000),
+    ('garbage', None),
+])
+def test_parse_request_start(header_value, expected):
+    assert parse_request_start(header_value) == expected
+
+
+def test_queue_time():
+    with mock.patch('flask_events.timing.time.time_ns', return_value=1577836800500000000):
+        assert get_queue_time_ns('t=1577836800.25') == 250000000
+
+
+def test_queue_time_clamped_for_clock_skew():
+    with mock.patch('flask_events.timing.time.time_ns', return_value=1577836800000000000):
+        assert get_queue_time_ns('t=1577836801') == 0
+
+
+def test_ns_to_seconds():
+    assert ns_to_seconds(1500000000) == 1.5